@@ -0,0 +1,137 @@
+"""
+RG Assistant - Ad & affiliate analytics
+
+Impression and click events are appended to an in-memory ring buffer (no
+I/O on the message path) and a background task flushes them in batches to
+an append-only log:
+
+    ANALYTICS_PATH=analytics.db      SQLite table ad_events
+    ANALYTICS_PATH=analytics.jsonl   one JSON object per line
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Events kept in memory between flushes (oldest are dropped when full)
+BUFFER_CAPACITY = 10000
+
+# Seconds between flushes
+FLUSH_INTERVAL = 10.0
+
+
+class EventBuffer:
+    """Bounded ring buffer of (timestamp, event, user_id, ad_id) tuples"""
+
+    def __init__(self, capacity: int = BUFFER_CAPACITY):
+        self._events = deque(maxlen=capacity)
+        self.dropped = 0
+
+    def record(self, event: str, user_id: int, ad_id: str):
+        if len(self._events) == self._events.maxlen:
+            self.dropped += 1
+        self._events.append((time.time(), event, user_id, ad_id))
+
+    def drain(self) -> list:
+        """Remove and return all buffered events"""
+        batch = []
+        while self._events:
+            batch.append(self._events.popleft())
+        return batch
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+
+class SQLiteSink:
+    """Appends events to an SQLite table"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with sqlite3.connect(path) as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS ad_events "
+                "(ts REAL NOT NULL, event TEXT NOT NULL, user_id INTEGER, ad_id TEXT NOT NULL)"
+            )
+
+    def write(self, batch: list):
+        with sqlite3.connect(self.path) as db:
+            db.executemany("INSERT INTO ad_events VALUES (?, ?, ?, ?)", batch)
+
+
+class JsonLinesSink:
+    """Appends events to a JSON lines file"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, batch: list):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for ts, event, user_id, ad_id in batch:
+                f.write(json.dumps({"ts": ts, "event": event, "user_id": user_id, "ad_id": ad_id}) + "\n")
+
+
+def open_sink(path: str):
+    """Pick a sink from the file extension, or None to disable analytics"""
+    if not path:
+        return None
+    if path.endswith((".db", ".sqlite", ".sqlite3")):
+        return SQLiteSink(path)
+    return JsonLinesSink(path)
+
+
+class AnalyticsPipeline:
+    """Event buffer plus the background task that flushes it.
+
+    The sink for `path` is opened by start(), so importing the bot (cold-start
+    checks, profiling workers) creates no files. An empty path disables it.
+    """
+
+    def __init__(self, path: str, interval: float = FLUSH_INTERVAL, capacity: int = BUFFER_CAPACITY):
+        self.path = path
+        self.sink = None
+        self.interval = interval
+        self.buffer = EventBuffer(capacity)
+        self._task = None
+
+    def record(self, event: str, user_id: int, ad_id: str):
+        """Record an event (O(1), never blocks)"""
+        if self.path:
+            self.buffer.record(event, user_id, ad_id)
+
+    async def flush(self):
+        """Write buffered events to the sink off the event loop"""
+        if self.sink is None:
+            return
+        batch = self.buffer.drain()
+        if not batch:
+            return
+        try:
+            await asyncio.to_thread(self.sink.write, batch)
+        except Exception as e:
+            logger.error("Analytics flush failed (%d events lost): %s", len(batch), e)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self):
+        if not self.path or self._task is not None:
+            return
+        if self.sink is None:
+            self.sink = open_sink(self.path)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write what is left"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
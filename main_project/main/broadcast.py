@@ -0,0 +1,303 @@
+"""
+RG Assistant - Broadcast engine
+
+Sends an admin announcement to every user through a concurrent,
+rate-limited pipeline. Progress is checkpointed to disk so a broadcast
+interrupted by a deploy resumes where it stopped, and users who blocked
+the bot are pruned from state. The recipient list is written once, next to
+the checkpoint, when the broadcast starts; checkpoints only hold the cursor
+and counters.
+
+Admin commands:
+    /broadcast <text>     start a broadcast
+    /broadcast_status     show progress
+    /broadcast_cancel     stop the running broadcast
+    /broadcast_resume     resume an interrupted broadcast
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows ~30 messages/second overall; leave headroom for replies
+BROADCAST_RATE = float(os.environ.get("BROADCAST_RATE", "25"))
+BROADCAST_CONCURRENCY = int(os.environ.get("BROADCAST_CONCURRENCY", "10"))
+
+# Save progress every N recipients
+CHECKPOINT_EVERY = 200
+
+# Give up on a recipient after this many flood-control retries
+MAX_RETRIES = 3
+
+
+class TokenBucket:
+    """Async token bucket limiting the overall send rate"""
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Drain the bucket so nobody sends for a while (flood control)"""
+        self.tokens = -seconds * self.rate
+        self.updated = time.monotonic()
+
+
+class Broadcast:
+    """State of one broadcast (all but the recipients are saved in the checkpoint file)"""
+
+    def __init__(self, text: str, recipients: list, admin_chat_id: int = None):
+        self.id = uuid.uuid4().hex[:8]
+        self.text = text
+        self.recipients = recipients
+        self.admin_chat_id = admin_chat_id
+        self.status_message_id = None
+        self.cursor = 0
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+        self.status = "running"
+        self.started_at = time.time()
+        self.elapsed = 0.0
+
+    @property
+    def total(self) -> int:
+        return len(self.recipients)
+
+    def to_dict(self) -> dict:
+        """Checkpoint fields (without the recipients)"""
+        data = dict(self.__dict__)
+        del data["recipients"]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict, recipients: list = None):
+        broadcast = cls.__new__(cls)
+        broadcast.__dict__.update(data)
+        if recipients is not None:
+            broadcast.recipients = recipients
+        return broadcast
+
+    def report(self, running_for: float = 0.0) -> str:
+        """Human-readable progress"""
+        elapsed = self.elapsed + running_for
+        rate = self.cursor / elapsed if elapsed else 0.0
+        eta = (self.total - self.cursor) / rate if rate else 0.0
+        percent = 100 * self.cursor / self.total if self.total else 100
+        return (
+            f"📣 Broadcast {self.id}: {self.status}\n\n"
+            f"Progress: {self.cursor}/{self.total} ({percent:.0f}%)\n"
+            f"✅ Delivered: {self.sent}\n"
+            f"🚫 Blocked (pruned): {self.blocked}\n"
+            f"⚠️ Failed: {self.failed}\n"
+            f"⚡ Throughput: {rate:.1f} msg/s\n"
+            f"⏱️ Elapsed: {elapsed:.0f}s" + (f", ETA {eta:.0f}s" if self.status == "running" else "")
+        )
+
+
+class BroadcastEngine:
+    """Runs one broadcast at a time in the background"""
+
+    def __init__(self, checkpoint_path: str, on_blocked=None,
+                 rate: float = BROADCAST_RATE, concurrency: int = BROADCAST_CONCURRENCY):
+        self.checkpoint_path = checkpoint_path
+        self.on_blocked = on_blocked
+        self.rate = rate
+        self.concurrency = concurrency
+        self.current = None
+        self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    # ------------------------------------------------------------------------
+    # Checkpoints
+    # ------------------------------------------------------------------------
+
+    @property
+    def recipients_path(self) -> str:
+        return f"{self.checkpoint_path}.recipients"
+
+    def _save(self, data: dict, path: str = None):
+        path = path or self.checkpoint_path
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def load(self):
+        """Load the last checkpoint, or None"""
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return None
+        try:
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                data = json.load(f)
+            if "recipients" in data:
+                # Checkpoint written before recipients had their own file
+                return Broadcast.from_dict(data)
+            with open(self.recipients_path, encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("id") != data.get("id"):
+                raise ValueError(f"recipients are for broadcast {saved.get('id')}, not {data.get('id')}")
+            return Broadcast.from_dict(data, saved["recipients"])
+        except (OSError, ValueError, KeyError) as e:
+            logger.error("Unreadable broadcast checkpoint: %s", e)
+            return None
+
+    # ------------------------------------------------------------------------
+    # Control
+    # ------------------------------------------------------------------------
+
+    def start(self, bot, text: str, recipients: list, admin_chat_id: int = None) -> Broadcast:
+        """Start a new broadcast in the background"""
+        if self.running:
+            raise RuntimeError("A broadcast is already running")
+        broadcast = Broadcast(text, sorted(recipients), admin_chat_id)
+        self._launch(bot, broadcast, new=True)
+        return broadcast
+
+    def resume(self, bot):
+        """Resume the checkpointed broadcast if it did not finish"""
+        if self.running:
+            return self.current
+        broadcast = self.load()
+        if broadcast is None or broadcast.status not in ("running", "interrupted"):
+            return None
+        broadcast.status = "running"
+        self._launch(bot, broadcast)
+        return broadcast
+
+    def cancel(self):
+        """Stop the running broadcast (it cannot be resumed)"""
+        if self.running:
+            self.current.status = "cancelled"
+            self._task.cancel()
+
+    async def stop(self):
+        """Interrupt on shutdown; the checkpoint allows resuming later"""
+        if self.running:
+            self.current.status = "interrupted"
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def _launch(self, bot, broadcast: Broadcast, new: bool = False):
+        self.current = broadcast
+        self._task = asyncio.create_task(self._run(bot, broadcast, new))
+
+    # ------------------------------------------------------------------------
+    # Sending
+    # ------------------------------------------------------------------------
+
+    async def _send(self, bot, bucket: TokenBucket, broadcast: Broadcast, user_id: int):
+        for _ in range(MAX_RETRIES):
+            await bucket.acquire()
+            try:
+                await bot.send_message(chat_id=user_id, text=broadcast.text)
+                broadcast.sent += 1
+                return
+            except RetryAfter as e:
+                delay = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+                logger.warning("Broadcast flood control, pausing %ss", delay)
+                bucket.pause(delay)
+            except (Forbidden, BadRequest) as e:
+                # Bot blocked, user deactivated or chat gone: stop messaging them
+                if isinstance(e, BadRequest) and "chat not found" not in str(e).lower():
+                    broadcast.failed += 1
+                    return
+                broadcast.blocked += 1
+                if self.on_blocked is not None:
+                    self.on_blocked(user_id)
+                return
+            except TelegramError as e:
+                logger.warning("Broadcast to %s failed: %s", user_id, e)
+                broadcast.failed += 1
+                return
+        broadcast.failed += 1
+
+    async def _update_status(self, bot, broadcast: Broadcast, running_for: float):
+        """Edit the admin's status message with current progress"""
+        if broadcast.admin_chat_id is None:
+            return
+        text = broadcast.report(running_for)
+        try:
+            if broadcast.status_message_id is None:
+                message = await bot.send_message(chat_id=broadcast.admin_chat_id, text=text)
+                broadcast.status_message_id = message.message_id
+            else:
+                await bot.edit_message_text(
+                    text, chat_id=broadcast.admin_chat_id, message_id=broadcast.status_message_id
+                )
+        except TelegramError as e:
+            logger.debug("Broadcast status update failed: %s", e)
+
+    async def _run(self, bot, broadcast: Broadcast, new: bool = False):
+        bucket = TokenBucket(self.rate)
+        started = time.monotonic()
+        since_checkpoint = 0
+        logger.info("Broadcast %s started at %d/%d", broadcast.id, broadcast.cursor, broadcast.total)
+
+        if new and self.checkpoint_path:
+            try:
+                await asyncio.to_thread(
+                    self._save, {"id": broadcast.id, "recipients": broadcast.recipients}, self.recipients_path
+                )
+            except OSError as e:
+                logger.error("Failed to save broadcast recipients: %s", e)
+
+        try:
+            await self._update_status(bot, broadcast, 0.0)
+            while broadcast.cursor < broadcast.total:
+                batch = broadcast.recipients[broadcast.cursor:broadcast.cursor + self.concurrency]
+                await asyncio.gather(*(self._send(bot, bucket, broadcast, uid) for uid in batch))
+
+                # Only completed batches advance the cursor (at-least-once on resume)
+                broadcast.cursor += len(batch)
+                since_checkpoint += len(batch)
+                if since_checkpoint >= CHECKPOINT_EVERY:
+                    since_checkpoint = 0
+                    await self._save_progress(broadcast, started)
+                    await self._update_status(bot, broadcast, time.monotonic() - started)
+
+            broadcast.status = "done"
+        finally:
+            await self._save_progress(broadcast, started)
+            broadcast.elapsed += time.monotonic() - started
+            logger.info(
+                "Broadcast %s %s: %d sent, %d blocked, %d failed",
+                broadcast.id, broadcast.status, broadcast.sent, broadcast.blocked, broadcast.failed,
+            )
+            if broadcast.status != "interrupted":
+                await self._update_status(bot, broadcast, 0.0)
+
+    async def _save_progress(self, broadcast: Broadcast, started: float):
+        """Write the checkpoint (off the event loop), including time spent so far"""
+        if not self.checkpoint_path:
+            return
+        data = broadcast.to_dict()
+        data["elapsed"] = broadcast.elapsed + time.monotonic() - started
+        try:
+            await asyncio.to_thread(self._save, data)
+        except OSError as e:
+            logger.error("Failed to save broadcast checkpoint: %s", e)
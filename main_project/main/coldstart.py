@@ -0,0 +1,133 @@
+"""
+RG Assistant - Cold start report
+
+Shows which imports dominate startup and measures time-to-first-update: the
+time from launching a fresh interpreter until the first text message has been
+answered (against local stand-ins for Telegram and Cohere).
+
+    python -m main.coldstart                 # report
+    python -m main.coldstart --budget 1.5    # exit 1 if over 1.5 seconds
+
+Use the --budget form in CI to catch startup regressions.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Default time-to-first-update budget (seconds)
+DEFAULT_BUDGET = 2.0
+
+SAMPLE_UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 1,
+        "date": 0,
+        "chat": {"id": 42, "type": "private"},
+        "from": {"id": 42, "is_bot": False, "first_name": "ColdStart"},
+        "text": "Hello!",
+    },
+}
+
+
+def import_time_report(module: str = "main.telegram_server", top: int = 15):
+    """Return the slowest imports as (cumulative_ms, self_ms, module) tuples"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative_us) / 1000, int(self_us) / 1000, name.rstrip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def measure_first_update() -> float:
+    """Launch a fresh interpreter and time it until the first reply is sent"""
+    from main.standins import CohereStandIn
+
+    cohere = CohereStandIn().start()
+    env = dict(
+        os.environ,
+        COHERE_API_URL=cohere.url,
+        STATE_SNAPSHOT_PATH="",
+        STATE_BACKEND_URL="",
+        ANALYTICS_PATH="",
+        PRELOAD_HEAVY_MODULES="false",
+        RG_COLDSTART_T0=repr(time.time()),
+    )
+    # The child imports main from this checkout, whatever the working directory
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [project_dir, env.get("PYTHONPATH")]))
+    try:
+        result = subprocess.run(
+            [sys.executable, "-m", "main.coldstart", "--child"],
+            capture_output=True,
+            text=True,
+            env=env,
+            timeout=60,
+        )
+    finally:
+        cohere.stop()
+
+    if result.returncode != 0:
+        raise RuntimeError(f"Cold start run failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])["first_update"]
+
+
+def _child():
+    """Runs inside the fresh interpreter started by measure_first_update"""
+    import asyncio
+
+    from telegram import Update
+
+    from main.standins import TelegramStandIn
+    from main.telegram_server import build_application
+
+    async def run():
+        request = TelegramStandIn()
+        application = build_application("123:COLDSTART", updater=False, request=request)
+        async with application:
+            await application.process_update(Update.de_json(SAMPLE_UPDATE, application.bot))
+        if not any(endpoint == "sendMessage" for endpoint, _ in request.calls):
+            raise RuntimeError("No reply was sent")
+
+    asyncio.run(run())
+    elapsed = time.time() - float(os.environ["RG_COLDSTART_T0"])
+    print(json.dumps({"first_update": elapsed}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start report")
+    parser.add_argument("--budget", type=float, help="fail if time-to-first-update exceeds this (seconds)")
+    parser.add_argument("--top", type=int, default=15, help="number of imports to list")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child()
+        return
+
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    for cumulative_ms, self_ms, name in import_time_report(top=args.top):
+        print(f"{cumulative_ms:>10.1f}ms {self_ms:>8.1f}ms  {name}")
+
+    first_update = measure_first_update()
+    budget = args.budget if args.budget is not None else DEFAULT_BUDGET
+    status = "OK" if first_update <= budget else "OVER BUDGET"
+    print(f"\nTime to first update: {first_update * 1000:.0f}ms (budget {budget * 1000:.0f}ms) {status}")
+
+    if args.budget is not None and first_update > budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+RG Assistant - Signed coupon codes
+
+A coupon is a short base32 token carrying its own terms, signed with
+HMAC-SHA256 under COUPON_SECRET:
+
+    version (1) | days (1) | last redeem day (2) | nonce (5) | MAC (6 bytes)
+
+Any instance holding the secret can verify a code in constant time without a
+database. Each nonce can be redeemed once: it is claimed by an atomic insert
+into an SQLite file (or SET NX in Redis when shared state is configured).
+
+To issue codes:
+    python -m main.coupons generate --days 14 --count 1000 > codes.txt
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import sqlite3
+import struct
+import threading
+import time
+
+from main.user_state import day_to_str, today_epoch_day
+
+VERSION = 1
+
+NONCE_SIZE = 5
+MAC_SIZE = 6
+_PAYLOAD = struct.Struct(">BBH5s")
+TOKEN_SIZE = _PAYLOAD.size + MAC_SIZE
+
+MAX_DAYS = 255
+
+# Codes are shown in groups of four characters (RGAB-CDEF-...)
+GROUP_SIZE = 4
+
+SQLITE_HEADER = b"SQLite format 3\x00"
+
+
+# ============================================================================
+# TOKENS
+# ============================================================================
+
+def _mac(secret: bytes, payload: bytes) -> bytes:
+    return hmac.new(secret, payload, hashlib.sha256).digest()[:MAC_SIZE]
+
+
+def _format(token: bytes) -> str:
+    text = base64.b32encode(token).decode().rstrip("=")
+    return "-".join(text[i:i + GROUP_SIZE] for i in range(0, len(text), GROUP_SIZE))
+
+
+def issue(secret: bytes, days: int, last_day: int, nonce: bytes = None) -> str:
+    """Create a signed code worth `days` of premium, redeemable until `last_day`"""
+    if not 1 <= days <= MAX_DAYS:
+        raise ValueError(f"days must be between 1 and {MAX_DAYS}")
+    payload = _PAYLOAD.pack(VERSION, days, last_day, nonce or secrets.token_bytes(NONCE_SIZE))
+    return _format(payload + _mac(secret, payload))
+
+
+class Coupon:
+    """Terms of a verified coupon"""
+
+    __slots__ = ("days", "last_day", "nonce")
+
+    def __init__(self, days: int, last_day: int, nonce: bytes):
+        self.days = days
+        self.last_day = last_day
+        self.nonce = nonce
+
+    def __repr__(self):
+        return f"Coupon(days={self.days}, last_day={day_to_str(self.last_day)}, nonce={self.nonce.hex()})"
+
+
+def verify(secret: bytes, code: str, today: int = None):
+    """Return the Coupon for a valid, unexpired code, else None"""
+    text = code.upper().replace("-", "").replace(" ", "")
+    try:
+        token = base64.b32decode(text + "=" * (-len(text) % 8))
+    except ValueError:
+        return None
+    if len(token) != TOKEN_SIZE:
+        return None
+
+    payload, mac = token[:_PAYLOAD.size], token[_PAYLOAD.size:]
+    if not hmac.compare_digest(mac, _mac(secret, payload)):
+        return None
+
+    version, days, last_day, nonce = _PAYLOAD.unpack(payload)
+    if version != VERSION or days == 0:
+        return None
+    if last_day < (today if today is not None else today_epoch_day()):
+        return None
+    return Coupon(days, last_day, nonce)
+
+
+# ============================================================================
+# REDEEMED NONCES
+# ============================================================================
+
+class RedeemedNonces:
+    """Redeemed nonces in an SQLite table keyed by nonce
+
+    The primary key makes a claim a single atomic insert, so processes and
+    instances sharing the file cannot both redeem the same code. An empty
+    path keeps the table in memory (this process only).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._db is None:
+            if self.path and os.path.exists(self.path):
+                self._import_legacy_file()
+            self._db = sqlite3.connect(self.path or ":memory:", check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA busy_timeout = 5000")
+            self._db.execute("CREATE TABLE IF NOT EXISTS redeemed (nonce BLOB PRIMARY KEY, claimed REAL NOT NULL)")
+        return self._db
+
+    def _import_legacy_file(self):
+        """Convert the append-only nonce file written by earlier versions"""
+        with open(self.path, "rb") as f:
+            head = f.read(len(SQLITE_HEADER))
+            if not head or head == SQLITE_HEADER:
+                return
+            data = head + f.read()
+
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        db = sqlite3.connect(tmp_path)
+        db.execute("CREATE TABLE IF NOT EXISTS redeemed (nonce BLOB PRIMARY KEY, claimed REAL NOT NULL)")
+        db.executemany(
+            "INSERT OR IGNORE INTO redeemed VALUES (?, 0)",
+            ((data[i:i + NONCE_SIZE],) for i in range(0, len(data) - NONCE_SIZE + 1, NONCE_SIZE)),
+        )
+        db.commit()
+        db.close()
+        os.replace(tmp_path, self.path)
+
+    def claim(self, nonce: bytes) -> bool:
+        """Mark a nonce as redeemed; False if it already was (blocking I/O)"""
+        with self._lock:
+            cursor = self._connect().execute(
+                "INSERT OR IGNORE INTO redeemed (nonce, claimed) VALUES (?, ?)", (nonce, time.time())
+            )
+            return cursor.rowcount == 1
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM redeemed").fetchone()[0]
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def _secret_from_env() -> bytes:
+    secret = os.environ.get("COUPON_SECRET", "")
+    if not secret:
+        raise SystemExit("COUPON_SECRET is not set")
+    return secret.encode()
+
+
+def main():
+    import argparse
+    from pathlib import Path
+
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).parent.parent / ".env")
+
+    parser = argparse.ArgumentParser(description="Issue and check signed coupon codes")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="print new codes, one per line")
+    generate.add_argument("--days", type=int, required=True, help="premium days per code")
+    generate.add_argument("--count", type=int, default=1)
+    generate.add_argument("--valid-for", type=int, default=365, help="days the codes can be redeemed")
+
+    check = commands.add_parser("verify", help="decode a code")
+    check.add_argument("code")
+
+    args = parser.parse_args()
+    secret = _secret_from_env()
+
+    if args.command == "generate":
+        last_day = today_epoch_day() + args.valid_for
+        nonces = set()
+        while len(nonces) < args.count:
+            nonces.add(secrets.token_bytes(NONCE_SIZE))
+        print("\n".join(issue(secret, args.days, last_day, nonce) for nonce in nonces))
+    else:
+        coupon = verify(secret, args.code)
+        if coupon is None:
+            raise SystemExit("Invalid or expired code")
+        print(coupon)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+RG Assistant - Conversation history ring buffer
+
+Each user's history is a fixed-capacity ring buffer: appending never copies
+or re-slices the list, roles are stored as one byte each, and long turns
+that have fallen out of the newest few are kept zlib-compressed.
+"""
+
+import zlib
+
+ROLES = ("user", "chatbot")
+ROLE_USER = 0
+ROLE_CHATBOT = 1
+
+# Newest turns kept as plain text (older ones may be compressed)
+HOT_TURNS = 4
+
+# Shorter messages are not worth compressing
+COMPRESS_MIN_CHARS = 256
+
+
+class ConversationHistory:
+    """Fixed-capacity history of (role, message) turns for one user"""
+
+    __slots__ = ("_roles", "_messages", "_start", "_size")
+
+    def __init__(self, capacity: int = 20):
+        self._roles = bytearray(capacity)
+        self._messages = [None] * capacity
+        self._start = 0
+        self._size = 0
+
+    @property
+    def capacity(self) -> int:
+        return len(self._messages)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, role: int, message: str):
+        """Add a turn, overwriting the oldest one when full"""
+        capacity = len(self._messages)
+        if self._size < capacity:
+            index = (self._start + self._size) % capacity
+            self._size += 1
+        else:
+            index = self._start
+            self._start = (self._start + 1) % capacity
+
+        self._roles[index] = role
+        self._messages[index] = message
+
+        # The turn that just left the hot window gets compressed
+        if self._size > HOT_TURNS:
+            cold = (self._start + self._size - HOT_TURNS - 1) % capacity
+            text = self._messages[cold]
+            if type(text) is str and len(text) >= COMPRESS_MIN_CHARS:
+                self._messages[cold] = zlib.compress(text.encode(), 1)
+
+    def clear(self):
+        """Forget all turns"""
+        for i in range(len(self._messages)):
+            self._messages[i] = None
+        self._start = 0
+        self._size = 0
+
+    def __iter__(self):
+        """Yield (role, message) from oldest to newest"""
+        capacity = len(self._messages)
+        for offset in range(self._size):
+            index = (self._start + offset) % capacity
+            text = self._messages[index]
+            if type(text) is bytes:
+                text = zlib.decompress(text).decode()
+            yield ROLES[self._roles[index]], text
+
+    def to_chat_history(self) -> list:
+        """Build the Cohere chat_history payload in a single pass"""
+        return [{"role": role, "message": text} for role, text in self]
+
+    @classmethod
+    def from_list(cls, turns: list, capacity: int = 20):
+        """Rebuild from a list of {"role", "message"} dicts"""
+        history = cls(capacity)
+        for turn in turns[-capacity:]:
+            role = ROLE_CHATBOT if turn.get("role") == ROLES[ROLE_CHATBOT] else ROLE_USER
+            history.append(role, turn.get("message", ""))
+        return history
@@ -0,0 +1,311 @@
+"""
+RG Assistant - Background jobs
+
+Heavy media work (voice transcription, document analysis) is written to an
+SQLite queue and run by a few background tasks, so the update handler returns
+right away. A running job holds a lease that its worker keeps renewing; if
+the process dies mid-job (crash, deploy) the lease runs out and the job is
+picked up again after the restart.
+
+Failed jobs are retried with exponential backoff. After max_attempts, or on
+PermanentError, the job's on_failed hook runs (e.g. to tell the user).
+
+A job whose side effects must not repeat (replying, appending to history)
+calls JobQueue.complete(job) once its result is ready and before them: from
+then on it is done and is never retried.
+"""
+
+import asyncio
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Jobs run at the same time per process
+CONCURRENCY = 2
+
+MAX_ATTEMPTS = 3
+# Retry after BACKOFF_BASE * 2^(attempt-1) seconds (with jitter), capped
+BACKOFF_BASE = 5.0
+BACKOFF_MAX = 300.0
+
+# A running job is considered abandoned when its lease is not renewed
+LEASE = 120.0
+
+# Seconds between checks for due jobs (new jobs wake the loop immediately)
+POLL_INTERVAL = 1.0
+
+# Finished jobs are kept this long for inspection
+KEEP_FINISHED = 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_after REAL NOT NULL,
+    lease_until REAL NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, run_after);
+"""
+
+
+class PermanentError(Exception):
+    """Raise from a job to fail it without further retries"""
+
+
+class Job:
+    """A claimed job; attempts counts this run"""
+
+    __slots__ = ("id", "kind", "payload", "attempts", "completed")
+
+    def __init__(self, job_id: int, kind: str, payload: dict, attempts: int):
+        self.id = job_id
+        self.kind = kind
+        self.payload = payload
+        self.attempts = attempts
+        self.completed = False
+
+    def __repr__(self):
+        return f"Job({self.id}, {self.kind!r}, attempt {self.attempts})"
+
+
+class JobQueue:
+    """Durable queue plus the background tasks that run its jobs"""
+
+    def __init__(self, path: str, concurrency: int = CONCURRENCY, max_attempts: int = MAX_ATTEMPTS,
+                 backoff_base: float = BACKOFF_BASE):
+        # An empty path keeps the queue in memory (not durable)
+        self.path = path
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self._kinds = {}    # kind -> (run, on_failed)
+        self._running = {}  # job id -> task
+        self._db = None
+        self._lock = threading.Lock()
+        self._task = None
+        self._wakeup = None
+        self._bot = None
+        self._last_renewal = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def register(self, kind: str, run, on_failed=None):
+        """Register `async run(bot, job)` and `async on_failed(bot, job, error)` for a kind"""
+        self._kinds[kind] = (run, on_failed)
+
+    # ------------------------------------------------------------------------
+    # Storage (called from worker threads)
+    # ------------------------------------------------------------------------
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path or ":memory:", check_same_thread=False, isolation_level=None)
+            if self.path:
+                self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(SCHEMA)
+        return self._db
+
+    def _insert(self, kind: str, payload: dict) -> int:
+        now = time.time()
+        with self._lock:
+            cursor = self._connect().execute(
+                "INSERT INTO jobs (kind, payload, run_after, created, updated) VALUES (?, ?, ?, ?, ?)",
+                (kind, json.dumps(payload), now, now, now),
+            )
+            return cursor.lastrowid
+
+    def _claim(self, limit: int, exclude: list):
+        """Take up to `limit` due jobs, including abandoned running ones.
+
+        Abandoned jobs that already used up their attempts (e.g. they crash
+        the process every time) are marked failed instead. Returns
+        (claimed jobs, newly failed jobs).
+        """
+        now = time.time()
+        placeholders = ",".join("?" * len(exclude))
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                exhausted = db.execute(
+                    "SELECT id, kind, payload, attempts FROM jobs "
+                    "WHERE status = 'running' AND lease_until < ? AND attempts >= ? "
+                    f"AND id NOT IN ({placeholders})",
+                    (now, self.max_attempts, *exclude),
+                ).fetchall()
+                db.executemany(
+                    "UPDATE jobs SET status = 'failed', error = 'lease expired', lease_until = 0, updated = ? "
+                    "WHERE id = ?",
+                    [(now, row[0]) for row in exhausted],
+                )
+                rows = db.execute(
+                    "SELECT id, kind, payload, attempts FROM jobs "
+                    "WHERE ((status = 'queued' AND run_after <= ?) "
+                    "OR (status = 'running' AND lease_until < ? AND attempts < ?)) "
+                    f"AND id NOT IN ({placeholders}) ORDER BY run_after LIMIT ?",
+                    (now, now, self.max_attempts, *exclude, limit),
+                ).fetchall()
+                db.executemany(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, updated = ? "
+                    "WHERE id = ?",
+                    [(now + LEASE, now, row[0]) for row in rows],
+                )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        claimed = [Job(job_id, kind, json.loads(payload), attempts + 1) for job_id, kind, payload, attempts in rows]
+        failed = [Job(job_id, kind, json.loads(payload), attempts) for job_id, kind, payload, attempts in exhausted]
+        return claimed, failed
+
+    def _renew(self, job_ids: list):
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            db.executemany("UPDATE jobs SET lease_until = ? WHERE id = ?", [(now + LEASE, i) for i in job_ids])
+            db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated < ?", (now - KEEP_FINISHED,))
+
+    def _set_status(self, job_id: int, status: str, error: str = None, run_after: float = None,
+                    refund_attempt: bool = False):
+        now = time.time()
+        with self._lock:
+            self._connect().execute(
+                "UPDATE jobs SET status = ?, error = ?, run_after = ?, lease_until = 0, updated = ?, "
+                "attempts = attempts - ? WHERE id = ?",
+                (status, error, run_after if run_after is not None else now, now, int(refund_attempt), job_id),
+            )
+
+    def counts(self) -> dict:
+        """Number of jobs per status"""
+        with self._lock:
+            return dict(self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    # ------------------------------------------------------------------------
+    # Control
+    # ------------------------------------------------------------------------
+
+    async def complete(self, job: Job):
+        """Mark a running job done before its side effects.
+
+        If anything fails after this the job is not retried, so its replies
+        and history entries are never repeated.
+        """
+        await asyncio.to_thread(self._set_status, job.id, "done")
+        job.completed = True
+
+    async def enqueue(self, kind: str, payload: dict) -> int:
+        """Persist a job and wake the runner; returns the job ID"""
+        job_id = await asyncio.to_thread(self._insert, kind, payload)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    def start(self, bot):
+        """Start running jobs (including ones left over from the last run)"""
+        if self._task is None:
+            self._bot = bot
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        """Stop taking jobs, let running ones finish for up to `timeout` seconds.
+
+        Jobs still running after that are put back in the queue.
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+        tasks = list(self._running.values())
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    # ------------------------------------------------------------------------
+    # Running
+    # ------------------------------------------------------------------------
+
+    async def _run(self):
+        while True:
+            try:
+                free = self.concurrency - len(self._running)
+                if free > 0:
+                    claimed, failed = await asyncio.to_thread(self._claim, free, list(self._running))
+                    for job in claimed:
+                        self._running[job.id] = asyncio.create_task(self._execute(job))
+                    for job in failed:
+                        logger.error("%s abandoned on its last attempt, giving up", job)
+                        await self._on_failed(job, PermanentError("lease expired"))
+
+                if self._running and time.monotonic() - self._last_renewal > LEASE / 3:
+                    self._last_renewal = time.monotonic()
+                    await asyncio.to_thread(self._renew, list(self._running))
+            except sqlite3.Error as e:
+                logger.error("Job queue error: %s", e)
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(BACKOFF_MAX, self.backoff_base * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def _on_failed(self, job: Job, error: Exception):
+        _, on_failed = self._kinds.get(job.kind, (None, None))
+        if on_failed is not None:
+            try:
+                await on_failed(self._bot, job, error)
+            except Exception as hook_error:
+                logger.error("on_failed hook for %s failed: %r", job, hook_error)
+
+    async def _execute(self, job: Job):
+        run, _ = self._kinds.get(job.kind, (None, None))
+        try:
+            if run is None:
+                raise PermanentError(f"No handler for job kind {job.kind!r}")
+            await run(self._bot, job)
+        except asyncio.CancelledError:
+            # Shutdown: put it back without counting the attempt (unless its
+            # side effects have started)
+            if not job.completed:
+                await asyncio.to_thread(self._set_status, job.id, "queued", None, None, True)
+            raise
+        except Exception as e:
+            if job.completed:
+                # Already marked done: retrying would repeat its side effects
+                logger.error("%s failed after completing: %r", job, e)
+            elif isinstance(e, PermanentError) or job.attempts >= self.max_attempts:
+                logger.error("%s failed: %r", job, e)
+                await asyncio.to_thread(self._set_status, job.id, "failed", repr(e))
+                await self._on_failed(job, e)
+            else:
+                delay = self._backoff(job.attempts)
+                logger.warning("%s failed (%r), retrying in %.0fs", job, e, delay)
+                await asyncio.to_thread(self._set_status, job.id, "queued", repr(e), time.time() + delay)
+        else:
+            if not job.completed:
+                await asyncio.to_thread(self._set_status, job.id, "done")
+        finally:
+            self._running.pop(job.id, None)
+            if self._wakeup is not None:
+                self._wakeup.set()
@@ -0,0 +1,153 @@
+"""
+RG Assistant - Non-blocking structured logging
+
+Log calls on the event loop only put the record on a bounded queue; a
+background thread formats and writes it. Output is one JSON object per line
+with the ID of the update being handled, so all lines for one message can be
+correlated. High-volume INFO lines can be sampled.
+
+Environment:
+    LOG_LEVEL        INFO by default
+    LOG_FORMAT       json (default) or text
+    LOG_SAMPLE_RATE  fraction of sampled INFO lines kept (default 0.1)
+    LOG_QUEUE_SIZE   records buffered before new ones are dropped
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+
+# Pass as extra= on high-volume INFO lines to make them subject to sampling
+SAMPLED = {"sampled": True}
+
+# Correlation IDs of the update being handled in the current task
+current_update_id = contextvars.ContextVar("current_update_id", default=None)
+current_user_id = contextvars.ContextVar("current_user_id", default=None)
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener = None
+_queue_handler = None
+
+
+def set_update_context(update_id, user_id=None):
+    """Tag all log records from the current task with an update's IDs"""
+    current_update_id.set(update_id)
+    current_user_id.set(user_id)
+
+
+class ContextFilter(logging.Filter):
+    """Attach correlation IDs while still on the caller's task"""
+
+    def filter(self, record):
+        record.update_id = current_update_id.get()
+        record.user_id = current_user_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of INFO records marked with SAMPLED"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno == logging.INFO and getattr(record, "sampled", False):
+            return random.random() < self.rate
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+            + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "update_id", None) is not None:
+            entry["update_id"] = record.update_id
+        if getattr(record, "user_id", None) is not None:
+            entry["user_id"] = record.user_id
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and key not in entry and key not in ("sampled", "update_id", "user_id"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that never blocks and defers formatting to the listener"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The listener runs in the same process, so the record can be passed
+        # as is; message formatting happens on the listener thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(level=None, fmt=None, sample_rate=None, queue_size=None):
+    """Route all logging through a bounded queue and a writer thread"""
+    global _listener, _queue_handler
+
+    level = level or os.environ.get("LOG_LEVEL", "INFO")
+    fmt = fmt or os.environ.get("LOG_FORMAT", "json")
+    sample_rate = float(sample_rate if sample_rate is not None else os.environ.get("LOG_SAMPLE_RATE", "0.1"))
+    queue_size = int(queue_size or os.environ.get("LOG_QUEUE_SIZE", "10000"))
+
+    if _listener is not None:
+        return _queue_handler
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    _queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+    _queue_handler.addFilter(SamplingFilter(sample_rate))
+    _queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+
+    # httpx logs every Bot API request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _queue_handler
+
+
+def log_queue():
+    """The queue of records waiting for the writer thread (None if not configured)"""
+    return _queue_handler.queue if _queue_handler is not None else None
+
+
+def dropped_records() -> int:
+    """Records dropped because the queue was full"""
+    return _queue_handler.dropped if _queue_handler is not None else 0
@@ -0,0 +1,299 @@
+"""
+RG Assistant - Media cache
+
+Viral voice notes and shared files reach the bot many times. Telegram gives
+every file a file_unique_id that is the same for all users, so it is used as
+the cache key for two tiers:
+
+    bytes      downloaded files, size-capped, least recently used evicted
+    artifacts  small results derived from a file (transcripts, extracted text),
+               capped by count and expired after ARTIFACT_TTL
+
+Artifacts are checked first: a cached transcript skips the download, the
+transcoding and the speech-to-text call altogether.
+
+    MEDIA_CACHE_DIR=/data/media   blobs/ + artifacts.db on disk
+    MEDIA_CACHE_DIR=              both tiers in memory
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Default size cap of the bytes tier
+MAX_BYTES = 256 * 1024 * 1024
+
+# Artifacts kept by the in-memory tier
+MAX_ARTIFACTS = 10000
+
+# Artifacts kept on disk, and for how long (seconds); the oldest go first
+MAX_DISK_ARTIFACTS = 100000
+ARTIFACT_TTL = 30 * 24 * 3600
+
+# Expired and surplus artifacts are pruned once per this many puts
+PRUNE_EVERY = 100
+
+# Workers share the blob directory, so its real usage (their files included)
+# is re-read at most this often (seconds)
+SWEEP_INTERVAL = 60
+
+
+# ============================================================================
+# BYTES TIER
+# ============================================================================
+
+class MemoryBlobStore:
+    """LRU of file bytes capped by total size"""
+
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._blobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            data = self._blobs.get(key)
+            if data is not None:
+                self._blobs.move_to_end(key)
+            return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._blobs.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._blobs[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._blobs.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class DiskBlobStore:
+    """One file per key in a directory, capped by total size (LRU by mtime)
+
+    The cap applies to the directory, not to this process: usage is swept
+    from the directory every sweep_interval seconds, so files written by
+    other workers count too (between sweeps they can overshoot the cap by
+    what the others wrote meanwhile).
+    """
+
+    def __init__(self, directory: str, max_bytes: int = MAX_BYTES, sweep_interval: float = SWEEP_INTERVAL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.size = 0
+        self._sizes = OrderedDict()  # key -> size, least recently used first
+        self._swept = 0.0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._sweep()
+
+    def _sweep(self):
+        """Re-read the sizes and LRU order of all files in the directory (lock held)"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                if entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name, stat.st_size))
+            except FileNotFoundError:
+                # Evicted by another worker during the scan
+                continue
+        entries.sort()
+        self._sizes = OrderedDict((name, size) for _, name, size in entries)
+        self.size = sum(self._sizes.values())
+        self._swept = time.monotonic()
+
+    def _path(self, key: str) -> str:
+        # file_unique_id is URL-safe base64, so it is a safe file name
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            # Evicted by another worker sharing the directory
+            with self._lock:
+                size = self._sizes.pop(key, None)
+                if size is not None:
+                    self.size -= size
+            return None
+        os.utime(path)
+        with self._lock:
+            if key in self._sizes:
+                self._sizes.move_to_end(key)
+        return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self.size += len(data) - self._sizes.pop(key, 0)
+            self._sizes[key] = len(data)
+            if time.monotonic() - self._swept >= self.sweep_interval:
+                self._sweep()
+            while self.size > self.max_bytes:
+                evicted, size = self._sizes.popitem(last=False)
+                self.size -= size
+                try:
+                    os.remove(self._path(evicted))
+                except FileNotFoundError:
+                    pass
+
+
+# ============================================================================
+# ARTIFACTS TIER
+# ============================================================================
+
+class MemoryArtifactStore:
+    """LRU of (file_unique_id, kind) -> text"""
+
+    def __init__(self, max_entries: int = MAX_ARTIFACTS):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, kind: str):
+        with self._lock:
+            value = self._items.get((key, kind))
+            if value is not None:
+                self._items.move_to_end((key, kind))
+            return value
+
+    def put(self, key: str, kind: str, value: str):
+        with self._lock:
+            self._items[(key, kind)] = value
+            self._items.move_to_end((key, kind))
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+
+class SQLiteArtifactStore:
+    """Artifacts in an SQLite table (shared by workers on the same host),
+    capped at max_entries rows and expired after ttl seconds"""
+
+    def __init__(self, path: str, max_entries: int = MAX_DISK_ARTIFACTS, ttl: float = ARTIFACT_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._puts = 0
+        with sqlite3.connect(path) as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS artifacts "
+                "(file_unique_id TEXT NOT NULL, kind TEXT NOT NULL, value TEXT NOT NULL, "
+                "created REAL NOT NULL, PRIMARY KEY (file_unique_id, kind))"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS artifacts_created ON artifacts (created)")
+        self.prune()
+
+    def get(self, key: str, kind: str):
+        with sqlite3.connect(self.path) as db:
+            row = db.execute(
+                "SELECT value FROM artifacts WHERE file_unique_id = ? AND kind = ? AND created > ?",
+                (key, kind, time.time() - self.ttl),
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, kind: str, value: str):
+        with sqlite3.connect(self.path) as db:
+            db.execute(
+                "INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?)", (key, kind, value, time.time())
+            )
+        self._puts += 1
+        if self._puts % PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        """Delete expired artifacts and the oldest ones beyond max_entries"""
+        with sqlite3.connect(self.path) as db:
+            db.execute("DELETE FROM artifacts WHERE created <= ?", (time.time() - self.ttl,))
+            db.execute(
+                "DELETE FROM artifacts WHERE created <= (SELECT created FROM artifacts "
+                "ORDER BY created DESC LIMIT 1 OFFSET ?)", (self.max_entries,)
+            )
+
+
+# ============================================================================
+# CACHE
+# ============================================================================
+
+class MediaCache:
+    """Bytes and artifact tiers keyed on file_unique_id"""
+
+    def __init__(self, blobs, artifacts):
+        self.blobs = blobs
+        self.artifacts = artifacts
+        self.hits = 0
+        self.misses = 0
+        self._downloads = {}  # file_unique_id -> Future of in-flight download
+
+    async def get_artifact(self, file_unique_id: str, kind: str):
+        return await asyncio.to_thread(self.artifacts.get, file_unique_id, kind)
+
+    async def put_artifact(self, file_unique_id: str, kind: str, value: str):
+        await asyncio.to_thread(self.artifacts.put, file_unique_id, kind, value)
+
+    async def fetch(self, bot, file_id: str, file_unique_id: str) -> bytes:
+        """Return a file's bytes, downloading it only if it is not cached
+
+        Concurrent requests for the same file share a single download.
+        """
+        data = await asyncio.to_thread(self.blobs.get, file_unique_id)
+        if data is not None:
+            self.hits += 1
+            return data
+
+        pending = self._downloads.get(file_unique_id)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        pending = asyncio.get_running_loop().create_future()
+        self._downloads[file_unique_id] = pending
+        try:
+            file = await bot.get_file(file_id)
+            data = bytes(await file.download_as_bytearray())
+            await asyncio.to_thread(self.blobs.put, file_unique_id, data)
+            pending.set_result(data)
+            return data
+        except asyncio.CancelledError:
+            pending.cancel()
+            raise
+        except Exception as e:
+            pending.set_exception(e)
+            # Waiters (if any) get the exception; don't warn when there are none
+            pending.exception()
+            raise
+        finally:
+            del self._downloads[file_unique_id]
+
+
+def open_media_cache(directory: str, max_bytes: int = MAX_BYTES) -> MediaCache:
+    """Disk-backed cache in a directory, or in-memory when it is empty"""
+    if not directory:
+        return MediaCache(MemoryBlobStore(max_bytes), MemoryArtifactStore())
+    os.makedirs(directory, exist_ok=True)
+    return MediaCache(
+        DiskBlobStore(os.path.join(directory, "blobs"), max_bytes),
+        SQLiteArtifactStore(os.path.join(directory, "artifacts.db")),
+    )
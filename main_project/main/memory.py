@@ -0,0 +1,314 @@
+"""
+RG Assistant - Memory introspection
+
+Answers "what is using the memory?" on a running process:
+
+- deep sizes of the registered global structures (user state, histories,
+  caches, buffers); containers with many items are sampled and extrapolated
+- the top allocation sites from tracemalloc, and the growth per site since
+  the previous report (tracing is started on the first report, or at boot
+  with MEMORY_TRACE=true, because it slows allocations down)
+- process RSS
+
+Reports are produced on demand (admin /memory command). The latest numbers
+are also served as Prometheus gauges when METRICS_PORT is set.
+"""
+
+import gc
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import types
+from collections import deque
+
+# Frames kept per traced allocation
+TRACE_FRAMES = 10
+
+# Rows per section of the report
+TOP_SITES = 15
+
+# Containers larger than this are measured on a sample of their items
+SAMPLE_LIMIT = 2000
+
+# Objects reachable from a structure that are not part of its footprint
+_SKIP_TYPES = (
+    type,
+    types.ModuleType,
+    types.FunctionType,
+    types.BuiltinFunctionType,
+    types.MethodType,
+    types.CodeType,
+    types.FrameType,
+)
+_LEAF_TYPES = (str, bytes, bytearray, int, float, bool, complex, type(None))
+
+# Allocation sites left out of reports (the profiler's own work included)
+_IGNORED_FILES = (
+    __file__,
+    tracemalloc.__file__,
+    "<frozen importlib._bootstrap>",
+    "<frozen importlib._bootstrap_external>",
+    "<unknown>",
+)
+
+
+# ============================================================================
+# SIZES
+# ============================================================================
+
+def rss_bytes() -> int:
+    """Resident set size of this process (0 if unknown)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+        # Peak, not current, outside Linux (kilobytes on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return 0
+
+
+_slot_names = {}
+
+
+def _slots(cls) -> tuple:
+    names = _slot_names.get(cls)
+    if names is None:
+        names = []
+        for klass in cls.__mro__:
+            slots = klass.__dict__.get("__slots__", ())
+            if isinstance(slots, str):
+                slots = (slots,)
+            names.extend(name for name in slots if name not in ("__dict__", "__weakref__"))
+        names = _slot_names[cls] = tuple(names)
+    return names
+
+
+def _walk(roots: list, seen: set) -> int:
+    """Total getsizeof of everything reachable from roots (each object once)"""
+    total = 0
+    stack = list(roots)
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, _SKIP_TYPES):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, _LEAF_TYPES):
+            continue
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+            stack.extend(obj)
+        else:
+            attrs = getattr(obj, "__dict__", None)
+            if attrs is not None:
+                stack.append(attrs)
+            for name in _slots(type(obj)):
+                value = getattr(obj, name, None)
+                if value is not None:
+                    stack.append(value)
+    return total
+
+
+def deep_size(obj, sample: int = SAMPLE_LIMIT):
+    """Approximate deep size in bytes; returns (bytes, items, estimated)"""
+    if isinstance(obj, dict):
+        items = list(obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        items = list(obj)
+    else:
+        return _walk([obj], set()), None, False
+
+    if len(items) <= sample:
+        return _walk([obj], set()), len(items), False
+
+    # Measure evenly spaced items and scale up
+    step = len(items) / sample
+    picked = [items[int(i * step)] for i in range(sample)]
+    seen = {id(obj)}
+    sampled = _walk(picked, seen)
+    return sys.getsizeof(obj) + int(sampled * len(items) / sample), len(items), True
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+# ============================================================================
+# PROFILER
+# ============================================================================
+
+class MemoryProfiler:
+    """Registered structures plus tracemalloc snapshots kept between reports"""
+
+    def __init__(self):
+        self.structures = {}  # name -> callable returning the object
+        self.gauges = {}      # latest numbers, for the metrics endpoint
+        self._previous = None
+        self._previous_time = None
+        self._lock = threading.Lock()
+
+    def register(self, name: str, getter):
+        """Track a structure; getter returns it (or None when not in use)"""
+        self.structures[name] = getter
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start_tracing(self, frames: int = TRACE_FRAMES):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def stop_tracing(self):
+        tracemalloc.stop()
+        self._previous = None
+
+    def structure_sizes(self) -> list:
+        """[(name, bytes, items, estimated)] largest first"""
+        sizes = []
+        for name, getter in self.structures.items():
+            obj = getter()
+            if obj is None:
+                continue
+            for _ in range(3):
+                try:
+                    size, items, estimated = deep_size(obj)
+                    break
+                except RuntimeError:
+                    # Mutated by the event loop while being measured; retry
+                    continue
+            else:
+                continue
+            sizes.append((name, size, items, estimated))
+        sizes.sort(key=lambda row: row[1], reverse=True)
+        return sizes
+
+    def report(self):
+        """Build a report (blocking; run it in a thread).
+
+        Returns (summary, full_text): a short summary for chat and the full
+        report for download.
+        """
+        with self._lock:
+            now = time.time()
+            rss = rss_bytes()
+            structures = self.structure_sizes()
+
+            sites, growth, traced, peak = [], [], None, None
+            if tracemalloc.is_tracing():
+                snapshot = tracemalloc.take_snapshot().filter_traces(
+                    [tracemalloc.Filter(False, name) for name in _IGNORED_FILES]
+                )
+                traced, peak = tracemalloc.get_traced_memory()
+                sites = snapshot.statistics("lineno")[:TOP_SITES]
+                if self._previous is not None:
+                    growth = [
+                        stat for stat in snapshot.compare_to(self._previous, "lineno")
+                        if stat.size_diff > 0
+                    ][:TOP_SITES]
+                previous_time = self._previous_time
+                self._previous, self._previous_time = snapshot, now
+
+            self.gauges = {
+                "rss_bytes": rss,
+                "traced_bytes": traced or 0,
+                "gc_objects": len(gc.get_objects()),
+                "structures": {name: size for name, size, _, _ in structures},
+                "updated": now,
+            }
+
+        lines = [
+            f"Memory report {time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(now))} UTC (pid {os.getpid()})",
+            f"RSS: {format_bytes(rss)}",
+            f"GC-tracked objects: {self.gauges['gc_objects']}",
+        ]
+        if traced is not None:
+            lines.append(f"Traced by tracemalloc: {format_bytes(traced)} (peak {format_bytes(peak)})")
+        else:
+            lines.append("tracemalloc: not tracing")
+
+        lines += ["", "Structures (deep size, ~ = sampled estimate):"]
+        for name, size, items, estimated in structures:
+            count = f"{items} items" if items is not None else ""
+            lines.append(f"  {name:<24} {'~' if estimated else ' '}{format_bytes(size):>10}  {count}")
+
+        if sites:
+            lines += ["", "Top allocation sites:"]
+            for stat in sites:
+                frame = stat.traceback[0]
+                lines.append(f"  {format_bytes(stat.size):>10}  {stat.count:>8} blocks  {frame.filename}:{frame.lineno}")
+
+        if growth:
+            ago = f"{(now - previous_time) / 60:.0f} min ago" if previous_time else ""
+            lines += ["", f"Growth since previous report ({ago}):"]
+            for stat in growth:
+                frame = stat.traceback[0]
+                lines.append(
+                    f"  {'+' + format_bytes(stat.size_diff):>10}  {stat.count_diff:>+8} blocks  {frame.filename}:{frame.lineno}"
+                )
+        full_text = "\n".join(lines)
+
+        summary = lines[:4] + [""] + [
+            f"{name}: {'~' if estimated else ''}{format_bytes(size)}" for name, size, _, estimated in structures[:6]
+        ]
+        if growth:
+            summary += ["", "Largest growth:"] + [
+                f"+{format_bytes(stat.size_diff)} {os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}"
+                for stat in growth[:3]
+            ]
+        return "\n".join(summary), full_text
+
+    def prometheus(self) -> str:
+        """Gauges in the Prometheus text format"""
+        gauges = self.gauges
+        lines = [
+            "# TYPE rg_memory_rss_bytes gauge",
+            f"rg_memory_rss_bytes {rss_bytes()}",
+        ]
+        if gauges:
+            lines += [
+                "# TYPE rg_memory_traced_bytes gauge",
+                f"rg_memory_traced_bytes {gauges['traced_bytes']}",
+                "# TYPE rg_memory_structure_bytes gauge",
+            ]
+            lines += [
+                f'rg_memory_structure_bytes{{structure="{name}"}} {size}'
+                for name, size in gauges["structures"].items()
+            ]
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(profiler: MemoryProfiler, port: int, host: str = "0.0.0.0"):
+    """Serve GET /metrics from a background thread; returns the server"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = profiler.prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
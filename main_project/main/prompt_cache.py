@@ -0,0 +1,192 @@
+"""
+RG Assistant - Near-duplicate prompt cache
+
+Many users ask the same FAQ-style questions with small wording changes.
+This cache fingerprints each prompt with MinHash over the words and word
+pairs of its content and indexes the fingerprints with locality-sensitive
+hashing (LSH), so a rewording of a question answered before is found
+without comparing it to every stored prompt. Everything is computed locally; no embedding API.
+
+Whole words are compared, not characters: "install" and "uninstall" or
+"safe" and "unsafe" share most of their letters but ask opposite things.
+"""
+
+import random
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+# MinHash signature = BANDS x ROWS values
+BANDS = 16
+ROWS = 4
+NUM_HASHES = BANDS * ROWS
+
+# Shingles are single words and runs of this many words
+SHINGLE_WORDS = 2
+
+# Prompts longer than this are not cached (pasted files, long essays)
+MAX_PROMPT_CHARS = 1000
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Fixed seed: signatures must be comparable across restarts and processes
+_rng = random.Random(0x5247)
+_HASH_PARAMS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_HASHES)
+]
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_NUMBERS = re.compile(r"\d+(?:[.,]\d+)*")
+
+# Filler words dropped before hashing so the content words decide similarity
+STOPWORDS = frozenset("""
+a an the is are was were be been am do does did can could would should will
+i me my you your we our it its this that these those of in on at to for from
+with about and or what whats what's how who which please tell give show s
+""".split())
+
+# Words that change the meaning of the rest: two prompts only match if they
+# contain the same ones ("is it safe" / "is it not safe")
+QUALIFIERS = frozenset("""
+not no never none nothing without except only don doesn didn isn aren wasn
+cannot won shouldn wouldn couldn t more less most least best worst
+""".split())
+
+
+def normalize(text: str) -> str:
+    """Lowercase, drop punctuation and filler words"""
+    words = _NON_WORD.sub(" ", text.lower()).split()
+    content = [w for w in words if w not in STOPWORDS]
+    return " ".join(content or words)
+
+
+def shingles(text: str) -> set:
+    """Words and SHINGLE_WORDS-word runs of the normalized text, hashed to 32 bits"""
+    words = text.split()
+    features = set(words)
+    for i in range(len(words) - SHINGLE_WORDS + 1):
+        features.add(" ".join(words[i:i + SHINGLE_WORDS]))
+    return {zlib.crc32(feature.encode()) for feature in features}
+
+
+def minhash(features: set) -> tuple:
+    """MinHash signature of a set of hashed shingles"""
+    return tuple(
+        min(((a * x + b) % _MERSENNE_PRIME) & _MAX_HASH for x in features)
+        for a, b in _HASH_PARAMS
+    )
+
+
+def similarity(sig_a: tuple, sig_b: tuple) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_HASHES
+
+
+class _Entry:
+    __slots__ = ("signature", "numbers", "answer", "created")
+
+    def __init__(self, signature, numbers, answer):
+        self.signature = signature
+        self.numbers = numbers
+        self.answer = answer
+        self.created = time.monotonic()
+
+
+class SemanticCache:
+    """Bounded LRU of prompt -> answer with MinHash-LSH lookups"""
+
+    def __init__(self, threshold: float = 0.9, max_entries: int = 5000, ttl: float = 24 * 3600):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # id -> _Entry (LRU order)
+        self._buckets = {}             # (band, band hash) -> set of ids
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _fingerprint(self, prompt: str):
+        text = normalize(prompt)
+        if not text or len(prompt) > MAX_PROMPT_CHARS:
+            return None, None
+        # Numbers and qualifiers must match exactly ("2+2" and "2+3" are not
+        # paraphrases)
+        numbers = tuple(_NUMBERS.findall(text))
+        qualifiers = tuple(word for word in text.split() if word in QUALIFIERS)
+        return minhash(shingles(text)), numbers + qualifiers
+
+    def _bands(self, signature):
+        for band in range(BANDS):
+            yield band, hash(signature[band * ROWS:(band + 1) * ROWS])
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        for key in self._bands(entry.signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def lookup(self, prompt: str):
+        """Return a cached answer for a near-duplicate prompt, or None"""
+        if not self.enabled:
+            return None
+        signature, numbers = self._fingerprint(prompt)
+        if signature is None:
+            return None
+
+        with self._lock:
+            candidates = set()
+            for key in self._bands(signature):
+                candidates.update(self._buckets.get(key, ()))
+
+            best_id, best_score = None, self.threshold
+            now = time.monotonic()
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if now - entry.created > self.ttl:
+                    self._remove(entry_id)
+                    continue
+                if entry.numbers != numbers:
+                    continue
+                score = similarity(signature, entry.signature)
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id].answer
+
+    def store(self, prompt: str, answer: str):
+        """Remember the answer to a prompt"""
+        if not self.enabled or not answer:
+            return
+        signature, numbers = self._fingerprint(prompt)
+        if signature is None:
+            return
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(signature, numbers, answer)
+            for key in self._bands(signature):
+                self._buckets.setdefault(key, set()).add(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
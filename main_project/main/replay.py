@@ -0,0 +1,399 @@
+"""
+RG Assistant - Update recording and replay
+
+With RECORD_UPDATES_PATH set, every incoming Update is appended to a
+compressed log (gzip JSON lines, one [timestamp, update] pair per line). Like
+ad analytics, recording only touches an in-memory buffer on the message path;
+a background task serializes and writes it in batches.
+
+Text is redacted by default: each word is replaced by a pseudo-word of the
+same length derived from a per-recording secret, so repeated prompts still
+repeat and lengths are kept, but the content can't be read back. Stopwords
+and the words the model router looks for are kept, so requests are
+classified as in production. Names, usernames, contacts and locations are
+dropped (first names become "User") and user/chat IDs are pseudonymized.
+Command arguments are redacted like any other text.
+
+A recorded log is fed back into the real handlers against the local
+Telegram and Cohere stand-ins, at the original pace or faster:
+
+    python -m main.replay show updates.jsonl.gz
+    python -m main.replay run updates.jsonl.gz --speed 10 --cohere-latency 0.5
+"""
+
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+# Updates kept in memory between flushes (oldest are dropped when full)
+BUFFER_CAPACITY = 10000
+
+# Seconds between flushes
+FLUSH_INTERVAL = 10.0
+
+# Longest pause reproduced during a replay (seconds, before speed-up)
+MAX_GAP = 60.0
+
+# Seconds to wait for background jobs after the last update was replayed
+DRAIN_TIMEOUT = 120.0
+
+# Message fields holding free text
+TEXT_FIELDS = ("text", "caption")
+# User/chat fields removed outright
+DROPPED_FIELDS = ("last_name", "username", "title", "phone_number", "bio", "contact", "location", "venue")
+# Required by the Bot API, so replaced instead
+PLACEHOLDER_NAME = "User"
+
+CHAT_TYPES = ("private", "group", "supergroup", "channel")
+
+_WORD = re.compile(r"\w+")
+
+
+# ============================================================================
+# REDACTION
+# ============================================================================
+
+def _keep_words() -> frozenset:
+    """Words left readable: they don't identify anyone but steer routing/caching"""
+    from main.prompt_cache import STOPWORDS
+    from main.routing import HEAVY_KEYWORDS
+
+    words = set(STOPWORDS)
+    for keyword in HEAVY_KEYWORDS:
+        words.update(_WORD.findall(keyword))
+    return frozenset(words)
+
+
+class Redactor:
+    """Removes personal content from update dicts, consistently per recording"""
+
+    def __init__(self, secret: bytes = None):
+        self.secret = secret or os.urandom(16)
+        self.keep = _keep_words()
+
+    def _digest(self, value: str) -> bytes:
+        return hmac.new(self.secret, value.encode(), hashlib.sha256).digest()
+
+    def word(self, match) -> str:
+        word = match.group(0)
+        if word.lower() in self.keep or word.isdigit() and len(word) < 3:
+            return word
+        digest = self._digest(word.lower()).hex()
+        while len(digest) < len(word):
+            digest += digest
+        return digest[:len(word)]
+
+    def text(self, text: str) -> str:
+        # Keep the command itself (e.g. /tone) so replays hit the same handler
+        if text.startswith("/"):
+            command, _, rest = text.partition(" ")
+            return command + (" " + _WORD.sub(self.word, rest) if rest else "")
+        return _WORD.sub(self.word, text)
+
+    def user_id(self, user_id: int) -> int:
+        """Stable pseudonymous ID (negative IDs, i.e. groups, stay negative)"""
+        pseudo = int.from_bytes(self._digest(str(abs(user_id)))[:5], "big") + 1
+        return -pseudo if user_id < 0 else pseudo
+
+    def redact(self, data):
+        """Redacted copy of an update dict"""
+        if isinstance(data, list):
+            return [self.redact(item) for item in data]
+        if not isinstance(data, dict):
+            return data
+        result = {}
+        for key, value in data.items():
+            if key in DROPPED_FIELDS:
+                continue
+            if key == "first_name":
+                result[key] = PLACEHOLDER_NAME
+            elif key in TEXT_FIELDS and isinstance(value, str):
+                result[key] = self.text(value)
+            elif key == "file_name" and isinstance(value, str):
+                # The extension decides how a document is handled
+                stem, ext = os.path.splitext(value)
+                result[key] = self.text(stem) + ext
+            elif key == "id" and ("is_bot" in data or data.get("type") in CHAT_TYPES):
+                # Users and chats (a private chat's ID is its user's ID)
+                result[key] = self.user_id(value)
+            elif key in ("entities", "caption_entities"):
+                # Offsets still match, since redaction keeps lengths
+                result[key] = [{k: v for k, v in entity.items() if k not in ("url", "user")} for entity in value]
+            else:
+                result[key] = self.redact(value)
+        return result
+
+
+# ============================================================================
+# RECORDER
+# ============================================================================
+
+class UpdateRecorder:
+    """Update buffer plus the background task that appends it to the log"""
+
+    def __init__(self, path: str, redact: bool = True, interval: float = FLUSH_INTERVAL,
+                 capacity: int = BUFFER_CAPACITY):
+        self.path = path
+        self.interval = interval
+        self.redactor = Redactor() if redact else None
+        self.buffer = deque(maxlen=capacity)
+        self.dropped = 0
+        self._task = None
+
+    def record(self, update):
+        """Queue an Update for the log (O(1); a no-op until start())"""
+        if self._task is None:
+            return
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        # Updates are immutable, so serializing later in a thread is safe
+        self.buffer.append((time.time(), update))
+
+    def _write(self, batch: list):
+        lines = []
+        for ts, update in batch:
+            data = update.to_dict()
+            if self.redactor is not None:
+                data = self.redactor.redact(data)
+            lines.append(json.dumps([round(ts, 3), data], ensure_ascii=False, separators=(",", ":")))
+        # Each flush appends one gzip member; readers see a single stream
+        with gzip.open(self.path, "at", encoding="utf-8", compresslevel=6) as f:
+            f.write("\n".join(lines) + "\n")
+
+    async def flush(self):
+        """Write buffered updates off the event loop"""
+        batch = []
+        while self.buffer:
+            batch.append(self.buffer.popleft())
+        if not batch:
+            return
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except Exception as e:
+            logger.error("Update recording flush failed (%d updates lost): %s", len(batch), e)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self):
+        if self.path and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write what is left"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+
+def read_log(path: str) -> list:
+    """[(timestamp, update dict)] from a recorded log, in order"""
+    records = []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                ts, data = json.loads(line)
+                records.append((ts, data))
+    records.sort(key=lambda record: record[0])
+    return records
+
+
+def update_kind(data: dict) -> str:
+    """Short label for the report: /command, text, voice, document, photo, ..."""
+    message = data.get("message") or data.get("edited_message")
+    if message is None:
+        if "callback_query" in data:
+            return "callback"
+        return next((key for key in data if key != "update_id"), "unknown")
+    text = message.get("text")
+    if text is not None:
+        return text.split()[0].split("@")[0] if text.startswith("/") else "text"
+    for kind in ("voice", "document", "photo", "audio", "video", "sticker"):
+        if kind in message:
+            if kind == "document":
+                return f"document{os.path.splitext(message[kind].get('file_name') or '')[1].lower()}"
+            return kind
+    return "other"
+
+
+# ============================================================================
+# REPLAY
+# ============================================================================
+
+def _standin_files(records: list) -> dict:
+    """Stand-in contents for every file in the log, sized like the original"""
+    files = {}
+    for _, data in records:
+        message = data.get("message") or {}
+        attachments = [message[k] for k in ("voice", "document", "audio") if k in message]
+        attachments += message.get("photo", [])[-1:]
+        for attachment in attachments:
+            size = min(attachment.get("file_size") or 0, 10 * 1024 * 1024)
+            line = b"id,name,value\n" if (attachment.get("file_name") or "").endswith(".csv") else b""
+            row = b"1,item,42.5\n" if line else b"sample text line\n"
+            files[attachment["file_id"]] = (line + row * (size // len(row) + 1))[:size]
+    return files
+
+
+def _percentile(ordered: list, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+async def replay(path: str, speed: float = 1.0, cohere_latency: float = 0.0,
+                 telegram_latency: float = 0.0, limit: int = None) -> dict:
+    """Feed a recorded log through the bot's handlers against the stand-ins.
+
+    Returns a report: per update kind counts and handler latency (from the
+    moment the update was due to its last handler finishing, so queueing
+    under load is included), plus totals.
+    """
+    from main.memory import rss_bytes
+    from main.standins import CohereStandIn, TelegramStandIn
+
+    records = read_log(path)[:limit]
+    if not records:
+        raise ValueError(f"No updates in {path}")
+
+    cohere = CohereStandIn(latency=cohere_latency).start()
+    # Local, throwaway state; set before the bot module reads its configuration
+    os.environ.update(
+        COHERE_API_URL=cohere.url,
+        STATE_SNAPSHOT_PATH="",
+        STATE_BACKEND_URL="",
+        ANALYTICS_PATH="",
+        STATS_PATH="",
+        JOBS_PATH="",
+        MEDIA_CACHE_DIR="",
+        RECORD_UPDATES_PATH="",
+        PRELOAD_HEAVY_MODULES="false",
+    )
+    from telegram import Update
+    from telegram.ext import TypeHandler
+
+    from main import telegram_server
+
+    request = TelegramStandIn(files=_standin_files(records), latency=telegram_latency)
+    application = telegram_server.build_application("123:REPLAY", updater=False, request=request)
+
+    due = {}       # update_id -> time it was due
+    latency = {}   # kind -> [seconds]
+    kinds = {}
+
+    async def finished(update, context):
+        kind = kinds.pop(update.update_id, "unknown")
+        latency.setdefault(kind, []).append(time.perf_counter() - due.pop(update.update_id))
+
+    # Runs after every other handler group
+    application.add_handler(TypeHandler(Update, finished), group=1000)
+
+    started = time.perf_counter()
+    async with application:
+        await application.start()
+        if application.post_init:
+            await application.post_init(application)
+        try:
+            first = records[0][0]
+            offset = 0.0
+            previous = first
+            for ts, data in records:
+                offset += min(ts - previous, MAX_GAP) / speed
+                previous = ts
+                delay = started + offset - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                update = Update.de_json(data, application.bot)
+                due[update.update_id] = started + offset
+                kinds[update.update_id] = update_kind(data)
+                await application.update_queue.put(update)
+
+            # Let queued updates and background jobs finish
+            deadline = time.perf_counter() + DRAIN_TIMEOUT
+            while time.perf_counter() < deadline:
+                counts = telegram_server.job_queue.counts()
+                if not due and not counts.get("queued") and not counts.get("running"):
+                    break
+                await asyncio.sleep(0.1)
+            elapsed = time.perf_counter() - started
+        finally:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+            cohere.stop()
+
+    rows = {}
+    for kind, values in sorted(latency.items()):
+        values.sort()
+        rows[kind] = {
+            "count": len(values),
+            "p50": _percentile(values, 0.5),
+            "p95": _percentile(values, 0.95),
+            "max": values[-1],
+        }
+    return {
+        "updates": len(records),
+        "unfinished": len(due),
+        "recorded_seconds": records[-1][0] - records[0][0],
+        "elapsed": elapsed,
+        "kinds": rows,
+        "bot_api_calls": Counter(endpoint for endpoint, _ in request.calls),
+        "cohere_requests": len(cohere.requests),
+        "rss_bytes": rss_bytes(),
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Recorded update log tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    show = commands.add_parser("show", help="summarize a recorded log")
+    show.add_argument("file")
+
+    run = commands.add_parser("run", help="replay a log against local stand-ins")
+    run.add_argument("file")
+    run.add_argument("--speed", type=float, default=1.0, help="replay N times faster than recorded")
+    run.add_argument("--cohere-latency", type=float, default=0.0, help="stand-in LLM latency (seconds)")
+    run.add_argument("--telegram-latency", type=float, default=0.0, help="stand-in Bot API latency (seconds)")
+    run.add_argument("--limit", type=int, help="replay only the first N updates")
+
+    args = parser.parse_args()
+
+    if args.command == "show":
+        records = read_log(args.file)
+        duration = records[-1][0] - records[0][0] if records else 0
+        print(f"{len(records)} updates over {duration / 60:.1f} min")
+        for kind, count in Counter(update_kind(data) for _, data in records).most_common():
+            print(f"  {kind:<20} {count:>8}")
+        return
+
+    report = asyncio.run(replay(args.file, args.speed, args.cohere_latency, args.telegram_latency, args.limit))
+    print(f"Replayed {report['updates']} updates ({report['recorded_seconds']:.0f}s recorded) "
+          f"in {report['elapsed']:.1f}s at {args.speed:g}x")
+    print(f"\n{'kind':<20} {'count':>7} {'p50':>9} {'p95':>9} {'max':>9}")
+    for kind, row in report["kinds"].items():
+        print(f"{kind:<20} {row['count']:>7} {row['p50'] * 1000:>7.0f}ms {row['p95'] * 1000:>7.0f}ms "
+              f"{row['max'] * 1000:>7.0f}ms")
+    if report["unfinished"]:
+        print(f"\n{report['unfinished']} updates did not finish")
+    calls = ", ".join(f"{endpoint} {count}" for endpoint, count in report["bot_api_calls"].most_common())
+    print(f"\nBot API calls: {calls}")
+    print(f"Cohere requests: {report['cohere_requests']}")
+    print(f"RSS at the end: {report['rss_bytes'] / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+RG Assistant - Model routing
+
+Each LLM request is classified as light (short chat turns) or heavy (long
+prompts, long history, file analysis, writing/coding tasks). Light requests
+go to the fastest model observed for them, preferring the fast tier; heavy
+requests always use the strong tier. Latency is tracked per model and request
+class with an exponentially weighted moving average, so if a fast model slows
+down or fails, light traffic moves to whatever is answering quickest.
+
+To compare routing against the local Cohere stand-in:
+    python -m main.routing --requests 40
+"""
+
+import random
+import threading
+
+LIGHT = "light"
+HEAVY = "heavy"
+
+# Light requests: at most this many prompt characters and history turns
+LIGHT_MAX_CHARS = 300
+LIGHT_MAX_TURNS = 8
+
+# Prompts mentioning these are treated as heavy regardless of length
+HEAVY_KEYWORDS = (
+    "analyze", "analyse", "explain", "code", "write", "essay", "summarize",
+    "summarise", "translate", "debug", "step by step", "compare", "```",
+)
+
+# max_tokens per request class
+MAX_TOKENS = {LIGHT: 512, HEAVY: 2048}
+
+# A strong model must be this much faster than the fast tier to take light traffic
+STRONG_BIAS = 1.5
+
+# Share of requests sent to a random candidate to keep latency estimates fresh
+EXPLORE_RATE = 0.05
+
+# EWMA weight of the newest latency sample
+ALPHA = 0.2
+
+# Added to a model's latency estimate per recent failure (seconds)
+FAILURE_PENALTY = 5.0
+
+
+def classify(prompt: str, history_turns: int = 0, task: str = "chat") -> str:
+    """Light or heavy, from the prompt, the history size and the task type"""
+    if task != "chat":
+        return HEAVY
+    if len(prompt) > LIGHT_MAX_CHARS or history_turns > LIGHT_MAX_TURNS:
+        return HEAVY
+    lowered = prompt.lower()
+    if any(keyword in lowered for keyword in HEAVY_KEYWORDS):
+        return HEAVY
+    return LIGHT
+
+
+class Route:
+    """Where a request goes"""
+
+    __slots__ = ("model", "max_tokens", "kind", "retry")
+
+    def __init__(self, model: str, max_tokens: int, kind: str, retry: bool = False):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.kind = kind
+        self.retry = retry  # already the retry after a failed request
+
+    def __repr__(self):
+        return f"Route({self.model!r}, {self.kind}, max_tokens={self.max_tokens})"
+
+
+class ModelRouter:
+    """Picks a model per request from observed latency"""
+
+    def __init__(self, fast_models: list, strong_models: list, explore_rate: float = EXPLORE_RATE):
+        if not strong_models:
+            raise ValueError("At least one strong model is required")
+        self.fast_models = list(fast_models)
+        self.strong_models = list(strong_models)
+        self.explore_rate = explore_rate
+        self._latency = {}   # (model, kind) -> EWMA seconds
+        self._failures = {}  # (model, kind) -> recent failures
+        self._lock = threading.Lock()
+
+    def _score(self, model: str, kind: str) -> float:
+        """Expected latency; unknown models score 0 so they get tried"""
+        key = (model, kind)
+        return self._latency.get(key, 0.0) + FAILURE_PENALTY * self._failures.get(key, 0)
+
+    def route(self, prompt: str, history_turns: int = 0, task: str = "chat") -> Route:
+        """Choose a model for a request"""
+        kind = classify(prompt, history_turns, task)
+        if kind == HEAVY or not self.fast_models:
+            candidates = [(model, 1.0) for model in self.strong_models]
+        else:
+            candidates = [(model, 1.0) for model in self.fast_models]
+            candidates += [(model, STRONG_BIAS) for model in self.strong_models]
+
+        with self._lock:
+            if len(candidates) > 1 and random.random() < self.explore_rate:
+                model = random.choice(candidates)[0]
+            else:
+                model = min(candidates, key=lambda c: self._score(c[0], kind) * c[1])[0]
+        return Route(model, MAX_TOKENS[kind], kind)
+
+    def fallback(self, route: Route):
+        """A strong model to retry with after `route` failed, or None.
+
+        A request is retried once: a failed retry returns None.
+        """
+        if route.retry:
+            return None
+        for model in self.strong_models:
+            if model != route.model:
+                return Route(model, route.max_tokens, route.kind, retry=True)
+        return None
+
+    def record(self, route: Route, seconds: float, ok: bool = True):
+        """Feed back how long a request took and whether it succeeded"""
+        key = (route.model, route.kind)
+        with self._lock:
+            if ok:
+                previous = self._latency.get(key)
+                self._latency[key] = seconds if previous is None else previous + ALPHA * (seconds - previous)
+                if self._failures.get(key):
+                    self._failures[key] -= 1
+            else:
+                self._failures[key] = min(self._failures.get(key, 0) + 1, 3)
+
+    def stats(self) -> dict:
+        """Latency estimates as {"model/kind": seconds}"""
+        with self._lock:
+            return {f"{model}/{kind}": round(value, 3) for (model, kind), value in self._latency.items()}
+
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+
+SAMPLE_PROMPTS = [
+    ("hi", "chat"),
+    ("thanks!", "chat"),
+    ("what time zone is Paris in?", "chat"),
+    ("Explain how TCP congestion control works, step by step.", "chat"),
+    ("Analyze this .py file:\n\n```.py\nprint('x')\n```", "document"),
+    ("good morning", "chat"),
+]
+
+
+def benchmark(requests: int = 40, fast_latency: float = 0.05, strong_latency: float = 0.4):
+    """Send a prompt mix through the router to the Cohere stand-in.
+
+    Returns (routed_light_avg, single_model_light_avg, heavy_avg) in seconds.
+    """
+    import time
+
+    import requests as http
+
+    from main.standins import CohereStandIn
+
+    fast, strong = "fast-model", "strong-model"
+    cohere = CohereStandIn(latency={fast: fast_latency, strong: strong_latency}).start()
+    router = ModelRouter([fast], [strong])
+    light_routed, light_single, heavy = [], [], []
+
+    def send(model: str, prompt: str, max_tokens: int) -> float:
+        start = time.perf_counter()
+        http.post(cohere.url, json={"model": model, "message": prompt, "max_tokens": max_tokens}, timeout=30)
+        return time.perf_counter() - start
+
+    try:
+        for i in range(requests):
+            prompt, task = SAMPLE_PROMPTS[i % len(SAMPLE_PROMPTS)]
+            route = router.route(prompt, task=task)
+            elapsed = send(route.model, prompt, route.max_tokens)
+            router.record(route, elapsed)
+            if route.kind == LIGHT:
+                light_routed.append(elapsed)
+                light_single.append(send(strong, prompt, MAX_TOKENS[HEAVY]))
+            else:
+                heavy.append(elapsed)
+    finally:
+        cohere.stop()
+
+    def avg(values):
+        return sum(values) / len(values) if values else 0.0
+
+    return avg(light_routed), avg(light_single), avg(heavy)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Model routing benchmark (local stand-in)")
+    parser.add_argument("--requests", type=int, default=40)
+    args = parser.parse_args()
+
+    routed, single, heavy = benchmark(args.requests)
+    print(f"Light requests, routed:        {routed * 1000:.0f}ms avg")
+    print(f"Light requests, strong only:   {single * 1000:.0f}ms avg")
+    print(f"Heavy requests (strong model): {heavy * 1000:.0f}ms avg")
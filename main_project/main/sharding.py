@@ -0,0 +1,419 @@
+"""
+RG Assistant - Sharded multi-process mode
+
+A front dispatcher polls Telegram and routes every update to a fixed worker
+process, chosen by consistent hash of the user's ID. Each user is always
+served by the same worker, so per-user state (user_settings,
+user_conversations) stays local to one process and needs no locking.
+
+To run with 4 workers:
+    BOT_WORKERS=4 python -m main.telegram_server
+"""
+
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+logger = logging.getLogger(__name__)
+
+# Virtual nodes per worker on the hash ring (smooths the distribution)
+RING_VNODES = 64
+
+# How often the dispatcher checks worker health (seconds)
+HEALTH_CHECK_INTERVAL = 2.0
+
+# A worker that has not reported a heartbeat for this long is restarted
+HEARTBEAT_TIMEOUT = 60.0
+
+# A worker that keeps dying (bad token, getMe failing) is restarted after
+# 0, 2, 4, 8... seconds, up to RESTART_BACKOFF_MAX; the backoff starts over
+# once a worker has stayed up for RESTART_RESET_AFTER seconds
+RESTART_BACKOFF_BASE = 2.0
+RESTART_BACKOFF_MAX = 60.0
+RESTART_RESET_AFTER = 60.0
+
+# Seconds to wait for workers to drain their queues on shutdown
+SHUTDOWN_TIMEOUT = 20.0
+
+# Workers are started with "spawn" so they never inherit the dispatcher's
+# event loop or HTTP connections
+_mp = multiprocessing.get_context("spawn")
+
+
+# ============================================================================
+# CONSISTENT HASH RING
+# ============================================================================
+
+def _ring_hash(key: str) -> int:
+    """Stable 64-bit hash (Python's hash() is salted per process)"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring mapping user IDs to worker slots"""
+
+    def __init__(self, nodes=(), vnodes: int = RING_VNODES):
+        self.vnodes = vnodes
+        self._keys = []
+        self._nodes = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: int):
+        """Add a worker slot to the ring (no-op if already present)"""
+        if node in self._nodes:
+            return
+        for i in range(self.vnodes):
+            point = _ring_hash(f"{node}:{i}")
+            index = bisect.bisect(self._keys, point)
+            self._keys.insert(index, point)
+            self._nodes.insert(index, node)
+
+    def remove(self, node: int):
+        """Remove a worker slot; its users move to the next slots on the ring"""
+        keep = [(k, n) for k, n in zip(self._keys, self._nodes) if n != node]
+        self._keys = [k for k, _ in keep]
+        self._nodes = [n for _, n in keep]
+
+    def __contains__(self, node: int) -> bool:
+        return node in self._nodes
+
+    def __len__(self) -> int:
+        return len(set(self._nodes))
+
+    def get(self, key) -> int:
+        """Return the worker slot responsible for a key"""
+        if not self._keys:
+            raise LookupError("No workers available")
+        index = bisect.bisect(self._keys, _ring_hash(str(key))) % len(self._keys)
+        return self._nodes[index]
+
+
+# ============================================================================
+# WORKER PROCESS
+# ============================================================================
+
+def _configure_worker(slot: int) -> str:
+    """Point the per-process stores at this slot's files.
+
+    Returns the slot's state snapshot path.
+    """
+    from main.telegram_server import (
+        BROADCAST_CHECKPOINT_PATH,
+        JOBS_PATH,
+        STATE_SNAPSHOT_PATH,
+        STATS_PATH,
+        broadcast_engine,
+        job_queue,
+        update_recorder,
+        usage_stats,
+    )
+
+    # The dispatcher already records every update; workers appending to the
+    # same gzip log would duplicate them and interleave members
+    update_recorder.path = ""
+    # Jobs update their users' in-memory state, so they stay on the slot too
+    job_queue.path = f"{JOBS_PATH}.{slot}" if JOBS_PATH else ""
+    # Per-worker stats files are merged by `python -m main.stats export`
+    usage_stats.path = f"{STATS_PATH}.{slot}" if STATS_PATH else ""
+    # A broadcast is resumed only by the worker that started it
+    broadcast_engine.checkpoint_path = f"{BROADCAST_CHECKPOINT_PATH}.{slot}" if BROADCAST_CHECKPOINT_PATH else ""
+    # Each slot owns a stable set of users, so it keeps its own snapshot
+    return f"{STATE_SNAPSHOT_PATH}.{slot}" if STATE_SNAPSHOT_PATH else ""
+
+
+def _worker_main(slot: int, token: str, inbox, heartbeat):
+    """Entry point of a worker process"""
+    from main.telegram_server import (
+        build_application,
+        load_state_snapshot,
+        save_state_snapshot,
+        save_usage_stats,
+        start_services,
+        stop_services,
+        usage_stats,
+    )
+
+    # Shutdown is coordinated by the dispatcher (SIGINT reaches the whole
+    # process group on deploys)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    logging.getLogger(__name__).info("Worker %d starting", slot)
+    snapshot_path = _configure_worker(slot)
+    load_state_snapshot(snapshot_path)
+    usage_stats.load()
+
+    application = build_application(token, updater=False)
+    # Metrics are not served per worker: they would compete for METRICS_PORT
+    asyncio.run(_worker_loop(
+        application, inbox, heartbeat, lambda bot: start_services(bot, metrics=False), stop_services,
+    ))
+    save_state_snapshot(snapshot_path)
+    save_usage_stats()
+
+
+async def _worker_loop(application: Application, inbox, heartbeat, start_services=None, stop_services=None):
+    """Feed updates from the dispatcher into this worker's Application.
+
+    start_services(bot) / stop_services() start and stop the background work
+    (jobs, analytics, transcription and profiling workers) around it.
+    """
+    loop = asyncio.get_running_loop()
+
+    async with application:
+        await application.start()
+        if start_services is not None:
+            start_services(application.bot)
+        try:
+            while True:
+                heartbeat.value = time.time()
+                try:
+                    data = await loop.run_in_executor(None, inbox.get, True, 1.0)
+                except queue.Empty:
+                    continue
+
+                # None is the shutdown sentinel
+                if data is None:
+                    break
+
+                update = Update.de_json(data, application.bot)
+                await application.update_queue.put(update)
+        finally:
+            # stop() finishes all updates already queued before returning
+            await application.stop()
+            if stop_services is not None:
+                await stop_services()
+
+
+# ============================================================================
+# SNAPSHOT REBALANCING
+# ============================================================================
+
+def snapshot_paths(base: str, workers: int) -> list:
+    """Snapshot file of each worker slot (a single unsuffixed file unsharded)"""
+    if workers <= 1:
+        return [base]
+    return [f"{base}.{slot}" for slot in range(workers)]
+
+
+def _existing_snapshots(base: str) -> list:
+    """The unsharded snapshot and any per-slot ones (base.0, base.1, ...)"""
+    directory, name = os.path.split(os.path.abspath(base))
+    if not os.path.isdir(directory):
+        return []
+    found = []
+    for entry in os.listdir(directory):
+        suffix = entry[len(name) + 1:]
+        if entry == name or (entry.startswith(f"{name}.") and suffix.isdigit()):
+            found.append(os.path.join(directory, entry))
+    return sorted(found)
+
+
+def rebalance_snapshots(base: str, workers: int) -> int:
+    """Move users to the snapshot of the slot that owns them.
+
+    Slots own users by hash ring position, so changing BOT_WORKERS changes
+    which slot owns whom. When the snapshots on disk were written with a
+    different number of workers, their users are redistributed over the new
+    slots and files of slots that no longer exist are removed. Returns the
+    number of users redistributed (0 when the layout already matches).
+    """
+    if not base:
+        return 0
+    from main.snapshot import decode_record, open_snapshot, write_snapshot
+
+    targets = [os.path.abspath(path) for path in snapshot_paths(base, workers)]
+    existing = _existing_snapshots(base)
+    if not existing or existing == sorted(targets):
+        return 0
+
+    ring = HashRing(range(workers))
+    records = [{} for _ in targets]
+    for path in existing:
+        reader = open_snapshot(path)
+        if reader is None:
+            continue
+        try:
+            for user_id, data in reader.remaining():
+                slot = ring.get(user_id) if workers > 1 else 0
+                records[slot][user_id] = decode_record(data)
+        finally:
+            reader.close()
+
+    # New files first: if this is interrupted, the old ones are still there
+    # and the next start redistributes again
+    for path, slot_records in zip(targets, records):
+        write_snapshot(path, slot_records.items())
+    for path in existing:
+        if path not in targets:
+            os.remove(path)
+
+    moved = sum(len(slot_records) for slot_records in records)
+    logger.info("Redistributed %d users from %d snapshots over %d workers", moved, len(existing), workers)
+    return moved
+
+
+# ============================================================================
+# DISPATCHER
+# ============================================================================
+
+class WorkerPool:
+    """Starts, supervises and restarts the sharded worker processes"""
+
+    def __init__(self, token: str, size: int):
+        self.token = token
+        self.size = size
+        self.ring = HashRing()
+        self.inboxes = [_mp.Queue() for _ in range(size)]
+        self.heartbeats = [_mp.Value("d", 0.0) for _ in range(size)]
+        self.processes = [None] * size
+        self.started_at = [0.0] * size
+        self.restarts = [0] * size
+        self.failures = [0] * size       # consecutive quick failures per slot
+        self.restart_at = [None] * size  # when a down worker is restarted
+        self.supervisor = None
+
+    def start_worker(self, slot: int):
+        """Start (or restart) the worker process for a slot"""
+        self.heartbeats[slot].value = 0.0
+        self.started_at[slot] = time.time()
+        process = _mp.Process(
+            target=_worker_main,
+            args=(slot, self.token, self.inboxes[slot], self.heartbeats[slot]),
+            name=f"rg-worker-{slot}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[slot] = process
+        logger.info("Started worker %d (pid %d)", slot, process.pid)
+
+    def start(self):
+        """Start all workers"""
+        for slot in range(self.size):
+            self.start_worker(slot)
+            self.ring.add(slot)
+
+    def route(self, user_id) -> int:
+        """Pick the worker slot for a user"""
+        return self.ring.get(user_id)
+
+    def dispatch(self, update: Update):
+        """Send an update to the worker that owns its user"""
+        user = update.effective_user
+        chat = update.effective_chat
+        key = user.id if user else (chat.id if chat else update.update_id)
+        self.inboxes[self.route(key)].put(update.to_dict())
+
+    def _restart_delay(self, slot: int, now: float) -> float:
+        """Backoff before restarting a worker that just went down"""
+        if now - self.started_at[slot] > RESTART_RESET_AFTER:
+            self.failures[slot] = 0
+        delay = 0.0 if not self.failures[slot] else min(
+            RESTART_BACKOFF_MAX, RESTART_BACKOFF_BASE * 2 ** (self.failures[slot] - 1)
+        )
+        self.failures[slot] += 1
+        return delay
+
+    async def check_health(self):
+        """Restart dead or stalled workers.
+
+        A slot stays on the ring while its worker is down: only that worker
+        has its users' state, so their updates wait in the slot's inbox for
+        the replacement process instead of going to another worker.
+        """
+        now = time.time()
+        for slot, process in enumerate(self.processes):
+            last_seen = max(self.heartbeats[slot].value, self.started_at[slot])
+            alive = process is not None and process.is_alive()
+            stalled = alive and now - last_seen > HEARTBEAT_TIMEOUT
+
+            if alive and not stalled:
+                continue
+
+            if self.restart_at[slot] is None:
+                if stalled:
+                    logger.warning("Worker %d stalled, terminating", slot)
+                    process.terminate()
+                    # Off the event loop: the dispatcher keeps polling meanwhile
+                    await asyncio.to_thread(process.join, 5)
+
+                exit_code = process.exitcode if process is not None else None
+                delay = self._restart_delay(slot, now)
+                self.restart_at[slot] = now + delay
+                logger.warning("Worker %d is down (exit code %s), restarting in %.0fs", slot, exit_code, delay)
+
+            if time.time() >= self.restart_at[slot]:
+                self.restart_at[slot] = None
+                self.restarts[slot] += 1
+                self.start_worker(slot)
+
+    def stop(self):
+        """Ask all workers to drain and exit"""
+        for inbox in self.inboxes:
+            inbox.put(None)
+
+        deadline = time.time() + SHUTDOWN_TIMEOUT
+        for slot, process in enumerate(self.processes):
+            if process is None:
+                continue
+            process.join(max(0.0, deadline - time.time()))
+            if process.is_alive():
+                logger.warning("Worker %d did not exit in time, terminating", slot)
+                process.terminate()
+
+
+async def _supervise(pool: WorkerPool):
+    """Periodically check worker health"""
+    while True:
+        await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+        try:
+            await pool.check_health()
+        except Exception as e:
+            logger.error("Worker supervision error: %s", e)
+
+
+def run_sharded(token: str, workers: int):
+    """Run the dispatcher and a pool of sharded worker processes"""
+    # All traffic passes through here, so this is where updates are recorded
+    from main.telegram_server import STATE_SNAPSHOT_PATH, update_recorder
+
+    # Before any worker opens its snapshot
+    rebalance_snapshots(STATE_SNAPSHOT_PATH, workers)
+
+    pool = WorkerPool(token, workers)
+    pool.start()
+
+    async def dispatch_update(update: Update, context):
+        update_recorder.record(update)
+        pool.dispatch(update)
+
+    async def post_init(application: Application):
+        pool.supervisor = asyncio.create_task(_supervise(pool))
+        update_recorder.start()
+
+    async def post_shutdown(application: Application):
+        if pool.supervisor is not None:
+            pool.supervisor.cancel()
+        await asyncio.to_thread(pool.stop)
+        await update_recorder.stop()
+
+    application = (
+        Application.builder()
+        .token(token)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+    application.add_handler(TypeHandler(Update, dispatch_update))
+
+    logger.info("🤖 Dispatcher running with %d workers...", workers)
+    application.run_polling(allowed_updates=Update.ALL_TYPES)
@@ -0,0 +1,163 @@
+"""
+RG Assistant - Per-user state snapshots
+
+On shutdown the bot writes every user's state to a compact binary file; on
+startup the file is memory-mapped and each user is restored lazily the first
+time they send something, so a restart is warm without a long load step.
+
+File layout (little endian):
+    magic   8 bytes   b"RGSNAP01"
+    count   uint32    number of users
+    index   count x (int64 user_id, uint64 offset, uint32 length), sorted by user_id
+    records JSON, one per user; a leading b"z" marks a zlib-compressed record
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"RGSNAP01"
+HEADER = struct.Struct("<8sI")
+INDEX_ENTRY = struct.Struct("<qQI")
+
+# Small records do not shrink enough to be worth compressing
+COMPRESS_MIN_BYTES = 512
+
+
+def encode_record(record: dict) -> bytes:
+    """Serialize one user's state"""
+    data = json.dumps(record, separators=(",", ":"), ensure_ascii=False).encode()
+    if len(data) >= COMPRESS_MIN_BYTES:
+        return b"z" + zlib.compress(data, 1)
+    return data
+
+
+def decode_record(data: bytes) -> dict:
+    """Deserialize one user's state"""
+    if data[:1] == b"z":
+        data = zlib.decompress(data[1:])
+    return json.loads(data)
+
+
+class SnapshotReader:
+    """Memory-mapped snapshot with O(log n) per-user lookups"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file
+            self._file.close()
+            raise ValueError(f"Snapshot {path} is empty")
+
+        magic, self.count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a state snapshot")
+
+        self._index_start = HEADER.size
+        self.taken = set()
+
+    def _entry(self, position: int):
+        return INDEX_ENTRY.unpack_from(self._map, self._index_start + position * INDEX_ENTRY.size)
+
+    def _find(self, user_id: int):
+        """Binary search the sorted index"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = self._entry(mid)
+            if entry[0] < user_id:
+                lo = mid + 1
+            elif entry[0] > user_id:
+                hi = mid
+            else:
+                return entry
+        return None
+
+    def raw(self, user_id: int):
+        """Return the encoded record for a user, or None"""
+        entry = self._find(user_id)
+        if entry is None:
+            return None
+        _, offset, length = entry
+        return self._map[offset:offset + length]
+
+    def take(self, user_id: int):
+        """Restore a user once: returns the record, then None on later calls"""
+        if user_id in self.taken or not isinstance(user_id, int):
+            return None
+        data = self.raw(user_id)
+        if data is None:
+            return None
+        self.taken.add(user_id)
+        return decode_record(data)
+
+    def remaining(self):
+        """Yield (user_id, encoded record) for users not restored yet"""
+        for position in range(self.count):
+            user_id, offset, length = self._entry(position)
+            if user_id not in self.taken:
+                yield user_id, self._map[offset:offset + length]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def open_snapshot(path):
+    """Open a snapshot if one exists, else return None"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        reader = SnapshotReader(path)
+    except (OSError, ValueError, struct.error) as e:
+        logger.error("Ignoring unreadable snapshot %s: %s", path, e)
+        return None
+    logger.info("Snapshot %s opened (%d users, restored lazily)", path, reader.count)
+    return reader
+
+
+def write_snapshot(path, records, previous: SnapshotReader = None) -> int:
+    """Write a snapshot atomically and return the number of users written.
+
+    Args:
+        path: Destination file
+        records: Iterable of (user_id, record dict) for users in memory
+        previous: Snapshot loaded at startup; users never restored from it
+            are carried over unchanged
+    """
+    blobs = {}
+    for user_id, record in records:
+        if isinstance(user_id, int):
+            blobs[user_id] = encode_record(record)
+    if previous is not None:
+        for user_id, data in previous.remaining():
+            blobs.setdefault(user_id, bytes(data))
+
+    user_ids = sorted(blobs)
+    offset = HEADER.size + INDEX_ENTRY.size * len(user_ids)
+    tmp_path = f"{path}.tmp"
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(user_ids)))
+        for user_id in user_ids:
+            f.write(INDEX_ENTRY.pack(user_id, offset, len(blobs[user_id])))
+            offset += len(blobs[user_id])
+        for user_id in user_ids:
+            f.write(blobs[user_id])
+        f.flush()
+        os.fsync(f.fileno())
+
+    if previous is not None:
+        previous.close()
+    os.replace(tmp_path, path)
+    return len(user_ids)
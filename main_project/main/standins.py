@@ -0,0 +1,368 @@
+"""
+RG Assistant - Local stand-ins for Telegram, Cohere and Redis
+
+Lets the real handlers run without network access, for cold-start checks,
+benchmarks, replays and tests:
+
+    from main.standins import TelegramStandIn, CohereStandIn, RedisStandIn
+
+    cohere = CohereStandIn().start()        # set COHERE_API_URL = cohere.url
+    app = build_application("123:TEST", updater=False, request=TelegramStandIn())
+    backend = RedisStateBackend(RedisStandIn())
+"""
+
+import fnmatch
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telegram.request import BaseRequest
+
+STANDIN_BOT = {
+    "id": 123,
+    "is_bot": True,
+    "first_name": "RG Assistant",
+    "username": "rg_standin_bot",
+}
+
+
+# ============================================================================
+# TELEGRAM BOT API
+# ============================================================================
+
+class TelegramStandIn(BaseRequest):
+    """Answers Bot API calls locally and records them"""
+
+    def __init__(self, files: dict = None, latency: float = 0.0):
+        # file_id -> bytes served for getFile downloads
+        self.files = files or {}
+        self.latency = latency
+        self.calls = []
+        self._message_id = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def read_timeout(self):
+        return None
+
+    def _message(self, params: dict) -> dict:
+        self._message_id += 1
+        chat_id = params.get("chat_id", 0)
+        return {
+            "message_id": int(params.get("message_id", self._message_id)),
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id) if str(chat_id).lstrip("-").isdigit() else 0, "type": "private"},
+            "from": STANDIN_BOT,
+            "text": params.get("text", ""),
+        }
+
+    def _result(self, endpoint: str, params: dict):
+        if endpoint == "getMe":
+            return STANDIN_BOT
+        if endpoint in ("sendMessage", "editMessageText", "sendDocument", "sendPhoto"):
+            return self._message(params)
+        if endpoint == "getFile":
+            file_id = params.get("file_id", "")
+            return {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_size": len(self.files.get(file_id, b"")),
+                "file_path": f"files/{file_id}",
+            }
+        if endpoint == "getUpdates":
+            return []
+        return True
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        if self.latency:
+            import asyncio
+            await asyncio.sleep(self.latency)
+
+        # File downloads: .../file/bot<token>/files/<file_id>
+        if "/file/bot" in url:
+            file_id = url.rsplit("/", 1)[-1]
+            self.calls.append(("download", {"file_id": file_id}))
+            return 200, self.files.get(file_id, b"")
+
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls.append((endpoint, params))
+        body = {"ok": True, "result": self._result(endpoint, params)}
+        return 200, json.dumps(body).encode()
+
+
+# ============================================================================
+# COHERE CHAT API
+# ============================================================================
+
+class CohereStandIn:
+    """Tiny HTTP server answering POST /v1/chat with a canned reply"""
+
+    def __init__(self, reply: str = "This is a stand-in reply.", latency=0.0, status=200):
+        self.reply = reply
+        # Seconds per request, or {model: seconds} to simulate several models
+        self.latency = latency
+        # HTTP status per request, or {model: status} to simulate failing models
+        self.status = status
+        self.requests = []
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1/chat"
+
+    def start(self):
+        """Start serving on a free local port (returns self)"""
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                standin.requests.append(payload)
+                latency = standin.latency
+                if isinstance(latency, dict):
+                    latency = latency.get(payload.get("model"), 0.0)
+                if latency:
+                    time.sleep(latency)
+                status = standin.status
+                if isinstance(status, dict):
+                    status = status.get(payload.get("model"), 200)
+                if status == 200:
+                    body = json.dumps({"text": standin.reply}).encode()
+                else:
+                    body = json.dumps({"message": "stand-in error"}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+# ============================================================================
+# REDIS
+# ============================================================================
+
+def _consume_prompt(client, keys, args):
+    """Python version of state_backend.CONSUME_PROMPT_SCRIPT"""
+    key, (today, limit, ttl) = keys[0], args
+    date, used, unlimited_until = client.hmget(key, "date", "used", "unlimited_until")
+    used = int(used or 0)
+    if date != today:
+        used = 0
+        client.hset(key, mapping={"date": today, "used": 0})
+    client.expire(key, int(ttl))
+
+    if unlimited_until and unlimited_until >= today:
+        return [1, -1]
+    if used < int(limit):
+        used = client.hincrby(key, "used", 1)
+        return [1, int(limit) - used]
+    return [0, 0]
+
+
+class _Script:
+    def __init__(self, client, run):
+        self.client = client
+        self.run = run
+
+    def __call__(self, keys=(), args=(), client=None):
+        if isinstance(client, _Pipeline):
+            client._queue.append(lambda: self.run(self.client, list(keys), list(args)))
+            return client
+        with self.client._lock:
+            return self.run(self.client, list(keys), list(args))
+
+
+class _Pipeline:
+    """Queues commands and runs them together (always atomically)"""
+
+    def __init__(self, client):
+        self._client = client
+        self._queue = []
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+
+        def queue(*args, **kwargs):
+            self._queue.append(lambda: method(*args, **kwargs))
+            return self
+
+        return queue
+
+    def execute(self):
+        with self._client._lock:
+            results = [command() for command in self._queue]
+        self._queue = []
+        return results
+
+
+class RedisStandIn:
+    """In-process store answering the redis-py calls the state backend makes.
+
+    Behaves like redis.Redis(decode_responses=True): values come back as
+    strings, keys expire. Lua scripts are not interpreted: the scripts the
+    bot registers have Python versions in `scripts`.
+    """
+
+    def __init__(self):
+        from main.state_backend import CONSUME_PROMPT_SCRIPT
+
+        self.scripts = {CONSUME_PROMPT_SCRIPT: _consume_prompt}
+        self._data = {}
+        self._expiry = {}
+        self._lock = threading.RLock()
+
+    def _get(self, key, kind=None):
+        deadline = self._expiry.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self._data.pop(key, None)
+            self._expiry.pop(key, None)
+        value = self._data.get(key)
+        if kind is not None and value is None:
+            value = self._data[key] = kind()
+        return value
+
+    # Keys ----------------------------------------------------------------
+
+    def delete(self, *keys) -> int:
+        with self._lock:
+            found = [key for key in keys if self._get(key) is not None]
+            for key in found:
+                self._data.pop(key)
+                self._expiry.pop(key, None)
+            return len(found)
+
+    def exists(self, *keys) -> int:
+        with self._lock:
+            return sum(1 for key in keys if self._get(key) is not None)
+
+    def expire(self, key, seconds) -> bool:
+        with self._lock:
+            if self._get(key) is None:
+                return False
+            self._expiry[key] = time.monotonic() + int(seconds)
+            return True
+
+    def ttl(self, key) -> int:
+        with self._lock:
+            if self._get(key) is None:
+                return -2
+            deadline = self._expiry.get(key)
+            return -1 if deadline is None else round(deadline - time.monotonic())
+
+    def scan_iter(self, match="*", count=None):
+        with self._lock:
+            keys = [key for key in list(self._data) if self._get(key) is not None]
+        return iter(key for key in keys if fnmatch.fnmatchcase(key, match))
+
+    # Strings -------------------------------------------------------------
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def set(self, key, value, nx=False, ex=None):
+        with self._lock:
+            if nx and self._get(key) is not None:
+                return None
+            self._data[key] = str(value)
+            self._expiry.pop(key, None)
+            if ex is not None:
+                self._expiry[key] = time.monotonic() + int(ex)
+            return True
+
+    def incrby(self, key, amount=1) -> int:
+        with self._lock:
+            value = int(self._get(key) or 0) + int(amount)
+            self._data[key] = str(value)
+            return value
+
+    # Hashes --------------------------------------------------------------
+
+    def hgetall(self, key) -> dict:
+        with self._lock:
+            return dict(self._get(key) or {})
+
+    def hget(self, key, field):
+        with self._lock:
+            return (self._get(key) or {}).get(field)
+
+    def hmget(self, key, *fields) -> list:
+        with self._lock:
+            values = self._get(key) or {}
+            return [values.get(field) for field in fields]
+
+    def hset(self, key, field=None, value=None, mapping=None) -> int:
+        items = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+        with self._lock:
+            values = self._get(key, dict)
+            added = sum(1 for name in items if name not in values)
+            values.update((name, str(value)) for name, value in items.items())
+            return added
+
+    def hincrby(self, key, field, amount=1) -> int:
+        with self._lock:
+            values = self._get(key, dict)
+            values[field] = str(int(values.get(field, 0)) + int(amount))
+            return int(values[field])
+
+    def hdel(self, key, *fields) -> int:
+        with self._lock:
+            values = self._get(key) or {}
+            return sum(1 for field in fields if values.pop(field, None) is not None)
+
+    # Lists ---------------------------------------------------------------
+
+    def rpush(self, key, *values) -> int:
+        with self._lock:
+            items = self._get(key, list)
+            items.extend(str(value) for value in values)
+            return len(items)
+
+    def lrange(self, key, start, end) -> list:
+        with self._lock:
+            items = self._get(key) or []
+            # Redis ranges are inclusive and may count from the end
+            start = max(len(items) + start, 0) if start < 0 else start
+            end = len(items) + end if end < 0 else end
+            return items[start:end + 1]
+
+    def ltrim(self, key, start, end) -> bool:
+        with self._lock:
+            items = self._get(key)
+            if items is not None:
+                items[:] = self.lrange(key, start, end)
+            return True
+
+    # Scripts & pipelines -------------------------------------------------
+
+    def register_script(self, script):
+        if script not in self.scripts:
+            raise NotImplementedError("RedisStandIn has no Python version of this script")
+        return _Script(self, self.scripts[script])
+
+    def pipeline(self, transaction=True):
+        return _Pipeline(self)
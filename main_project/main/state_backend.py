@@ -0,0 +1,288 @@
+"""
+RG Assistant - Shared state backend
+
+Keeps per-user quota, settings and conversation history in a store speaking
+the Redis protocol, so several bot instances can serve the same users
+without double quotas or split histories.
+
+Enable it by pointing STATE_BACKEND_URL at a Redis server:
+    STATE_BACKEND_URL=redis://localhost:6379/0 python -m main.telegram_server
+
+For tests, pass any redis-py compatible client (for example
+main.standins.RedisStandIn) to RedisStateBackend(client=...).
+"""
+
+import json
+import logging
+
+from main.user_state import (
+    DEFAULT_LANGUAGE,
+    DEFAULT_TONE,
+    LANGUAGES,
+    TONES,
+    UserState,
+    day_from_str,
+    day_to_str,
+    enum_index,
+)
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "rg"
+
+# Seconds of inactivity before a user's history / settings expire
+HISTORY_TTL = 7 * 24 * 3600
+SETTINGS_TTL = 180 * 24 * 3600
+
+# Per-day ad counters outlive their day a little (time zones, clock skew)
+ADS_TTL = 2 * 24 * 3600
+
+DEFAULT_SETTINGS = {
+    "tone": "friendly",
+    "language": "en",
+    "notifications": "1",
+}
+
+# Atomically reset the daily counter on a new day, then consume one prompt
+# unless the user is premium. Returns {allowed, remaining} with remaining = -1
+# for premium users.
+CONSUME_PROMPT_SCRIPT = """
+local key = KEYS[1]
+local today = ARGV[1]
+local limit = tonumber(ARGV[2])
+local ttl = tonumber(ARGV[3])
+
+local vals = redis.call('HMGET', key, 'date', 'used', 'unlimited_until')
+local used = tonumber(vals[2]) or 0
+if vals[1] ~= today then
+    used = 0
+    redis.call('HSET', key, 'date', today, 'used', 0)
+end
+redis.call('EXPIRE', key, ttl)
+
+if vals[3] and vals[3] >= today then
+    return {1, -1}
+end
+
+if used < limit then
+    used = redis.call('HINCRBY', key, 'used', 1)
+    return {1, limit - used}
+end
+
+return {0, 0}
+"""
+
+
+# UserState attribute -> (hash field, encoder) for write-through settings
+_FIELDS = {
+    "tone_id": ("tone", lambda value: TONES[value]),
+    "language_id": ("language", lambda value: LANGUAGES[value]),
+    "notifications": ("notifications", lambda value: "1" if value else "0"),
+    "usage_day": ("date", lambda value: day_to_str(value) or ""),
+    "used": ("used", str),
+    "premium_until": ("unlimited_until", lambda value: day_to_str(value) or ""),
+    "message_count": ("messages", str),
+}
+
+
+class SharedUserState(UserState):
+    """UserState read from the backend; assigning a stored field writes it back.
+
+    Counters should still go through the backend's atomic methods
+    (consume_prompt, incr_message_count): `+=` on a copy races other instances.
+    """
+
+    __slots__ = ("_backend", "_user_id")
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        field = _FIELDS.get(name)
+        backend = getattr(self, "_backend", None)
+        if field is not None and backend is not None:
+            backend.set_setting(self._user_id, field[0], field[1](value))
+
+
+class RedisStateBackend:
+    """Per-user state stored in Redis (or anything speaking its protocol)"""
+
+    def __init__(self, client, history_limit: int = 20, prefix: str = KEY_PREFIX):
+        self.client = client
+        self.history_limit = history_limit
+        self.prefix = prefix
+        self._consume = client.register_script(CONSUME_PROMPT_SCRIPT)
+
+    def with_prefix(self, prefix: str):
+        """Backend on the same connection pool keeping user keys under another prefix"""
+        return type(self)(self.client, history_limit=self.history_limit, prefix=prefix)
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs):
+        """Connect to a Redis server by URL"""
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError(
+                "STATE_BACKEND_URL is set but the 'redis' package is not installed. "
+                "Run: pip install redis"
+            )
+        return cls(redis.Redis.from_url(url, decode_responses=True), **kwargs)
+
+    # ------------------------------------------------------------------------
+    # Keys
+    # ------------------------------------------------------------------------
+
+    def _user_key(self, user_id) -> str:
+        return f"{self.prefix}:user:{user_id}"
+
+    def _history_key(self, user_id) -> str:
+        return f"{self.prefix}:hist:{user_id}"
+
+    def _ads_key(self, user_id, today: str) -> str:
+        return f"{self.prefix}:ads:{user_id}:{today}"
+
+    # ------------------------------------------------------------------------
+    # Settings & quota
+    # ------------------------------------------------------------------------
+
+    def _to_settings(self, raw: dict) -> UserState:
+        """Convert a stored hash into the UserState used by the bot"""
+        merged = dict(DEFAULT_SETTINGS, **(raw or {}))
+        settings = SharedUserState()
+        settings.tone_id = enum_index(TONES, merged["tone"], DEFAULT_TONE)
+        settings.language_id = enum_index(LANGUAGES, merged["language"], DEFAULT_LANGUAGE)
+        settings.notifications = merged["notifications"] == "1"
+        settings.usage_day = day_from_str(merged.get("date"))
+        settings.used = int(merged.get("used") or 0)
+        settings.premium_until = day_from_str(merged.get("unlimited_until"))
+        settings.message_count = int(merged.get("messages") or 0)
+        return settings
+
+    def get_settings(self, user_id) -> UserState:
+        """Return the user's settings; assigning a field writes it through"""
+        settings = self._to_settings(self.client.hgetall(self._user_key(user_id)))
+        settings._user_id = user_id
+        settings._backend = self
+        return settings
+
+    def set_setting(self, user_id, field: str, value):
+        """Update a single settings field"""
+        if isinstance(value, bool):
+            value = "1" if value else "0"
+        key = self._user_key(user_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(key, field, value)
+        pipe.expire(key, SETTINGS_TTL)
+        pipe.execute()
+
+    def set_premium_until(self, user_id, expiry: str):
+        """Grant premium until the given YYYY-MM-DD date"""
+        self.set_setting(user_id, "unlimited_until", expiry)
+
+    def incr_message_count(self, user_id) -> int:
+        """Count a message for ad frequency, return the new total"""
+        return int(self.client.hincrby(self._user_key(user_id), "messages", 1))
+
+    def consume_prompt(self, user_id, today: str, limit: int):
+        """Atomically consume one prompt. Returns (allowed, remaining)"""
+        allowed, remaining = self._consume(
+            keys=[self._user_key(user_id)], args=[today, limit, SETTINGS_TTL]
+        )
+        return self._quota_result(allowed, remaining)
+
+    def _quota_result(self, allowed, remaining):
+        remaining = int(remaining)
+        return bool(int(allowed)), (None if remaining < 0 else remaining)
+
+    # ------------------------------------------------------------------------
+    # Ads
+    # ------------------------------------------------------------------------
+
+    def count_ad(self, user_id, today: str):
+        """Count one ad for the user today (atomic across instances).
+
+        Returns (ads counted today including this one, index of the last ad
+        shown or -1).
+        """
+        key = self._ads_key(user_id, today)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hincrby(key, "shown", 1)
+        pipe.hget(key, "last")
+        pipe.expire(key, ADS_TTL)
+        shown, last, _ = pipe.execute()
+        return int(shown), (int(last) if last is not None else -1)
+
+    def set_last_ad(self, user_id, today: str, index: int):
+        """Remember the ad just shown so the next pick avoids repeating it"""
+        self.client.hset(self._ads_key(user_id, today), "last", index)
+
+    # ------------------------------------------------------------------------
+    # Conversation history
+    # ------------------------------------------------------------------------
+
+    def get_history(self, user_id) -> list:
+        """Return the user's conversation history"""
+        return [json.loads(t) for t in self.client.lrange(self._history_key(user_id), 0, -1)]
+
+    def append_history(self, user_id, turns: list):
+        """Append turns, cap the list and refresh the expiry in one transaction"""
+        key = self._history_key(user_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.rpush(key, *[json.dumps(t, ensure_ascii=False) for t in turns])
+        pipe.ltrim(key, -self.history_limit, -1)
+        pipe.expire(key, HISTORY_TTL)
+        pipe.execute()
+
+    def clear_history(self, user_id):
+        """Forget the user's conversation"""
+        self.client.delete(self._history_key(user_id))
+
+    # ------------------------------------------------------------------------
+    # Users
+    # ------------------------------------------------------------------------
+
+    def iter_user_ids(self):
+        """Yield the IDs of all known users (incremental SCAN)"""
+        prefix = f"{self.prefix}:user:"
+        for key in self.client.scan_iter(match=f"{prefix}*", count=1000):
+            yield int(key[len(prefix):])
+
+    def delete_user(self, user_id):
+        """Remove all state for a user"""
+        self.client.delete(self._user_key(user_id), self._history_key(user_id))
+
+    # ------------------------------------------------------------------------
+    # Coupons
+    # ------------------------------------------------------------------------
+
+    def claim_coupon(self, nonce: str, ttl: int) -> bool:
+        """Mark a coupon nonce as redeemed; False if another instance already did.
+
+        Coupon keys are not prefixed per bot: a coupon is redeemed once overall.
+        """
+        return bool(self.client.set(f"{KEY_PREFIX}:coupon:{nonce}", 1, nx=True, ex=max(ttl, 1)))
+
+    # ------------------------------------------------------------------------
+    # Combined reads
+    # ------------------------------------------------------------------------
+
+    def consume_and_load(self, user_id, today: str, limit: int):
+        """Consume a prompt and fetch the history in a single round trip.
+
+        Returns (allowed, remaining, history)
+        """
+        pipe = self.client.pipeline(transaction=False)
+        self._consume(keys=[self._user_key(user_id)], args=[today, limit, SETTINGS_TTL], client=pipe)
+        pipe.lrange(self._history_key(user_id), 0, -1)
+        (allowed, remaining), raw_history = pipe.execute()
+        allowed, remaining = self._quota_result(allowed, remaining)
+        return allowed, remaining, [json.loads(t) for t in raw_history]
+
+
+def open_state_backend(url: str, history_limit: int = 20):
+    """Open the configured shared state backend, or None for in-memory state"""
+    if not url:
+        return None
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        logger.info("Using shared Redis state backend")
+        return RedisStateBackend.from_url(url, history_limit=history_limit)
+    raise ValueError(f"Unsupported STATE_BACKEND_URL: {url}")
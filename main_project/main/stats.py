@@ -0,0 +1,334 @@
+"""
+RG Assistant - Usage statistics
+
+Counters and distinct-user sketches are updated as events happen, one bucket
+per day, so /stats never has to scan the user tables. Distinct users are
+counted with HyperLogLog (4 KB per sketch, about 1.6% error); sketches of
+several days merge into weekly/monthly actives.
+
+Recent days are kept in STATS_PATH (JSON); older days are summarized into
+its history. For offline analysis, export everything (several worker files
+are merged) to a compact columnar file:
+
+    python -m main.stats export stats.json stats.json.1 -o usage.rgcol
+    python -m main.stats show usage.rgcol
+"""
+
+import array
+import base64
+import hashlib
+import json
+import math
+import os
+import struct
+import threading
+import zlib
+
+from main.user_state import day_to_str, today_epoch_day
+
+# HyperLogLog precision: 2^12 registers
+HLL_PRECISION = 12
+
+# Days kept with full sketches; older days keep only their summary row
+RETAIN_DAYS = 35
+
+COUNTERS = ("prompts", "limit_hits", "voice", "documents", "photos", "coupons", "premium_days")
+SKETCHES = ("active", "premium")
+
+# Export columns: day, the counters, then the estimated distinct users
+COLUMNS = ("day",) + COUNTERS + ("active_users", "premium_users")
+
+COLUMNAR_MAGIC = b"RGCOL001"
+
+
+# ============================================================================
+# HYPERLOGLOG
+# ============================================================================
+
+class HyperLogLog:
+    """Distinct count estimator over integer IDs"""
+
+    __slots__ = ("registers",)
+
+    M = 1 << HLL_PRECISION
+    _ALPHA = 0.7213 / (1 + 1.079 / M)
+
+    def __init__(self, registers: bytes = None):
+        self.registers = bytearray(registers) if registers else bytearray(self.M)
+
+    def add(self, item: int):
+        h = int.from_bytes(hashlib.blake2b(item.to_bytes(8, "little", signed=True), digest_size=8).digest(), "little")
+        index = h >> (64 - HLL_PRECISION)
+        rest = h & ((1 << (64 - HLL_PRECISION)) - 1)
+        rank = (64 - HLL_PRECISION) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        """Union with another sketch (in place)"""
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        m = self.M
+        estimate = self._ALPHA * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Small range: linear counting is more accurate
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def to_str(self) -> str:
+        return base64.b64encode(zlib.compress(bytes(self.registers), 1)).decode()
+
+    @classmethod
+    def from_str(cls, value: str) -> "HyperLogLog":
+        return cls(zlib.decompress(base64.b64decode(value)))
+
+
+# ============================================================================
+# DAILY BUCKETS
+# ============================================================================
+
+class DayStats:
+    """Counters and sketches for one day"""
+
+    __slots__ = ("day", "counters", "sketches")
+
+    def __init__(self, day: int):
+        self.day = day
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.sketches = {name: HyperLogLog() for name in SKETCHES}
+
+    def summary(self) -> dict:
+        row = {"day": self.day, **self.counters}
+        row["active_users"] = self.sketches["active"].count()
+        row["premium_users"] = self.sketches["premium"].count()
+        return row
+
+    def to_dict(self) -> dict:
+        return {
+            "day": self.day,
+            "counters": self.counters,
+            "sketches": {name: sketch.to_str() for name, sketch in self.sketches.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DayStats":
+        stats = cls(data["day"])
+        stats.counters.update(data["counters"])
+        for name, value in data["sketches"].items():
+            stats.sketches[name] = HyperLogLog.from_str(value)
+        return stats
+
+    def merge(self, other: "DayStats"):
+        for name, value in other.counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+        for name, sketch in other.sketches.items():
+            self.sketches[name].merge(sketch)
+
+
+class UsageStats:
+    """Rolling per-day aggregates, updated in O(1) per event"""
+
+    def __init__(self, path: str = "", retain_days: int = RETAIN_DAYS):
+        self.path = path
+        self.retain_days = retain_days
+        self.days = {}      # epoch day -> DayStats
+        self.history = []   # summary rows of days older than retain_days
+        self._lock = threading.Lock()
+
+    def _bucket(self, day: int = None) -> DayStats:
+        day = today_epoch_day() if day is None else day
+        bucket = self.days.get(day)
+        if bucket is None:
+            bucket = self.days[day] = DayStats(day)
+            self._expire(day)
+        return bucket
+
+    def _expire(self, today: int):
+        for day in sorted(self.days):
+            if day > today - self.retain_days:
+                break
+            self.history.append(self.days.pop(day).summary())
+
+    # ------------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------------
+
+    def record_prompt(self, user_id: int, allowed: bool, premium: bool = False):
+        """A message/voice/document counted against the daily quota"""
+        with self._lock:
+            bucket = self._bucket()
+            if not allowed:
+                bucket.counters["limit_hits"] += 1
+                return
+            bucket.counters["prompts"] += 1
+            bucket.sketches["active"].add(user_id)
+            if premium:
+                bucket.sketches["premium"].add(user_id)
+
+    def incr(self, counter: str, amount: int = 1):
+        with self._lock:
+            self._bucket().counters[counter] += amount
+
+    # ------------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------------
+
+    def today(self) -> dict:
+        with self._lock:
+            return self._bucket().summary()
+
+    def distinct_users(self, days: int, sketch: str = "active") -> int:
+        """Distinct users over the last `days` days (including today)"""
+        today = today_epoch_day()
+        merged = HyperLogLog()
+        with self._lock:
+            for day in range(today - days + 1, today + 1):
+                bucket = self.days.get(day)
+                if bucket is not None:
+                    merged.merge(bucket.sketches[sketch])
+        return merged.count()
+
+    def totals(self, days: int) -> dict:
+        """Counter sums over the last `days` days"""
+        today = today_epoch_day()
+        totals = dict.fromkeys(COUNTERS, 0)
+        with self._lock:
+            for day in range(today - days + 1, today + 1):
+                bucket = self.days.get(day)
+                if bucket is not None:
+                    for name, value in bucket.counters.items():
+                        totals[name] += value
+        return totals
+
+    def rows(self) -> list:
+        """Summary rows for all days, oldest first"""
+        with self._lock:
+            return self.history + [self.days[day].summary() for day in sorted(self.days)]
+
+    # ------------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------------
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "days": [bucket.to_dict() for bucket in self.days.values()],
+                "history": list(self.history),
+            }
+
+    def save(self):
+        """Write the aggregates to STATS_PATH (atomic replace)"""
+        if not self.path:
+            return
+        data = self.to_dict()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        """Restore aggregates saved by the previous run"""
+        if not self.path or not os.path.exists(self.path):
+            return
+        self.merge_file(self.path)
+
+    def merge_file(self, path: str):
+        """Add the aggregates from a saved stats file (e.g. another worker's)"""
+        with open(path, encoding="utf-8") as f:
+            self.merge(json.load(f))
+
+    def merge(self, data: dict):
+        """Add aggregates in to_dict() form; sketches of the same day are unioned"""
+        with self._lock:
+            for item in data.get("days", []):
+                bucket = DayStats.from_dict(item)
+                if bucket.day in self.days:
+                    self.days[bucket.day].merge(bucket)
+                else:
+                    self.days[bucket.day] = bucket
+            self.history.extend(data.get("history", []))
+            self._expire(today_epoch_day())
+
+
+# ============================================================================
+# COLUMNAR EXPORT
+# ============================================================================
+# Layout: MAGIC, header length (<I), JSON header {"rows", "columns"}, then one
+# zlib-compressed array of signed 64-bit ints per column in header order.
+
+def export_columnar(rows: list, path: str):
+    """Write summary rows as one compressed int64 array per column"""
+    merged = {}
+    for row in rows:
+        # Summary rows for the same day (history of several workers) are
+        # summed, so their distinct user estimates are upper bounds
+        target = merged.setdefault(row["day"], dict.fromkeys(COLUMNS, 0))
+        for column in COLUMNS:
+            target[column] = row["day"] if column == "day" else target[column] + row.get(column, 0)
+
+    ordered = [merged[day] for day in sorted(merged)]
+    blocks = [zlib.compress(array.array("q", (row[c] for row in ordered)).tobytes()) for c in COLUMNS]
+    header = json.dumps({
+        "rows": len(ordered),
+        "columns": [{"name": c, "type": "int64", "bytes": len(b)} for c, b in zip(COLUMNS, blocks)],
+    }).encode()
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(COLUMNAR_MAGIC + struct.pack("<I", len(header)) + header)
+        for block in blocks:
+            f.write(block)
+    os.replace(tmp_path, path)
+
+
+def read_columnar(path: str, columns: list = None) -> dict:
+    """Read an export as {column: array}; only the requested columns are decompressed"""
+    with open(path, "rb") as f:
+        if f.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+            raise ValueError(f"{path} is not a columnar stats export")
+        (header_size,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(header_size))
+        result = {}
+        for column in header["columns"]:
+            block = f.read(column["bytes"])
+            if columns is None or column["name"] in columns:
+                result[column["name"]] = array.array("q", zlib.decompress(block))
+        return result
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Usage statistics export")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="merge stats files into a columnar export")
+    export.add_argument("files", nargs="+", help="STATS_PATH files (one per worker)")
+    export.add_argument("-o", "--output", required=True)
+
+    show = commands.add_parser("show", help="print a columnar export")
+    show.add_argument("file")
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        # Sketches of the same day are merged, so users seen by several
+        # workers are counted once
+        stats = UsageStats()
+        for path in args.files:
+            stats.merge_file(path)
+        rows = stats.rows()
+        export_columnar(rows, args.output)
+        print(f"Exported {len({row['day'] for row in rows})} days to {args.output}")
+    else:
+        data = read_columnar(args.file)
+        print("  ".join(f"{c:>12}" for c in COLUMNS))
+        for i in range(len(data["day"])):
+            values = [day_to_str(data["day"][i])] + [str(data[c][i]) for c in COLUMNS[1:]]
+            print("  ".join(f"{v:>12}" for v in values))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+RG Assistant - Tabular data profiling
+
+CSV/TSV uploads are not pasted into the prompt. The file is read in chunks of
+CHUNK_ROWS rows and every column is summarized: inferred type, null count,
+min/max/mean/std and quartiles for numbers, distinct and most common values
+for text. Only that profile and a few sample rows go to the model, so a
+multi-megabyte dataset costs about as many tokens as a long message.
+
+Values are parsed with the csv module and built-ins (C loops that beat NumPy's
+string functions on short cells) into typed arrays; the numeric reductions
+(mean, std, quartiles) run on those arrays with NumPy when it is installed.
+Profiling is CPU bound, so the bot runs describe_table in a worker process.
+
+To profile a file locally:
+    python -m main.tabular data.csv
+"""
+
+import csv
+import io
+import math
+import re
+from array import array
+from collections import Counter
+from itertools import islice
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Rows converted per column batch
+CHUNK_ROWS = 20000
+
+# Columns profiled (wider tables are cut off to keep the prompt small)
+MAX_COLUMNS = 40
+
+# Bytes read to guess the delimiter and whether there is a header
+SNIFF_BYTES = 16384
+
+SAMPLE_ROWS = 5
+# Sample values are shortened to this many characters
+SAMPLE_VALUE_CHARS = 40
+
+TOP_VALUES = 5
+# Distinct values counted per column; beyond this only the most common are kept
+TRACK_VALUES = 5000
+
+# A column is numeric when at least this share of its values parse as numbers
+NUMERIC_MIN_SHARE = 0.95
+
+NULL_TOKENS = frozenset(("", "na", "n/a", "nan", "null", "none", "-"))
+BOOLEAN_TOKENS = frozenset(("true", "false", "yes", "no", "t", "f", "y", "n"))
+ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?")
+
+_NULL_LIST = sorted(NULL_TOKENS)
+
+
+def _parse_floats(values: list) -> tuple:
+    """Finite floats among values, and how many values did not parse"""
+    try:
+        numbers = array("d", map(float, values))
+    except ValueError:
+        pass
+    else:
+        if all(map(math.isfinite, numbers)):
+            return numbers, 0
+    numbers = array("d")
+    bad = 0
+    for value in values:
+        try:
+            number = float(value)
+        except ValueError:
+            bad += 1
+            continue
+        if math.isfinite(number):
+            numbers.append(number)
+    return numbers, bad
+
+
+def _quantile(ordered, q: float) -> float:
+    """Linear interpolation between closest ranks (NumPy's default method)"""
+    position = (len(ordered) - 1) * q
+    low = math.floor(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def _number(value: float) -> str:
+    return f"{value:.6g}"
+
+
+# ============================================================================
+# COLUMN PROFILE
+# ============================================================================
+
+class ColumnProfile:
+    """Running summary of one column, fed a chunk of values at a time"""
+
+    __slots__ = ("name", "count", "nulls", "non_numeric", "numbers", "counts", "pruned",
+                 "smallest", "largest", "max_length")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0         # non-null values
+        self.nulls = 0
+        self.non_numeric = 0
+        self.numbers = array("d")  # parsed values; None once the column is text
+        self.counts = Counter()
+        self.pruned = False    # counts no longer holds every distinct value
+        self.smallest = None   # text min/max (ISO dates sort correctly as text)
+        self.largest = None
+        self.max_length = 0
+
+    def add(self, values: list):
+        stripped = [value.strip() for value in values]
+        present = [value for value in stripped if len(value) > 4 or value.lower() not in NULL_TOKENS]
+        self.nulls += len(stripped) - len(present)
+        self.count += len(present)
+        if not present:
+            return
+
+        if self.numbers is not None:
+            numbers, bad = _parse_floats(present)
+            self.numbers.extend(numbers)
+            self.non_numeric += bad
+            if self.non_numeric > (1 - NUMERIC_MIN_SHARE) * self.count:
+                # Mostly text: stop parsing numbers
+                self.numbers = None
+        if self.non_numeric:
+            low, high = min(present), max(present)
+            self.smallest = low if self.smallest is None else min(self.smallest, low)
+            self.largest = high if self.largest is None else max(self.largest, high)
+
+        self.counts.update(present)
+        if len(self.counts) > TRACK_VALUES:
+            self.counts = Counter(dict(self.counts.most_common(TRACK_VALUES // 2)))
+            self.pruned = True
+        self.max_length = max(self.max_length, max(map(len, present)))
+
+    # ------------------------------------------------------------------------
+    # Summary
+    # ------------------------------------------------------------------------
+
+    def kind(self) -> str:
+        if not self.count:
+            return "empty"
+        if self.numbers is not None and self.non_numeric <= (1 - NUMERIC_MIN_SHARE) * self.count:
+            return "numeric"
+        lowered = {value.lower() for value in self.counts}
+        if not self.pruned and lowered <= BOOLEAN_TOKENS:
+            return "boolean"
+        if all(ISO_DATE.match(value) for value in self.counts):
+            return "date"
+        return "text"
+
+    def numeric_summary(self) -> dict:
+        """min/max/mean/std/quartiles of the parsed numbers"""
+        if not self.numbers:
+            return {}
+        if np is not None:
+            values = np.frombuffer(self.numbers, dtype=np.float64)
+            p25, median, p75 = np.quantile(values, (0.25, 0.5, 0.75))
+            return {
+                "integer": bool(np.all(values == np.floor(values))),
+                "min": float(values.min()),
+                "max": float(values.max()),
+                "mean": float(values.mean()),
+                "std": float(values.std()),
+                "p25": float(p25),
+                "median": float(median),
+                "p75": float(p75),
+            }
+
+        ordered = sorted(self.numbers)
+        mean = math.fsum(ordered) / len(ordered)
+        return {
+            "integer": all(value.is_integer() for value in ordered),
+            "min": ordered[0],
+            "max": ordered[-1],
+            "mean": mean,
+            "std": math.sqrt(math.fsum((value - mean) ** 2 for value in ordered) / len(ordered)),
+            "p25": _quantile(ordered, 0.25),
+            "median": _quantile(ordered, 0.5),
+            "p75": _quantile(ordered, 0.75),
+        }
+
+    def describe(self) -> str:
+        """One line for the prompt"""
+        kind = self.kind()
+        parts = [f"{self.nulls} nulls"]
+        categorical = kind in ("text", "boolean")
+
+        if kind == "numeric":
+            summary = self.numeric_summary()
+            if summary:
+                if summary["integer"]:
+                    kind = "integer"
+                    # Small sets of integers are usually codes or categories
+                    categorical = not self.pruned and len(self.counts) <= TOP_VALUES * 2
+                parts.append(
+                    f"min {_number(summary['min'])}, max {_number(summary['max'])}, "
+                    f"mean {_number(summary['mean'])}, std {_number(summary['std'])}"
+                )
+                parts.append(
+                    f"p25 {_number(summary['p25'])}, median {_number(summary['median'])}, "
+                    f"p75 {_number(summary['p75'])}"
+                )
+            if self.non_numeric:
+                parts.append(f"{self.non_numeric} non-numeric values")
+        elif kind == "date":
+            parts.append(f"from {self.smallest} to {self.largest}")
+
+        if categorical or kind == "date":
+            parts.append(f"{'≥' if self.pruned else ''}{len(self.counts)} distinct")
+        # Values seen once are not worth listing (mostly unique columns)
+        top = [(value, count) for value, count in self.counts.most_common(TOP_VALUES) if count > 1]
+        if categorical and top:
+            parts.append("top: " + ", ".join(
+                f"{_shorten(value)!r} {count * 100 / self.count:.0f}%" for value, count in top
+            ))
+        if kind == "text":
+            parts.append(f"max length {self.max_length}")
+
+        return f"- {self.name} ({kind}): " + "; ".join(parts)
+
+
+def _shorten(value: str, limit: int = SAMPLE_VALUE_CHARS) -> str:
+    return value if len(value) <= limit else value[:limit - 1] + "…"
+
+
+# ============================================================================
+# TABLE PROFILE
+# ============================================================================
+
+class TableProfile:
+    """Profile of a whole CSV file"""
+
+    def __init__(self, header: list, delimiter: str):
+        self.delimiter = delimiter
+        self.total_columns = len(header)
+        self.columns = [ColumnProfile(name or f"column_{i + 1}") for i, name in enumerate(header[:MAX_COLUMNS])]
+        self.rows = 0
+        self.sample = []
+
+    def add_rows(self, rows: list):
+        width = len(self.columns)
+        rows = [(row + [""] * width)[:width] if len(row) != width else row for row in rows]
+        if len(self.sample) < SAMPLE_ROWS:
+            self.sample.extend(rows[:SAMPLE_ROWS - len(self.sample)])
+        self.rows += len(rows)
+        for column, values in zip(self.columns, zip(*rows)):
+            column.add(list(values))
+
+    def describe(self, name: str = "data") -> str:
+        lines = [f"Dataset: {name}, {self.rows} rows x {self.total_columns} columns"]
+        if self.total_columns > len(self.columns):
+            lines[0] += f" (first {len(self.columns)} profiled)"
+        lines += ["", "Columns:"] + [column.describe() for column in self.columns]
+
+        if self.sample:
+            sample = io.StringIO()
+            writer = csv.writer(sample, delimiter=self.delimiter, lineterminator="\n")
+            writer.writerow([column.name for column in self.columns])
+            for row in self.sample:
+                writer.writerow([_shorten(value) for value in row])
+            lines += ["", "Sample rows:", sample.getvalue().rstrip("\n")]
+        return "\n".join(lines)
+
+
+def sniff_dialect(data: bytes, delimiter: str = None) -> tuple:
+    """(delimiter, has_header) guessed from the start of the file"""
+    text = data[:SNIFF_BYTES].decode("utf-8-sig", errors="ignore")
+    # Don't sniff a line cut off at the end of the sample
+    text = text[:text.rfind("\n") + 1] or text
+    sniffer = csv.Sniffer()
+    if delimiter is None:
+        try:
+            delimiter = sniffer.sniff(text, delimiters=",;\t|").delimiter
+        except csv.Error:
+            delimiter = ","
+    try:
+        has_header = sniffer.has_header(text)
+    except csv.Error:
+        has_header = True
+    return delimiter, has_header
+
+
+def profile_csv(data: bytes, delimiter: str = None, chunk_rows: int = CHUNK_ROWS) -> TableProfile:
+    """Profile CSV bytes chunk by chunk.
+
+    Raises ValueError (UnicodeDecodeError, csv.Error) if the file is not
+    UTF-8 text in a CSV dialect.
+    """
+    delimiter, has_header = sniff_dialect(data, delimiter)
+    stream = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", newline="")
+    reader = csv.reader(stream, delimiter=delimiter)
+    try:
+        first = next(reader, None)
+        if first is None:
+            raise ValueError("The file is empty")
+        if has_header:
+            table = TableProfile(first, delimiter)
+        else:
+            table = TableProfile([f"column_{i + 1}" for i in range(len(first))], delimiter)
+            table.add_rows([first])
+
+        while True:
+            rows = list(islice(reader, chunk_rows))
+            if not rows:
+                break
+            table.add_rows([row for row in rows if row])
+    except csv.Error as e:
+        raise ValueError(f"Could not parse the file as CSV: {e}") from e
+    return table
+
+
+def describe_table(data: bytes, name: str, delimiter: str = None) -> str:
+    """Profile text for the prompt (runs in a worker process)"""
+    return profile_csv(data, delimiter).describe(name)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Profile a CSV/TSV file")
+    parser.add_argument("file")
+    args = parser.parse_args()
+
+    with open(args.file, "rb") as f:
+        data = f.read()
+    start = time.perf_counter()
+    text = describe_table(data, args.file, "\t" if args.file.endswith(".tsv") else None)
+    print(text)
+    print(f"\n{len(data) / 1e6:.1f} MB profiled in {time.perf_counter() - start:.2f}s "
+          f"({'numpy' if np is not None else 'no numpy'}), {len(text)} characters")
@@ -1,10 +1,12 @@
 
 import os
+import bisect
 import logging
-import requests
 import json
-import tempfile
-import speech_recognition as sr
+import random
+import signal
+import threading
+from itertools import accumulate
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -15,18 +17,18 @@ load_dotenv(env_path)
 from telegram import Update
 from telegram.ext import (
     Application,
+    CallbackQueryHandler,
     MessageHandler,
     CommandHandler,
     ContextTypes,
+    TypeHandler,
     filters
 )
 from telegram import Voice, Document
 
-# Configure logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO
-)
+# Configure logging (queued JSON lines written by a background thread)
+from main.logging_setup import SAMPLED, configure_logging, set_update_context
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # ============================================================================
@@ -40,6 +42,23 @@ TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "YOUR_BOT_TOKEN_HERE")
 # Cohere AI Configuration (from your existing script.js)
 COHERE_API_KEY = os.environ.get("COHERE_API_KEY", "rr1AlC5J2MKJe5rgAwOE5h7Rtx6rRO7qjPZ7E8pH")
 COHERE_MODEL = os.environ.get("COHERE_MODEL", "command-a-03-2025")
+COHERE_API_URL = os.environ.get("COHERE_API_URL", "https://api.cohere.ai/v1/chat")
+
+# Number of worker processes (1 = single process, >1 = sharded by user_id)
+BOT_WORKERS = int(os.environ.get("BOT_WORKERS", "1"))
+
+# JSON file listing several bots to host in this process (see main/tenants.py).
+# When set, TELEGRAM_BOT_TOKEN and BOT_WORKERS are not used.
+BOTS_CONFIG = os.environ.get("BOTS_CONFIG", "")
+
+# Sharded workers each hold only their own users' in-memory state
+SHARDED = BOT_WORKERS > 1 and not BOTS_CONFIG
+
+# Heavy modules are imported on first use so text replies can start serving
+# right away; with preloading on they are imported in the background after
+# startup instead of delaying the first voice message.
+PRELOAD_HEAVY_MODULES = os.environ.get("PRELOAD_HEAVY_MODULES", "true").lower() == "true"
+HEAVY_MODULES = ["requests", "speech_recognition", "pydub"]
 
 # ============================================================================
 # CUSTOM BOT IDENTITY
@@ -64,16 +83,46 @@ Rosch Ebori is the visionary founder who developed this AI assistant to help peo
 This bot is powered by advanced AI technology from Cohere, customized with RG-TECH's unique personality and capabilities.
 """
 
+# Telegram username for business enquiries (without the @)
+CREATOR_CONTACT = "RoschEbori"
+
+# How to pay for premium (shown by /upgrade)
+PAYMENT_INFO = """💰 Price: 1500 XAF (2 weeks)
+
+━━━━━━━━━━━━━━━━━━━━━━
+
+💳 Payment Methods:
+
+📱 MTN MOMO USSD:
+Dial: *126*9*650674817*1500#
+
+🏦 Orange Money:
+Account: +237-659188549
+
+━━━━━━━━━━━━━━━━━━━━━━
+
+⚠️ After payment:
+Contact @rosch_ebori on Telegram
+OR WhatsApp: +237-650674817
+
+They will give you a coupon code."""
+
+def identity_responses(bot_name: str, company_name: str, creator_name: str, creator_info: str) -> dict:
+    """Custom responses for questions about the bot and its creator"""
+    created_by = bot_name + " was created by " + creator_name + ", the founder of " + company_name + ". " + creator_info
+    about_company = company_name + " is a technology company founded by " + creator_name + ". " + creator_info
+    return {
+        "who created you": created_by,
+        "who made you": created_by,
+        "who is your creator": created_by,
+        "what company": about_company,
+        "what is " + company_name.lower(): about_company,
+        "who is " + creator_name.split()[0].lower(): creator_name + " is the founder and owner of " + company_name + ", a tech entrepreneur and developer who created this AI assistant.",
+        "about yourself": bot_name + " - Your AI Assistant\n\n" + creator_info,
+    }
+
 # Custom responses for specific questions
-CUSTOM_RESPONSES = {
-    "who created you": BOT_NAME + " was created by " + CREATOR_NAME + ", the founder of " + COMPANY_NAME + ". " + CREATOR_INFO,
-    "who made you": BOT_NAME + " was created by " + CREATOR_NAME + ", the founder of " + COMPANY_NAME + ". " + CREATOR_INFO,
-    "who is your creator": BOT_NAME + " was created by " + CREATOR_NAME + ", the founder of " + COMPANY_NAME + ". " + CREATOR_INFO,
-    "what company": COMPANY_NAME + " is a technology company founded by " + CREATOR_NAME + ". " + CREATOR_INFO,
-    "what is rg-tech": COMPANY_NAME + " is a technology company founded by " + CREATOR_NAME + ". " + CREATOR_INFO,
-    "who is rosch": CREATOR_NAME + " is the founder and owner of " + COMPANY_NAME + ". He is a tech entrepreneur and developer who created this AI assistant.",
-    "about yourself": BOT_NAME + " - Your AI Assistant\n\n" + CREATOR_INFO,
-}
+CUSTOM_RESPONSES = identity_responses(BOT_NAME, COMPANY_NAME, CREATOR_NAME, CREATOR_INFO)
 
 # ============================================================================
 # MONETIZATION SETTINGS
@@ -110,59 +159,324 @@ AFFILIATE_LINKS = {
     }
 }
 
+# Telegram user IDs allowed to use admin commands (comma separated)
+ADMIN_USER_IDS = {
+    int(uid) for uid in os.environ.get("ADMIN_USER_IDS", "").replace(" ", "").split(",") if uid
+}
+
 # Ad display settings
 ADS_FREQUENCY = int(os.environ.get("ADS_FREQUENCY", "5"))  # Show ads every N messages
-
-def get_ad_message() -> str:
-    """Generate advertisement message"""
-    import random
-    
-    ads = [
-        "📢 **Promote Your Bot!**\n\n"
+ADS_DAILY_CAP = int(os.environ.get("ADS_DAILY_CAP", "3"))  # Max ads per user per day
+
+# Ad rotation: higher weight = shown more often. Affiliate programs are added
+# below so their impressions and clicks are tracked the same way.
+ADS = [
+    {
+        "id": "promote",
+        "weight": 1,
+        "text": "📢 **Promote Your Bot!**\n\n"
         "Want to reach more users? Use @BotFather to make your bot public and grow your audience!\n\n"
         "Once you have 1,000 subscribers, apply for Telegram BotAds to monetize!",
-        
-        "💰 **Earn with RG Assistant!**\n\n"
-        "Share RG Assistant with friends and family!\n"
+    },
+    {
+        "id": "earn",
+        "weight": 2,
+        "text": "💰 **Earn with {bot_name}!**\n\n"
+        "Share {bot_name} with friends and family!\n"
         "The more users, the faster we can enable BotAds and generate income!\n\n"
         "Use /refer to get your referral link!",
-        
-        "🚀 **Grow Your Business**\n\n"
+    },
+    {
+        "id": "business",
+        "weight": 2,
+        "text": "🚀 **Grow Your Business**\n\n"
         "Need a custom Telegram bot for your business?\n"
-        "Contact @RoschEbori for professional bot development services!",
-    ]
+        "Contact @{contact} for professional bot development services!",
+        "links": ["https://t.me/{contact}"],
+    },
+] + [
+    {
+        "id": f"affiliate:{key}",
+        "weight": 1,
+        "text": f"🔗 **{program['name']}**\n\nCheck out our partner offers — tap below for the link!",
+        "links": program["links"],
+    }
+    for key, program in AFFILIATE_LINKS.items()
+]
+
+# Precomputed cumulative weights for O(log n) weighted picks
+AD_INDEX = {ad["id"]: i for i, ad in enumerate(ADS)}
+_AD_CUMULATIVE_WEIGHTS = list(accumulate(ad["weight"] for ad in ADS))
+
+def _pick_ad_index(exclude=-1):
+    """Weighted random ad index, avoiding `exclude` when possible"""
+    total = _AD_CUMULATIVE_WEIGHTS[-1]
+    for _ in range(3):
+        index = bisect.bisect_right(_AD_CUMULATIVE_WEIGHTS, random.random() * total)
+        if index != exclude:
+            break
+    return index
+
+def pick_ad(user_id=None):
+    """Choose the next ad for a user, or None if they hit ADS_DAILY_CAP"""
+    if user_id is None:
+        return ADS[_pick_ad_index()]
+    
+    if shared_state is not None:
+        # Counted in the backend: instances share the cap
+        today = get_today()
+        shown, last_ad = shared_state.count_ad(user_id, today)
+        if shown > ADS_DAILY_CAP:
+            return None
+        index = _pick_ad_index(exclude=last_ad)
+        shared_state.set_last_ad(user_id, today, index)
+        return ADS[index]
+    
+    settings = get_user_settings(user_id)
+    settings.roll_day(today_epoch_day())
+    if settings.ads_shown >= ADS_DAILY_CAP:
+        return None
     
-    return random.choice(ads)
+    index = _pick_ad_index(exclude=settings.last_ad)
+    settings.ads_shown += 1
+    settings.last_ad = index
+    return ADS[index]
+
+def brand_text(text: str) -> str:
+    """Fill the current bot's name and contact into an ad text or link"""
+    tenant = current_tenant()
+    return text.replace("{bot_name}", tenant.bot_name).replace("{contact}", tenant.contact)
+
+def get_ad_message() -> str:
+    """Generate advertisement message"""
+    return brand_text(pick_ad()["text"])
+
+def get_ad_keyboard(ad):
+    """Inline button for ads that have a link (clicks are tracked)"""
+    if not ad.get("links"):
+        return None
+    from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+    return InlineKeyboardMarkup([[InlineKeyboardButton("👉 Learn more", callback_data=f"ad:{ad['id']}")]])
+
+# ============================================================================
+# BOT TENANTS
+# ============================================================================
+
+from main.tenants import Tenant, TenantLocal, activate_tenant, current_tenant, get_tenant, set_default_tenant
 
+# The bot configured above. With BOTS_CONFIG it only provides the defaults for
+# the hosted bots; per-bot state below is declared with TenantLocal.
+set_default_tenant(Tenant(
+    "default", TELEGRAM_BOT_TOKEN, BOT_NAME, COMPANY_NAME, CREATOR_NAME, CREATOR_INFO,
+    CUSTOM_RESPONSES, ADMIN_USER_IDS, default=True, contact=CREATOR_CONTACT, payment_info=PAYMENT_INFO,
+))
+
+# ============================================================================
+# AD ANALYTICS
+# ============================================================================
+
+from main.analytics import AnalyticsPipeline
+
+# Impression/click log: .db/.sqlite for SQLite, anything else for JSON lines
+ANALYTICS_PATH = os.environ.get("ANALYTICS_PATH", str(Path(__file__).parent.parent / "analytics.db"))
+ANALYTICS_FLUSH_INTERVAL = float(os.environ.get("ANALYTICS_FLUSH_INTERVAL", "10"))
+
+ad_analytics = AnalyticsPipeline(ANALYTICS_PATH, interval=ANALYTICS_FLUSH_INTERVAL)
+
+# ============================================================================
+# UPDATE RECORDING
+# ============================================================================
+
+from main.replay import UpdateRecorder
+
+# Incoming updates are appended to this log for replays (python -m main.replay);
+# empty = off. Text, names and IDs are redacted unless RECORD_REDACT=false.
+RECORD_UPDATES_PATH = os.environ.get("RECORD_UPDATES_PATH", "")
+RECORD_REDACT = os.environ.get("RECORD_REDACT", "true").lower() == "true"
+
+update_recorder = UpdateRecorder(RECORD_UPDATES_PATH, redact=RECORD_REDACT)
+
+
+# ============================================================================
+# USAGE STATISTICS
+# ============================================================================
+
+from main.stats import UsageStats
+
+# Daily counters and distinct-user sketches (saved on shutdown, restored on start)
+STATS_PATH = os.environ.get("STATS_PATH", str(Path(__file__).parent.parent / "stats.json"))
+
+usage_stats = TenantLocal("usage_stats", lambda tenant: UsageStats(tenant.path(STATS_PATH)))
+
+# Sharded workers save their stats this often, so /stats on any worker can
+# merge the other workers' sketches
+STATS_SAVE_INTERVAL = float(os.environ.get("STATS_SAVE_INTERVAL", "60"))
 
 # ============================================================================
 # USER SETTINGS & STATE
 # ============================================================================
 
+from main.history import ROLE_CHATBOT, ROLE_USER, ConversationHistory
+from main.user_state import UserState, day_to_str, today_epoch_day
+
 # Store user settings (in memory - use database for production)
-user_settings = {}
-user_conversations = {}
-user_message_counts = {}  # Track message count for ad frequency
+# user_id -> UserState (settings, daily usage and message count for ads)
+user_settings = TenantLocal("user_settings", lambda tenant: {})
+# user_id -> ConversationHistory (ring buffer of the last HISTORY_LIMIT turns)
+user_conversations = TenantLocal("user_conversations", lambda tenant: {})
 
 # Usage limits
 FREE_DAILY_LIMIT = 10
 PREMIUM_DURATION_DAYS = 14  # 2 weeks
 
+# Conversation history kept per user (10 exchanges)
+HISTORY_LIMIT = 20
+
+# Shared state for multi-instance deployments (e.g. redis://host:6379/0).
+# When unset, state lives in the in-memory dicts above.
+STATE_BACKEND_URL = os.environ.get("STATE_BACKEND_URL", "")
+
+from main.state_backend import KEY_PREFIX, open_state_backend
+shared_state = open_state_backend(STATE_BACKEND_URL, history_limit=HISTORY_LIMIT)
+if shared_state is not None:
+    # One Redis connection pool, keys prefixed per bot
+    shared_state = TenantLocal("shared_state", lambda tenant, backend=shared_state: backend.with_prefix(tenant.key_prefix(KEY_PREFIX)))
+
+# In-memory state is written here on shutdown and restored lazily on startup.
+# On Fly.io, point this at a mounted volume (e.g. /data/state.snapshot).
+STATE_SNAPSHOT_PATH = os.environ.get("STATE_SNAPSHOT_PATH", str(Path(__file__).parent.parent / "state.snapshot"))
+
+# Seconds allowed for in-flight work on shutdown before the snapshot is
+# forced (keep below kill_timeout in fly.toml)
+DRAIN_TIMEOUT = float(os.environ.get("DRAIN_TIMEOUT", "25"))
+
+_snapshot_lock = threading.Lock()
+_draining = False
+
+def save_usage_stats():
+    """Write the usage aggregates to STATS_PATH"""
+    try:
+        usage_stats.save()
+    except OSError as e:
+        logger.error("Failed to save usage stats: %s", e)
+
+_stats_saver_stop = threading.Event()
+
+def save_usage_stats_periodically():
+    """Keep this worker's stats file fresh for the other workers' /stats"""
+    while not _stats_saver_stop.wait(STATS_SAVE_INTERVAL):
+        save_usage_stats()
+
+def cluster_usage_stats():
+    """Usage stats of all sharded workers (just this process otherwise)
+
+    The other workers contribute their STATS_PATH.<slot> files, so their
+    numbers lag by up to STATS_SAVE_INTERVAL.
+    """
+    if not SHARDED or not usage_stats.path:
+        return usage_stats
+    merged = UsageStats()
+    merged.merge(usage_stats.to_dict())
+    for slot in range(BOT_WORKERS):
+        path = f"{STATS_PATH}.{slot}"
+        if path == usage_stats.path or not os.path.exists(path):
+            continue
+        try:
+            merged.merge_file(path)
+        except (OSError, ValueError) as e:
+            logger.warning("Skipping stats file %s: %s", path, e)
+    return merged
+
+def restore_user(user_id):
+    """Restore a user's state from the startup snapshot on first access"""
+    state_snapshot = current_tenant().snapshot
+    if state_snapshot is None or user_id in user_settings:
+        return
+    record = state_snapshot.take(user_id)
+    if record is None:
+        return
+    settings = UserState.from_record(record["settings"])
+    if record.get("messages"):
+        # Snapshots written before UserState kept the count separately
+        settings.message_count = record["messages"]
+    user_settings[user_id] = settings
+    if record.get("history"):
+        user_conversations[user_id] = ConversationHistory.from_list(record["history"], HISTORY_LIMIT)
+
+def load_state_snapshot(path=None):
+    """Open the snapshot written by the previous run (in-memory state only)"""
+    if shared_state is not None:
+        return
+    from main.snapshot import open_snapshot
+    tenant = current_tenant()
+    tenant.snapshot = open_snapshot(path or tenant.path(STATE_SNAPSHOT_PATH))
+
+def snapshot_records():
+    """(user_id, record) for every user in memory, copied in one pass.
+
+    Safe to call from the drain watchdog's thread while updates are still
+    being handled: a copy that races a change is simply taken again.
+    """
+    for _ in range(10):
+        try:
+            user_ids = set(user_settings) | set(user_conversations)
+            return [
+                (user_id, {
+                    "settings": (user_settings.get(user_id) or UserState()).to_record(),
+                    "history": user_conversations[user_id].to_chat_history() if user_id in user_conversations else [],
+                })
+                for user_id in user_ids
+            ]
+        except (RuntimeError, KeyError):
+            # "changed size during iteration", or a user forgotten meanwhile
+            continue
+    raise RuntimeError("User state kept changing while it was copied")
+
+def save_state_snapshot(path=None, final: bool = True):
+    """Write all in-memory user state to the snapshot file.
+    
+    The drain watchdog saves with final=False while updates may still be in
+    flight; the final save on shutdown runs once and still writes the changes
+    made after the watchdog's save.
+    """
+    tenant = current_tenant()
+    path = path or tenant.path(STATE_SNAPSHOT_PATH)
+    if shared_state is not None or not path:
+        return
+    
+    with _snapshot_lock:
+        if tenant.snapshot_saved:
+            return
+        if final:
+            tenant.snapshot_saved = True
+        
+        from main.snapshot import open_snapshot, write_snapshot
+        try:
+            count = write_snapshot(path, snapshot_records(), previous=tenant.snapshot)
+            # Users not in memory are carried over from the file just written
+            # if there is another save
+            tenant.snapshot = None if final else open_snapshot(path)
+            logger.info("State snapshot saved: %d users -> %s", count, path)
+        except Exception as e:
+            logger.error("Failed to save state snapshot: %s", e)
+
 def get_user_settings(user_id):
-    """Get user settings, create default if not exists"""
-    if user_id not in user_settings:
-        user_settings[user_id] = {
-            "tone": "friendly",
-            "language": "en",
-            "notifications": True,
-            "usage": {"date": None, "used": 0, "unlimited_until": None}
-        }
-    return user_settings[user_id]
+    """Get user settings (a UserState), create default if not exists"""
+    if shared_state is not None:
+        return shared_state.get_settings(user_id)
+    restore_user(user_id)
+    settings = user_settings.get(user_id)
+    if settings is None:
+        settings = user_settings[user_id] = UserState()
+    return settings
 
 def set_user_tone(user_id, tone):
     """Set user's response tone"""
+    if shared_state is not None:
+        shared_state.set_setting(user_id, "tone", tone)
+        return tone
     settings = get_user_settings(user_id)
-    settings["tone"] = tone
+    settings.tone = tone
     return tone
 
 def get_today():
@@ -172,78 +486,110 @@ def get_today():
 
 def is_premium_active(user_id):
     """Check if user has premium"""
-    settings = get_user_settings(user_id)
-    usage = settings.get("usage", {})
-    unlimited_until = usage.get("unlimited_until")
-    if not unlimited_until:
-        return False
-    return unlimited_until >= get_today()
+    return get_user_settings(user_id).is_premium(today_epoch_day())
 
 def check_and_consume_prompt(user_id):
     """Check if user can send a message, consume 1 if allowed"""
+    if shared_state is not None:
+        can_send, remaining = shared_state.consume_prompt(user_id, get_today(), FREE_DAILY_LIMIT)
+    else:
+        can_send, remaining = consume_local_prompt(user_id)
+    # remaining is None for premium users
+    usage_stats.record_prompt(user_id, can_send, premium=can_send and remaining is None)
+    return can_send, remaining
+
+def consume_local_prompt(user_id):
+    """Quota check against the in-memory user state"""
     settings = get_user_settings(user_id)
-    usage = settings["usage"]
-    today = get_today()
+    today = today_epoch_day()
     
     # Reset daily usage if new day
-    if usage.get("date") != today:
-        usage["date"] = today
-        usage["used"] = 0
+    settings.roll_day(today)
     
     # Check if premium
-    if is_premium_active(user_id):
+    if settings.is_premium(today):
         return True, None
     
     # Check if under limit
-    if usage.get("used", 0) < FREE_DAILY_LIMIT:
-        usage["used"] = usage.get("used", 0) + 1
-        remaining = FREE_DAILY_LIMIT - usage["used"]
+    if settings.used < FREE_DAILY_LIMIT:
+        settings.used += 1
+        remaining = FREE_DAILY_LIMIT - settings.used
         return True, remaining
     
     # Limit reached
     return False, 0
 
-def apply_coupon_code(user_id, coupon_code):
+# Shared-secret for signed coupon codes (python -m main.coupons generate ...)
+COUPON_SECRET = os.environ.get("COUPON_SECRET", "")
+COUPON_REDEEMED_PATH = os.environ.get(
+    "COUPON_REDEEMED_PATH", str(Path(__file__).parent.parent / "coupons.redeemed")
+)
+
+# Shared codes from before signed coupons (CODE:days, comma separated).
+# Off by default: anyone can reuse them as often as they like.
+LEGACY_COUPON_CODES = {
+    code.strip().upper(): int(days)
+    for code, _, days in (
+        entry.partition(":") for entry in os.environ.get("LEGACY_COUPON_CODES", "").split(",")
+    )
+    if code.strip() and days
+}
+
+_redeemed_coupons = None
+
+def claim_coupon(coupon) -> bool:
+    """Mark a signed coupon as used (once across all instances; blocking I/O)"""
+    global _redeemed_coupons
+    if shared_state is not None:
+        ttl = (coupon.last_day - today_epoch_day() + 1) * 86400
+        return shared_state.claim_coupon(coupon.nonce.hex(), ttl)
+    if _redeemed_coupons is None:
+        from main.coupons import RedeemedNonces
+        _redeemed_coupons = RedeemedNonces(COUPON_REDEEMED_PATH)
+    return _redeemed_coupons.claim(coupon.nonce)
+
+async def apply_coupon_code(user_id, coupon_code):
     """Apply a coupon code for premium"""
     coupon_code = coupon_code.upper().strip()
     
-    # Valid coupon codes - only give these to customers who pay!
-    valid_coupons = {
-        "RG100": 14,   # 14 days - paid customer
-        "TEST1": 1,     # 1 day - testing
-    }
+    days = LEGACY_COUPON_CODES.get(coupon_code)
+    if days is None and COUPON_SECRET:
+        from main.coupons import verify
+        coupon = verify(COUPON_SECRET.encode(), coupon_code)
+        if coupon is not None:
+            import asyncio
+            if await asyncio.to_thread(claim_coupon, coupon):
+                days = coupon.days
     
-    if coupon_code in valid_coupons:
-        from datetime import datetime, timedelta
-        expiry_date = datetime.now() + timedelta(days=valid_coupons[coupon_code])
-        expiry_str = expiry_date.strftime("%Y-%m-%d")
-        
+    if days is None:
+        return False, 0
+    
+    if shared_state is not None:
+        shared_state.set_premium_until(user_id, day_to_str(today_epoch_day() + days))
+    else:
         settings = get_user_settings(user_id)
-        settings["usage"]["unlimited_until"] = expiry_str
-        
-        return True, valid_coupons[coupon_code]
+        settings.premium_until = today_epoch_day() + days
     
-    return False, 0
+    usage_stats.incr("coupons")
+    usage_stats.incr("premium_days", days)
+    return True, days
 
 def get_usage_info(user_id):
     """Get user's usage information"""
     settings = get_user_settings(user_id)
-    usage = settings.get("usage", {})
-    today = get_today()
+    today = today_epoch_day()
     
     # Reset if new day
-    if usage.get("date") != today:
-        usage["date"] = today
-        usage["used"] = 0
+    settings.roll_day(today)
     
-    if is_premium_active(user_id):
+    if settings.is_premium(today):
         return {
             "type": "premium",
             "remaining": "Unlimited",
-            "expires": usage.get("unlimited_until", "N/A")
+            "expires": day_to_str(settings.premium_until) or "N/A"
         }
     else:
-        remaining = FREE_DAILY_LIMIT - usage.get("used", 0)
+        remaining = FREE_DAILY_LIMIT - settings.used
         return {
             "type": "free",
             "remaining": remaining,
@@ -251,11 +597,191 @@ def get_usage_info(user_id):
             "reset": "Tomorrow"
         }
 
+def count_message(user_id):
+    """Count a message for the user (drives ad frequency), return the total"""
+    if shared_state is not None:
+        return shared_state.incr_message_count(user_id)
+    settings = get_user_settings(user_id)
+    settings.message_count += 1
+    return settings.message_count
+
+def begin_exchange(user_id):
+    """Consume a prompt and load the conversation history for one update.
+
+    Returns (can_send, remaining, conversation_history)
+    """
+    if shared_state is not None:
+        can_send, remaining, history = shared_state.consume_and_load(user_id, get_today(), FREE_DAILY_LIMIT)
+        usage_stats.record_prompt(user_id, can_send, premium=can_send and remaining is None)
+        return can_send, remaining, history
+    
+    can_send, remaining = check_and_consume_prompt(user_id)
+    return can_send, remaining, get_conversation_history(user_id)
+
+def get_conversation_history(user_id):
+    """Get the user's conversation history as a Cohere chat_history list"""
+    if shared_state is not None:
+        return shared_state.get_history(user_id)
+    restore_user(user_id)
+    history = user_conversations.get(user_id)
+    return history.to_chat_history() if history is not None else []
+
+def save_exchange(user_id, user_message, ai_response):
+    """Add a user message and bot response to the conversation history"""
+    if shared_state is not None:
+        shared_state.append_history(user_id, [
+            {"role": "user", "message": user_message},
+            {"role": "chatbot", "message": ai_response},
+        ])
+        return
+    
+    # The ring buffer drops the oldest turns once HISTORY_LIMIT is reached
+    history = user_conversations.get(user_id)
+    if history is None:
+        history = user_conversations[user_id] = ConversationHistory(HISTORY_LIMIT)
+    history.append(ROLE_USER, user_message)
+    history.append(ROLE_CHATBOT, ai_response)
+
+def all_user_ids():
+    """IDs of every user the bot knows about"""
+    if shared_state is not None:
+        return list(shared_state.iter_user_ids())
+    user_ids = set(user_settings)
+    state_snapshot = current_tenant().snapshot
+    if state_snapshot is not None:
+        user_ids.update(user_id for user_id, _ in state_snapshot.remaining())
+    return list(user_ids)
+
+def forget_user(user_id):
+    """Remove all state for a user (e.g. after they blocked the bot)"""
+    if shared_state is not None:
+        shared_state.delete_user(user_id)
+        return
+    restore_user(user_id)
+    user_settings.pop(user_id, None)
+    user_conversations.pop(user_id, None)
+
+def is_admin(user_id):
+    """Check if a user may run admin commands"""
+    return user_id in current_tenant().admin_user_ids
+
+# ============================================================================
+# BROADCASTS
+# ============================================================================
+
+from main.broadcast import BroadcastEngine
+
+BROADCAST_CHECKPOINT_PATH = os.environ.get(
+    "BROADCAST_CHECKPOINT_PATH", str(Path(__file__).parent.parent / "broadcast.json")
+)
+broadcast_engine = TenantLocal(
+    "broadcast_engine", lambda tenant: BroadcastEngine(tenant.path(BROADCAST_CHECKPOINT_PATH), on_blocked=forget_user)
+)
+
+def clear_conversation(user_id):
+    """Forget the user's conversation history"""
+    if shared_state is not None:
+        shared_state.clear_history(user_id)
+        return
+    restore_user(user_id)
+    user_conversations.pop(user_id, None)
+
+# ============================================================================
+# MEDIA CACHE
+# ============================================================================
+
+# Downloaded files and their transcripts/extracted text, keyed on
+# file_unique_id (empty MEDIA_CACHE_DIR keeps both in memory)
+MEDIA_CACHE_DIR = os.environ.get("MEDIA_CACHE_DIR", str(Path(__file__).parent.parent / "media_cache"))
+MEDIA_CACHE_MAX_MB = int(os.environ.get("MEDIA_CACHE_MAX_MB", "256"))
+
+_media_cache = None
+
+def get_media_cache():
+    """Open the media cache on first use"""
+    global _media_cache
+    if _media_cache is None:
+        from main.media_cache import open_media_cache
+        _media_cache = open_media_cache(MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_MB * 1024 * 1024)
+    return _media_cache
+
+# Long voice notes are split at pauses into segments of at most this many
+# seconds, transcribed in parallel by TRANSCRIBE_WORKERS threads
+VOICE_SEGMENT_SECONDS = int(os.environ.get("VOICE_SEGMENT_SECONDS", "30"))
+TRANSCRIBE_WORKERS = int(os.environ.get("TRANSCRIBE_WORKERS", "4"))
+
+# Minimum seconds between partial transcript edits of the status message
+PARTIAL_EDIT_INTERVAL = 1.5
+
+_transcriber = None
+
+def get_transcriber():
+    """Create the transcription worker pool on first use"""
+    global _transcriber
+    if _transcriber is None:
+        from main.transcription import Transcriber
+        _transcriber = Transcriber(TRANSCRIBE_WORKERS, VOICE_SEGMENT_SECONDS * 1000)
+    return _transcriber
+
+# Data files are profiled column by column in PROFILE_WORKERS processes; only
+# the profile and a few sample rows are sent to the AI
+TABLE_EXTENSIONS = [".csv", ".tsv"]
+PROFILE_WORKERS = int(os.environ.get("PROFILE_WORKERS", "1"))
+
+_profile_pool = None
+
+def get_profile_pool():
+    """Start the data profiling processes on first use"""
+    global _profile_pool
+    if _profile_pool is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # "spawn" so the workers never inherit the event loop or HTTP connections
+        _profile_pool = ProcessPoolExecutor(PROFILE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _profile_pool
+
 # ============================================================================
 # AI RESPONSE FUNCTION
 # ============================================================================
 
-def get_ai_response(prompt: str, user_id: int, conversation_history: list = None) -> str:
+from main.prompt_cache import SemanticCache
+
+from main.routing import ModelRouter
+
+# Short chat turns go to the fastest of COHERE_FAST_MODELS (when it keeps up),
+# long prompts and file analysis to COHERE_STRONG_MODELS (comma separated;
+# set COHERE_FAST_MODELS empty to always use the strong model)
+COHERE_FAST_MODELS = [m.strip() for m in os.environ.get("COHERE_FAST_MODELS", "command-r7b-12-2024").split(",") if m.strip()]
+COHERE_STRONG_MODELS = [m.strip() for m in os.environ.get("COHERE_STRONG_MODELS", COHERE_MODEL).split(",") if m.strip()]
+
+model_router = ModelRouter(COHERE_FAST_MODELS, COHERE_STRONG_MODELS)
+
+# Near-duplicate prompt cache (PROMPT_CACHE_SIZE=0 disables it)
+PROMPT_CACHE_THRESHOLD = float(os.environ.get("PROMPT_CACHE_THRESHOLD", "0.9"))
+PROMPT_CACHE_SIZE = int(os.environ.get("PROMPT_CACHE_SIZE", "5000"))
+PROMPT_CACHE_TTL = float(os.environ.get("PROMPT_CACHE_TTL", str(24 * 3600)))
+
+prompt_cache = SemanticCache(PROMPT_CACHE_THRESHOLD, PROMPT_CACHE_SIZE, PROMPT_CACHE_TTL)
+
+# Keep-alive connections to the Cohere API, shared by all handler threads
+COHERE_POOL_SIZE = int(os.environ.get("COHERE_POOL_SIZE", "16"))
+
+_cohere_session = None
+
+def get_cohere_session():
+    """Open the Cohere HTTP connection pool on first use"""
+    global _cohere_session
+    if _cohere_session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=COHERE_POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _cohere_session = session
+    return _cohere_session
+
+def get_ai_response(prompt: str, user_id: int, conversation_history: list = None, task: str = "chat") -> str:
     """
     Call Cohere API to generate AI response.
     Uses the new Chat API with conversation history for context.
@@ -264,52 +790,292 @@ def get_ai_response(prompt: str, user_id: int, conversation_history: list = None
         prompt: The user's message
         user_id: The user's Telegram ID (used to track conversation)
         conversation_history: List of previous message dicts with 'role' and 'message' keys
+        task: "chat", or e.g. "document" for file analysis (routed to the strong model)
     """
     if conversation_history is None:
         conversation_history = []
     
     # Check for custom responses first
     prompt_lower = prompt.lower().strip()
+    tenant = current_tenant()
     
-    for key, response in CUSTOM_RESPONSES.items():
+    for key, response in tenant.custom_responses.items():
         if key in prompt_lower:
             return response
     
     # Also check if asking about the bot itself
     if any(phrase in prompt_lower for phrase in ["who are you", "what are you", "tell me about yourself", "about you"]):
-        return BOT_NAME + " - Your AI Assistant\n\n" + CREATOR_INFO
+        return tenant.bot_name + " - Your AI Assistant\n\n" + tenant.creator_info
     
-    try:
-        url = "https://api.cohere.ai/v1/chat"
-        headers = {
-            "Authorization": f"Bearer {COHERE_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
+    # Only context-free prompts can share an answer
+    use_cache = not conversation_history
+    if use_cache:
+        cached = prompt_cache.lookup(prompt)
+        if cached is not None:
+            logger.info("Prompt cache hit", extra=SAMPLED)
+            return cached
+    
+    import time
+    import requests
+    
+    url = COHERE_API_URL
+    headers = {
+        "Authorization": f"Bearer {COHERE_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    
+    # Fast model for short chat turns, strong model for heavy work; if the
+    # chosen model fails, retry once on a strong model
+    route = model_router.route(prompt, len(conversation_history), task)
+    error_reply = "Sorry, something went wrong. Please try again."
+    
+    while route is not None:
         # Build messages for chat API with conversation history
         data = {
-            "model": COHERE_MODEL,
+            "model": route.model,
             "message": prompt,
             "chat_history": conversation_history,
-            "max_tokens": 2048,
+            "max_tokens": route.max_tokens,
             "temperature": 0.3
         }
         
-        response = requests.post(url, headers=headers, json=data, timeout=30)
-        
-        if response.status_code == 200:
-            result = response.json()
-            return result.get("text", "").strip()
-        
-        logger.error(f"Cohere API error: {response.status_code} - {response.text}")
-        return "Sorry, I encountered an error. Please try again."
+        start = time.perf_counter()
+        try:
+            response = get_cohere_session().post(url, headers=headers, json=data, timeout=30)
+            
+            if response.status_code == 200:
+                model_router.record(route, time.perf_counter() - start)
+                result = response.json()
+                text = result.get("text", "").strip()
+                if use_cache:
+                    prompt_cache.store(prompt, text)
+                return text
+            
+            logger.error("Cohere API error (%s): %s - %.500s", route.model, response.status_code, response.text)
+            error_reply = "Sorry, I encountered an error. Please try again."
+            
+        except requests.exceptions.Timeout:
+            logger.error("Cohere API timeout (%s)", route.model)
+            error_reply = "Sorry, the request took too long. Please try again."
+        except Exception as e:
+            logger.error("Error getting AI response: %s", e)
+            error_reply = "Sorry, something went wrong. Please try again."
         
-    except requests.exceptions.Timeout:
-        logger.error("Cohere API timeout")
-        return "Sorry, the request took too long. Please try again."
-    except Exception as e:
-        logger.error(f"Error getting AI response: {e}")
-        return "Sorry, something went wrong. Please try again."
+        model_router.record(route, time.perf_counter() - start, ok=False)
+        route = model_router.fallback(route)
+    
+    return error_reply
+
+# ============================================================================
+# BACKGROUND JOBS
+# ============================================================================
+
+from main.jobs import JobQueue, PermanentError
+
+# Durable queue for voice/document work (survives restarts; empty = memory)
+JOBS_PATH = os.environ.get("JOBS_PATH", str(Path(__file__).parent.parent / "jobs.db"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+
+job_queue = JobQueue(JOBS_PATH, concurrency=JOB_WORKERS, max_attempts=JOB_MAX_ATTEMPTS)
+
+async def edit_job_status(bot, payload: dict, text: str):
+    """Replace the text of a job's status message"""
+    from telegram.error import TelegramError
+    try:
+        await bot.edit_message_text(text, chat_id=payload["chat_id"], message_id=payload["status_message_id"])
+    except TelegramError as e:
+        logger.debug("Job status edit failed: %s", e)
+
+def enter_job_tenant(bot, payload: dict):
+    """Serve the bot that queued a job; returns that bot's Bot"""
+    tenant = get_tenant(payload.get("tenant"))
+    if tenant is None:
+        raise PermanentError(f"Bot {payload['tenant']!r} is not hosted in this process")
+    activate_tenant(tenant)
+    return tenant.bot or bot
+
+async def send_long_message(bot, chat_id: int, text: str):
+    """Send text, split into 4096-character messages"""
+    for i in range(0, len(text), 4096):
+        await bot.send_message(chat_id=chat_id, text=text[i:i+4096])
+
+async def run_voice_job(bot, job):
+    """Transcribe a queued voice message and answer it"""
+    import asyncio
+    import time
+    import speech_recognition as sr
+    
+    payload = job.payload
+    bot = enter_job_tenant(bot, payload)
+    user_id = payload["user_id"]
+    set_update_context(payload.get("update_id"), user_id)
+    
+    if job.attempts > 1:
+        await edit_job_status(bot, payload, f"🎤 Retrying your voice message ({job.attempts}/{job_queue.max_attempts})...")
+    
+    last_edit = time.monotonic()
+    
+    async def show_partial(partial, done, total):
+        """Stream the transcript so far into the status message"""
+        nonlocal last_edit
+        if time.monotonic() - last_edit < PARTIAL_EDIT_INTERVAL:
+            return
+        last_edit = time.monotonic()
+        await edit_job_status(bot, payload, f"🎤 ({done}/{total}) {partial[-3500:]}…")
+    
+    # Forwarded voice notes share a file_unique_id: reuse the transcript
+    media_cache = get_media_cache()
+    text = await media_cache.get_artifact(payload["file_unique_id"], "transcript")
+    if text is None:
+        data = await media_cache.fetch(bot, payload["file_id"], payload["file_unique_id"])
+        try:
+            text = await get_transcriber().transcribe(data, on_partial=show_partial)
+        except sr.UnknownValueError:
+            await edit_job_status(bot, payload, "😕 Couldn't understand the audio. Please try again with clearer speech!")
+            return
+        # sr.RequestError (speech service down) is retried by the queue
+        await media_cache.put_artifact(payload["file_unique_id"], "transcript", text)
+    
+    logger.info("Transcribed voice (%d chars)", len(text), extra=SAMPLED)
+    await edit_job_status(bot, payload, f"🎤 **You said:**\n{text}\n\nProcessing...")
+    
+    # Process the transcribed text as a regular message
+    await bot.send_chat_action(chat_id=payload["chat_id"], action="typing")
+    conversation_history = get_conversation_history(user_id)
+    ai_response = await asyncio.to_thread(get_ai_response, text, user_id, conversation_history)
+    # A retry must not save or send the answer twice
+    await job_queue.complete(job)
+    save_exchange(user_id, text, ai_response)
+    await send_long_message(bot, payload["chat_id"], ai_response)
+
+async def voice_job_failed(bot, job, error):
+    """Tell the user their voice message could not be processed"""
+    import speech_recognition as sr
+    bot = enter_job_tenant(bot, job.payload)
+    if isinstance(error, sr.RequestError):
+        await edit_job_status(bot, job.payload, "⚠️ Speech service unavailable. Please try text instead!")
+    else:
+        await edit_job_status(bot, job.payload, "⚠️ Error processing voice. Please send as text!")
+
+async def profile_table(bot, payload: dict):
+    """Column profile of a queued data file, or None if it can't be parsed"""
+    import asyncio
+    from concurrent.futures.process import BrokenProcessPool
+    from main.tabular import describe_table
+    global _profile_pool
+    
+    # Profiles are cached per file_unique_id like extracted text
+    media_cache = get_media_cache()
+    profile = await media_cache.get_artifact(payload["file_unique_id"], "profile")
+    if profile is None:
+        data = await media_cache.fetch(bot, payload["file_id"], payload["file_unique_id"])
+        await edit_job_status(bot, payload, "📊 Profiling your data...")
+        delimiter = "\t" if payload["file_ext"] == ".tsv" else None
+        loop = asyncio.get_running_loop()
+        try:
+            profile = await loop.run_in_executor(
+                get_profile_pool(), describe_table, data, payload.get("file_name", "data"), delimiter
+            )
+        except ValueError as e:
+            logger.info("Data file not parsed: %s", e)
+            return None
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory): start fresh on the retry
+            _profile_pool = None
+            raise
+        await media_cache.put_artifact(payload["file_unique_id"], "profile", profile)
+    return profile
+
+async def run_document_job(bot, job):
+    """Read a queued text or data document and have the AI explain it"""
+    import asyncio
+    
+    payload = job.payload
+    bot = enter_job_tenant(bot, payload)
+    user_id = payload["user_id"]
+    file_ext = payload["file_ext"]
+    set_update_context(payload.get("update_id"), user_id)
+    
+    if file_ext in TABLE_EXTENSIONS:
+        profile = await profile_table(bot, payload)
+        if profile is None:
+            await edit_job_status(
+                bot, payload,
+                "📊 Couldn't read this file as CSV (binary, encoding or format issue).\n"
+                "Try exporting it again as UTF-8 CSV!"
+            )
+            return
+        await bot.send_chat_action(chat_id=payload["chat_id"], action="typing")
+        prompt = (
+            f"Analyze this dataset. Below is a profile of every column, computed over all rows, "
+            f"followed by a few sample rows:\n\n{profile}\n\n"
+            f"Summarize what this data contains and point out anything notable "
+            f"(data quality issues, outliers, interesting distributions)."
+        )
+        conversation_history = get_conversation_history(user_id)
+        ai_response = await asyncio.to_thread(get_ai_response, prompt, user_id, conversation_history, "document")
+        await job_queue.complete(job)
+        await send_long_message(bot, payload["chat_id"], ai_response)
+        return
+    
+    # Text content is cached per file_unique_id
+    media_cache = get_media_cache()
+    content = await media_cache.get_artifact(payload["file_unique_id"], "text")
+    if content is None:
+        data = await media_cache.fetch(bot, payload["file_id"], payload["file_unique_id"])
+        try:
+            content = data.decode("utf-8")[:5000]  # Limit to 5000 chars
+        except UnicodeDecodeError:
+            await edit_job_status(
+                bot, payload,
+                "📄 Couldn't read this file (binary or encoding issue).\n"
+                "Try sending as plain text!"
+            )
+            return
+        await media_cache.put_artifact(payload["file_unique_id"], "text", content)
+    
+    # Analyze the code/file
+    await bot.send_chat_action(chat_id=payload["chat_id"], action="typing")
+    prompt = f"Analyze this {file_ext} file:\n\n```{file_ext}\n{content}\n```\n\nCan you explain what this does?"
+    
+    conversation_history = get_conversation_history(user_id)
+    ai_response = await asyncio.to_thread(get_ai_response, prompt, user_id, conversation_history, "document")
+    await job_queue.complete(job)
+    await send_long_message(bot, payload["chat_id"], ai_response)
+
+async def document_job_failed(bot, job, error):
+    """Tell the user their document could not be processed"""
+    bot = enter_job_tenant(bot, job.payload)
+    await edit_job_status(bot, job.payload, "⚠️ Error processing file. Please try again or send as text!")
+
+job_queue.register("voice", run_voice_job, voice_job_failed)
+job_queue.register("document", run_document_job, document_job_failed)
+
+# ============================================================================
+# MEMORY INTROSPECTION
+# ============================================================================
+
+from main.logging_setup import log_queue
+from main.memory import MemoryProfiler
+
+# Trace allocations from startup (slower; otherwise tracing starts on /memory)
+MEMORY_TRACE = os.environ.get("MEMORY_TRACE", "false").lower() == "true"
+
+# Serve memory gauges for Prometheus on this port at /metrics (empty = off)
+METRICS_PORT = os.environ.get("METRICS_PORT", "")
+
+memory_profiler = MemoryProfiler()
+memory_profiler.register("user_settings", user_settings.instances)
+memory_profiler.register("user_conversations", user_conversations.instances)
+memory_profiler.register("prompt_cache", lambda: prompt_cache)
+memory_profiler.register("media_cache", lambda: _media_cache)
+memory_profiler.register("ad_analytics_buffer", lambda: ad_analytics.buffer)
+memory_profiler.register("update_recorder_buffer", lambda: update_recorder.buffer)
+memory_profiler.register("log_queue", log_queue)
+memory_profiler.register("usage_stats", usage_stats.instances)
+memory_profiler.register("redeemed_coupons", lambda: _redeemed_coupons)
+memory_profiler.register("broadcast", lambda: broadcast_engine.instances(lambda engine: engine.current))
 
 # ============================================================================
 # TELEGRAM BOT HANDLERS
@@ -317,7 +1083,7 @@ def get_ai_response(prompt: str, user_id: int, conversation_history: list = None
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
-    welcome_message = """👋 Welcome to RG Assistant!
+    welcome_message = f"""👋 Welcome to {current_tenant().bot_name}!
 
 I'm an AI-powered assistant that can help you with:
 • 💻 Coding and programming questions
@@ -334,12 +1100,12 @@ Use /help to see available commands."""
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /help command"""
-    help_message = """📚 Available Commands:
+    help_message = f"""📚 Available Commands:
 
 /start - Start the bot
 /help - Show this help message
 /settings - Configure your preferences
-/about - About RG Assistant
+/about - About {current_tenant().bot_name}
 
 💬 Just send me a message and I'll respond!
 """
@@ -348,15 +1114,16 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def about_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /about command"""
-    about_message = """🤖 RG Assistant - Your AI Companion
+    tenant = current_tenant()
+    about_message = f"""🤖 {tenant.bot_name} - Your AI Companion
 
 ━━━━━━━━━━━━━━━━━━━━━━
 
 📌 ABOUT:
-RG Assistant is an advanced AI chatbot developed by RG-TECH, a innovative technology company based in Cameroon.
+{tenant.bot_name} is an advanced AI chatbot developed by {tenant.company_name}.
 
 👨‍💼 CREATOR:
-Founded by Rosch Ebori, a passionate tech entrepreneur dedicated to bringing AI solutions to Africa and beyond.
+Founded by {tenant.creator_name}.
 
 🔧 WHAT I CAN DO:
 • 💻 Coding & Programming
@@ -375,7 +1142,7 @@ Founded by Rosch Ebori, a passionate tech entrepreneur dedicated to bringing AI
 
 ━━━━━━━━━━━━━━━━━━━━━━
 
-🏢 RG-TECH - Innovating the Future with AI
+🏢 {tenant.company_name} - Innovating the Future with AI
 
 💬 Send me a message to get started!"""
     
@@ -391,9 +1158,9 @@ async def settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 ━━━━━━━━━━━━━━━━━━━━━━
 
-🎭 Response Tone: {settings['tone'].capitalize()}
-🌐 Language: {settings['language'].upper()}
-🔔 Notifications: {'On' if settings['notifications'] else 'Off'}
+🎭 Response Tone: {settings.tone.capitalize()}
+🌐 Language: {settings.language.upper()}
+🔔 Notifications: {'On' if settings.notifications else 'Off'}
 
 ━━━━━━━━━━━━━━━━━━━━━━
 
@@ -448,7 +1215,8 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /status command - Bot status"""
     import datetime
     
-    status_message = f"""📊 {BOT_NAME} Status
+    tenant = current_tenant()
+    status_message = f"""📊 {tenant.bot_name} Status
 
 ━━━━━━━━━━━━━━━━━━━━━━
 
@@ -462,7 +1230,7 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 ━━━━━━━━━━━━━━━━━━━━━━
 
-🏢 {COMPANY_NAME}
+🏢 {tenant.company_name}
 © 2026 All Rights Reserved"""
     
     await update.message.reply_text(status_message)
@@ -484,8 +1252,7 @@ async def clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
     # Clear conversation history for this user
-    if user_id in user_conversations:
-        user_conversations[user_id] = []
+    clear_conversation(user_id)
     
     await update.message.reply_text(
         "🗑️ Chat cleared!\n\n"
@@ -498,7 +1265,7 @@ async def refer_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
     # Generate referral code (simple user_id based)
-    referral_code = f"RG{user_id}"
+    referral_code = f"ref{user_id}"
     bot_username = context.bot.username
     
     referral_link = f"https://t.me/{bot_username}?start={referral_code}"
@@ -517,7 +1284,7 @@ async def refer_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def ads_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /ads command - Show monetization info"""
-    msg = """💰 **Monetization Info**\n\n"
+    msg = f"""💰 **Monetization Info**\n\n"
 "━━━━━━━━━━━━━━━━━━━━━━\n\n"
 "📢 **Telegram BotAds**\n"
 "To enable ads and earn:\n"
@@ -530,7 +1297,7 @@ async def ads_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 "Use /offers to see current deals!\n\n"
 "━━━━━━━━━━━━━━━━━━━━━━\n\n"
 "🚀 **Grow With Us**\n"
-"Share RG Assistant to help us\n"
+"Share {current_tenant().bot_name} to help us\n"
 "reach 1,000 users faster!\n\n"
 "Use /refer to get your link!"""
     
@@ -558,7 +1325,7 @@ async def offers_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 "• AliExpress - Cheap deals\n\n"
 "💬 Ask for specific links!""",
         
-        """💎 **Premium Deals**\n\n"
+        f"""💎 **Premium Deals**\n\n"
 "━━━━━━━━━━━━━━━━━━━━━━\n\n"
 "📺 **Streaming**\n"
 "• Netflix - Get 50% OFF\n"
@@ -572,7 +1339,7 @@ async def offers_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 "• Cloud hosting\n"
 "• Domain names\n"
 "• VPN services\n\n"
-"🔗 DM @RoschEbori for links!"""
+"🔗 DM @{current_tenant().contact} for links!"""
     ]
     
     await update.message.reply_text(random.choice(offers))
@@ -581,17 +1348,18 @@ async def offers_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def promote_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /promote command - Promote the bot"""
     bot_username = context.bot.username
+    bot_name = current_tenant().bot_name
     
     promo_texts = [
-        f"🤖 Try RG Assistant - Your AI Buddy!\n\n"
+        f"🤖 Try {bot_name} - Your AI Buddy!\n\n"
         f"👉 t.me/{bot_username}\n\n"
         f"It's free and awesome! 🚀",
         
-        f"💡 Need help? Ask RG Assistant!\n\n"
+        f"💡 Need help? Ask {bot_name}!\n\n"
         f"👉 t.me/{bot_username}\n\n"
         f"AI-powered, fast, helpful! ✨",
         
-        f"🔥 Check out RG Assistant!\n\n"
+        f"🔥 Check out {bot_name}!\n\n"
         f"👉 t.me/{bot_username}\n\n"
         f"Your personal AI assistant 🎯"
     ]
@@ -646,25 +1414,7 @@ async def upgrade_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 ✅ Priority AI responses
 ✅ All features unlocked
 
-💰 Price: 1500 XAF (2 weeks)
-
-━━━━━━━━━━━━━━━━━━━━━━
-
-💳 Payment Methods:
-
-📱 MTN MOMO USSD:
-Dial: *126*9*650674817*1500#
-
-🏦 Orange Money:
-Account: +237-659188549
-
-━━━━━━━━━━━━━━━━━━━━━━
-
-⚠️ After payment:
-Contact @rosch_ebori on Telegram
-OR WhatsApp: +237-650674817
-
-They will give you a coupon code.
+{current_tenant().payment_info}
 
 🔖 Then use: /coupon YOUR_CODE"""
     
@@ -676,8 +1426,9 @@ async def coupon_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
     if context.args:
-        coupon_code = context.args[0]
-        success, days = apply_coupon_code(user_id, coupon_code)
+        # Codes may be typed with spaces between the groups
+        coupon_code = "".join(context.args)
+        success, days = await apply_coupon_code(user_id, coupon_code)
         
         if success:
             await update.message.reply_text(
@@ -688,8 +1439,8 @@ async def coupon_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
         else:
             await update.message.reply_text(
-                "❌ Invalid coupon code.\n\n"
-                "Contact @rosch_ebori for valid codes."
+                "❌ Invalid, expired or already used coupon code.\n\n"
+                "See /upgrade to get a valid code."
             )
     else:
         await update.message.reply_text(
@@ -698,9 +1449,157 @@ async def coupon_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /broadcast command - Send an announcement to all users (admin)"""
+    if not is_admin(update.effective_user.id):
+        return
+    
+    # Keep the announcement's line breaks: take everything after the command
+    parts = update.message.text.split(maxsplit=1)
+    if len(parts) < 2:
+        await update.message.reply_text(
+            "📣 Usage: /broadcast <message>\n\n"
+            "Also: /broadcast_status, /broadcast_cancel, /broadcast_resume"
+        )
+        return
+    
+    if broadcast_engine.running:
+        await update.message.reply_text("⚠️ A broadcast is already running. Use /broadcast_status")
+        return
+    
+    # This worker only knows its own shard of the users
+    if SHARDED and shared_state is None:
+        await update.message.reply_text(
+            "⚠️ Broadcasts need STATE_BACKEND_URL when BOT_WORKERS > 1: "
+            "each worker only knows its own users."
+        )
+        return
+    
+    recipients = all_user_ids()
+    broadcast_engine.start(context.bot, parts[1], recipients, admin_chat_id=update.effective_chat.id)
+    logger.info("Broadcast started by %s to %d users", update.effective_user.id, len(recipients))
+
+
+async def broadcast_status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /broadcast_status command - Show broadcast progress (admin)"""
+    if not is_admin(update.effective_user.id):
+        return
+    
+    broadcast = broadcast_engine.current or broadcast_engine.load()
+    if broadcast is None:
+        await update.message.reply_text("📣 No broadcasts yet.")
+        return
+    await update.message.reply_text(broadcast.report())
+
+
+async def broadcast_cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /broadcast_cancel command - Stop the running broadcast (admin)"""
+    if not is_admin(update.effective_user.id):
+        return
+    
+    if not broadcast_engine.running:
+        await update.message.reply_text("📣 No broadcast is running.")
+        return
+    broadcast_engine.cancel()
+    await update.message.reply_text("🛑 Broadcast cancelled.")
+
+
+async def broadcast_resume_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /broadcast_resume command - Resume an interrupted broadcast (admin)"""
+    if not is_admin(update.effective_user.id):
+        return
+    
+    broadcast = broadcast_engine.resume(context.bot)
+    if broadcast is None:
+        await update.message.reply_text("📣 Nothing to resume.")
+        return
+    await update.message.reply_text(f"▶️ Resuming broadcast {broadcast.id} at {broadcast.cursor}/{broadcast.total}")
+
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /stats command - Show usage statistics (admin)"""
+    if not is_admin(update.effective_user.id):
+        return
+    
+    import asyncio
+    
+    stats = await asyncio.to_thread(cluster_usage_stats)
+    today = stats.today()
+    week = stats.totals(7)
+    month = stats.totals(30)
+    scope = f"\nMerged from {BOT_WORKERS} workers (others as of their last save)." if stats is not usage_stats else ""
+    
+    msg = f"""📊 Usage Statistics
+
+━━━━━━━━━━━━━━━━━━━━━━
+
+📅 Today ({day_to_str(today["day"])}):
+👥 Active users: {today["active_users"]} (💎 {today["premium_users"]} premium)
+💬 Prompts: {today["prompts"]} (limit reached {today["limit_hits"]}x)
+🎤 Voice: {today["voice"]} | 📄 Documents: {today["documents"]} | 📷 Photos: {today["photos"]}
+🔖 Coupons: {today["coupons"]} (+{today["premium_days"]} premium days)
+
+📆 Last 7 days:
+👥 Active users: {stats.distinct_users(7)}
+💬 Prompts: {week["prompts"]} | 🎤 {week["voice"]} | 📄 {week["documents"]}
+
+🗓 Last 30 days:
+👥 Active users: {stats.distinct_users(30)}
+💬 Prompts: {month["prompts"]} | 🔖 Coupons: {month["coupons"]}
+
+━━━━━━━━━━━━━━━━━━━━━━
+
+User counts are estimates (±2%).{scope}"""
+    
+    await update.message.reply_text(msg)
+
+
+async def memory_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /memory command - Report memory use per structure (admin)"""
+    import asyncio
+    import io
+    import time
+    
+    if not is_admin(update.effective_user.id):
+        return
+    
+    if context.args and context.args[0].lower() == "stop":
+        memory_profiler.stop_tracing()
+        await update.message.reply_text("🧠 Allocation tracing stopped.")
+        return
+    
+    just_started = not memory_profiler.tracing
+    memory_profiler.start_tracing()
+    
+    summary, full_text = await asyncio.to_thread(memory_profiler.report)
+    if just_started:
+        summary += "\n\nAllocation tracing started; allocation sites and growth show from the next /memory. Use /memory stop to turn it off."
+    
+    await update.message.reply_text(f"🧠 {summary}")
+    report = io.BytesIO(full_text.encode("utf-8"))
+    report.name = f"memory-{time.strftime('%Y%m%d-%H%M%S')}.txt"
+    await update.message.reply_document(report)
+
+
+async def ad_click_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle taps on an ad's "Learn more" button"""
+    query = update.callback_query
+    ad_id = query.data.split(":", 1)[1]
+    await query.answer()
+    
+    index = AD_INDEX.get(ad_id)
+    if index is None or not ADS[index].get("links"):
+        return
+    
+    ad_analytics.record("click", update.effective_user.id, ad_id)
+    links = "\n".join(f"🔗 {brand_text(link)}" for link in ADS[index]["links"])
+    await query.message.reply_text(links, disable_web_page_preview=True)
+
+
 async def help2_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /help2 - Detailed help"""
-    help_message = f"""📖 {BOT_NAME} - Complete Guide
+    tenant = current_tenant()
+    help_message = f"""📖 {tenant.bot_name} - Complete Guide
 
 ━━━━━━━━━━━━━━━━━━━━━━
 
@@ -710,13 +1609,13 @@ async def help2_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /start - Welcome message
 /help - Quick help
 /help2 - This detailed guide
-/about - About RG-TECH
+/about - About {tenant.company_name}
 /status - Bot status
 /ping - Test bot
 /settings - Your preferences
 /clear - Clear chat
 
-📢 **Earn with RG Assistant:**
+📢 **Earn with {tenant.bot_name}:**
 /refer - Get referral link
 /ads - Monetization info
 /offers - Current deals
@@ -743,24 +1642,25 @@ Examples:
 
 ━━━━━━━━━━━━━━━━━━━━━━
 
-🏢 {COMPANY_NAME} - {CREATOR_NAME}"""
+🏢 {tenant.company_name} - {tenant.creator_name}"""
     
     await update.message.reply_text(help_message)
 
 
 async def echo_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle incoming text messages - main AI handler"""
+    import asyncio
+    
     try:
         # Get user's message
         user_message = update.message.text
         user_id = update.effective_user.id
         
-        # Get user info for logging
-        user = update.effective_user
-        logger.info(f"Message from {user.first_name} ({user_id}): {user_message[:50]}...")
+        # Message text is not logged; the update/user IDs are attached by set_update_context
+        logger.info("Text message received (%d chars)", len(user_message), extra=SAMPLED)
         
-        # Check usage limits first
-        can_send, remaining = check_and_consume_prompt(user_id)
+        # Check usage limits first (also loads the conversation history)
+        can_send, remaining, conversation_history = begin_exchange(user_id)
         
         if not can_send:
             # User reached limit
@@ -789,23 +1689,12 @@ Use /upgrade to see pricing or
         # Show typing indicator
         await update.message.chat.send_action("typing")
         
-        # Get conversation history for this user
-        conversation_history = user_conversations.get(user_id, [])
-        
-        # Get AI response with conversation history
-        ai_response = get_ai_response(user_message, user_id, conversation_history)
+        # Get AI response with conversation history (in a thread: the event
+        # loop keeps serving other users and bots meanwhile)
+        ai_response = await asyncio.to_thread(get_ai_response, user_message, user_id, conversation_history)
         
         # Save conversation to history (for next message)
-        if user_id not in user_conversations:
-            user_conversations[user_id] = []
-        
-        # Add user message and bot response to history
-        user_conversations[user_id].append({"role": "user", "message": user_message})
-        user_conversations[user_id].append({"role": "chatbot", "message": ai_response})
-        
-        # Limit history to last 10 exchanges (20 messages) to keep context manageable
-        if len(user_conversations[user_id]) > 20:
-            user_conversations[user_id] = user_conversations[user_id][-20:]
+        save_exchange(user_id, user_message, ai_response)
         
         # Send response (Telegram max message length is 4096)
         if len(ai_response) > 4096:
@@ -816,25 +1705,21 @@ Use /upgrade to see pricing or
         else:
             await update.message.reply_text(ai_response)
         
-        logger.info(f"Response sent to {user_id} (conversation history: {len(user_conversations.get(user_id, []))} messages)")
+        logger.info("Response sent (%d chars)", len(ai_response), extra=SAMPLED)
         
         # Show ads periodically (every N messages)
-        if user_id not in user_message_counts:
-            user_message_counts[user_id] = 0
-        
-        user_message_counts[user_id] += 1
+        message_count = count_message(user_id)
         
         # Show ad every 10 messages (can be changed with ADS_FREQUENCY)
-        if user_message_counts[user_id] % ADS_FREQUENCY == 0:
-            import random
-            import asyncio
+        ad = pick_ad(user_id) if message_count % ADS_FREQUENCY == 0 else None
+        if ad is not None:
             # Small delay so ad doesn't feel spammy
             await asyncio.sleep(1)
-            ad_msg = get_ad_message()
-            await update.message.reply_text(ad_msg)
+            await update.message.reply_text(brand_text(ad["text"]), reply_markup=get_ad_keyboard(ad))
+            ad_analytics.record("impression", user_id, ad["id"])
         
     except Exception as e:
-        logger.error(f"Error handling message: {e}")
+        logger.error("Error handling message: %s", e)
         await update.message.reply_text("Sorry, something went wrong. Please try again.")
 
 
@@ -843,14 +1728,14 @@ async def handle_photos(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
     # Check user limits first
-    if not is_premium(user_id):
-        remaining = get_daily_remaining(user_id)
-        if remaining <= 0:
-            await update.message.reply_text(
-                "❌ You've reached your daily limit!\n\n"
-                "Use /upgrade for unlimited messages!"
-            )
-            return
+    can_send, remaining = check_and_consume_prompt(user_id)
+    if not can_send:
+        await update.message.reply_text(
+            "❌ You've reached your daily limit!\n\n"
+            "Use /upgrade for unlimited messages!"
+        )
+        return
+    usage_stats.incr("photos")
     
     photo = update.message.photo
     if photo:
@@ -874,102 +1759,29 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
     # Check user limits first
-    if not is_premium(user_id):
-        remaining = get_daily_remaining(user_id)
-        if remaining <= 0:
-            await update.message.reply_text(
-                "❌ You've reached your daily limit!\n\n"
-                "Use /upgrade for unlimited messages!"
-            )
-            return
-    
-    await update.message.reply_text("🎤 Processing your voice message...")
-    
-    try:
-        voice = update.message.voice
-        
-        # Get file from Telegram
-        file = await context.bot.get_file(voice.file_id)
-        
-        # Download to temp file
-        with tempfile.NamedTemporaryFile(suffix=".ogg", delete=False) as tmp_file:
-            await file.download_to_drive(tmp_file.name)
-            ogg_path = tmp_file.name
-        
-        # Convert OGG to WAV using pydub
-        from pydub import AudioSegment
-        wav_path = ogg_path.replace(".ogg", ".wav")
-        
-        try:
-            sound = AudioSegment.from_ogg(ogg_path)
-            sound.export(wav_path, format="wav")
-        except Exception as e:
-            logger.error(f"Audio conversion error: {e}")
-            # Try direct download as wav
-            wav_path = ogg_path
-        
-        # Transcribe using SpeechRecognition
-        recognizer = sr.Recognizer()
-        
-        try:
-            with sr.AudioFile(wav_path) as source:
-                audio_data = recognizer.record(source)
-                # Try Google Speech Recognition (free, no API key needed)
-                text = recognizer.recognize_google(audio_data)
-                
-            logger.info(f"Transcribed voice: {text}")
-            
-            # Clean up temp files
-            try:
-                os.remove(ogg_path)
-                if wav_path != ogg_path:
-                    os.remove(wav_path)
-            except:
-                pass
-            
-            # Now process the transcribed text as a regular message
-            await update.message.reply_text(
-                f"🎤 **You said:**\n{text}\n\nProcessing..."
-            )
-            
-            # Get AI response
-            await update.message.chat.send_action("typing")
-            
-            # Get conversation history
-            conversation_history = user_conversations.get(user_id, [])
-            ai_response = get_ai_response(text, user_id, conversation_history)
-            
-            # Save to conversation
-            if user_id not in user_conversations:
-                user_conversations[user_id] = []
-            user_conversations[user_id].append({"role": "user", "message": text})
-            user_conversations[user_id].append({"role": "chatbot", "message": ai_response})
-            if len(user_conversations[user_id]) > 20:
-                user_conversations[user_id] = user_conversations[user_id][-20:]
-            
-            # Send response
-            if len(ai_response) > 4096:
-                chunks = [ai_response[i:i+4096] for i in range(0, len(ai_response), 4096)]
-                for chunk in chunks:
-                    await update.message.reply_text(chunk)
-            else:
-                await update.message.reply_text(ai_response)
-                
-        except sr.UnknownValueError:
-            await update.message.reply_text(
-                "😕 Couldn't understand the audio. Please try again with clearer speech!"
-            )
-        except sr.RequestError as e:
-            await update.message.reply_text(
-                f"⚠️ Speech service unavailable. Please try text instead!"
-            )
-            logger.error(f"Speech recognition error: {e}")
-            
-    except Exception as e:
-        logger.error(f"Voice processing error: {e}")
+    can_send, remaining = check_and_consume_prompt(user_id)
+    if not can_send:
         await update.message.reply_text(
-            "⚠️ Error processing voice. Please send as text!"
+            "❌ You've reached your daily limit!\n\n"
+            "Use /upgrade for unlimited messages!"
         )
+        return
+    usage_stats.incr("voice")
+    
+    status = await update.message.reply_text("🎤 Processing your voice message...")
+    
+    # Transcription runs in the background job queue; the status message is
+    # edited as it progresses
+    voice = update.message.voice
+    await job_queue.enqueue("voice", {
+        "update_id": update.update_id,
+        "tenant": current_tenant().name,
+        "user_id": user_id,
+        "chat_id": update.effective_chat.id,
+        "status_message_id": status.message_id,
+        "file_id": voice.file_id,
+        "file_unique_id": voice.file_unique_id,
+    })
 
 
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -977,14 +1789,14 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     
     # Check user limits first
-    if not is_premium(user_id):
-        remaining = get_daily_remaining(user_id)
-        if remaining <= 0:
-            await update.message.reply_text(
-                "❌ You've reached your daily limit!\n\n"
-                "Use /upgrade for unlimited messages!"
-            )
-            return
+    can_send, remaining = check_and_consume_prompt(user_id)
+    if not can_send:
+        await update.message.reply_text(
+            "❌ You've reached your daily limit!\n\n"
+            "Use /upgrade for unlimited messages!"
+        )
+        return
+    usage_stats.incr("documents")
     
     document = update.message.document
     file_name = document.file_name or "file"
@@ -1000,42 +1812,27 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Get file extension
     file_ext = os.path.splitext(file_name)[1].lower() if file_name else ""
     
-    await update.message.reply_text(
+    status = await update.message.reply_text(
         f"📄 Received: {file_name}\n"
         f"Size: {file_size / 1024:.1f} KB\n\n"
         f"Analyzing..."
     )
     
     try:
-        # Get file from Telegram
-        file = await context.bot.get_file(document.file_id)
-        
         # Handle different file types
-        if file_ext in [".txt", ".py", ".js", ".html", ".css", ".json", ".md"]:
-            # Text files - read content
-            with tempfile.NamedTemporaryFile(suffix=file_ext, delete=False, mode='w') as tmp_file:
-                await file.download_to_drive(tmp_file.name)
-                
-                try:
-                    with open(tmp_file.name, 'r', encoding='utf-8') as f:
-                        content = f.read(5000)  # Limit to 5000 chars
-                    
-                    os.remove(tmp_file.name)
-                    
-                    # Analyze the code/file
-                    await update.message.chat.send_action("typing")
-                    prompt = f"Analyze this {file_ext} file:\n\n```{file_ext}\n{content}\n```\n\nCan you explain what this does?"
-                    
-                    conversation_history = user_conversations.get(user_id, [])
-                    ai_response = get_ai_response(prompt, user_id, conversation_history)
-                    
-                    await update.message.reply_text(ai_response)
-                    
-                except UnicodeDecodeError:
-                    await update.message.reply_text(
-                        "📄 Couldn't read this file (binary or encoding issue).\n"
-                        "Try sending as plain text!"
-                    )
+        if file_ext in [".txt", ".py", ".js", ".html", ".css", ".json", ".md"] + TABLE_EXTENSIONS:
+            # Text and data files - analyzed in the background job queue
+            await job_queue.enqueue("document", {
+                "update_id": update.update_id,
+                "tenant": current_tenant().name,
+                "user_id": user_id,
+                "chat_id": update.effective_chat.id,
+                "status_message_id": status.message_id,
+                "file_id": document.file_id,
+                "file_unique_id": document.file_unique_id,
+                "file_ext": file_ext,
+                "file_name": file_name,
+            })
                     
         elif file_ext in [".pdf"]:
             # PDF files - need OCR or text extraction
@@ -1055,34 +1852,169 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             
     except Exception as e:
-        logger.error(f"Document processing error: {e}")
+        logger.error("Document processing error: %s", e)
         await update.message.reply_text(
             "⚠️ Error processing file. Please try again or send as text!"
         )
 
 
+async def track_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Tag log records for this update with its correlation IDs (and record it)"""
+    user = update.effective_user
+    set_update_context(update.update_id, user.id if user else None)
+    update_recorder.record(update)
+
+
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle errors"""
-    logger.error(f"Update {update} caused error {context.error}")
+    update_id = update.update_id if isinstance(update, Update) else None
+    logger.error("Update %s caused error %s", update_id, context.error, exc_info=context.error)
 
 
 # ============================================================================
-# MAIN FUNCTION
+# STARTUP & GRACEFUL SHUTDOWN
 # ============================================================================
 
-def main():
-    """Run the Telegram bot"""
-    logger.info("=" * 50)
-    logger.info("RG Assistant Telegram Bot")
-    logger.info("=" * 50)
+def begin_drain(application: Application):
+    """Stop taking new updates and shut down once in-flight work is done"""
+    global _draining
+    if _draining:
+        return
+    _draining = True
+    logger.info("🛑 Shutdown requested, draining (up to %.0fs)...", DRAIN_TIMEOUT)
     
-    if TELEGRAM_BOT_TOKEN == "YOUR_BOT_TOKEN_HERE":
-        logger.error("❌ Please set your TELEGRAM_BOT_TOKEN!")
-        logger.error("Edit .env file or set environment variable")
+    # If in-flight work overruns the drain timeout, save the snapshot anyway
+    # before the platform kills the process
+    watchdog = threading.Timer(DRAIN_TIMEOUT, save_state_snapshot, kwargs={"final": False})
+    watchdog.daemon = True
+    watchdog.start()
+    
+    # Stops polling; pending updates and tasks are finished before post_stop
+    application.stop_running()
+
+
+def preload_heavy_modules():
+    """Import the lazily loaded modules so the first voice message is fast"""
+    import importlib
+    import time
+    
+    for name in HEAVY_MODULES:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.warning("Preload of %s failed: %s", name, e)
+            continue
+        logger.debug("Preloaded %s in %.0fms", name, (time.perf_counter() - start) * 1000)
+
+
+def restore_bot_state(bot):
+    """Load the current bot's snapshot and stats from the last run"""
+    load_state_snapshot()
+    usage_stats.load()
+    
+    # Pick up a broadcast interrupted by the last restart
+    if broadcast_engine.resume(bot) is not None:
+        logger.info("Resumed interrupted broadcast")
+
+
+_services_started = False
+
+def start_services(bot, metrics: bool = True):
+    """Start the process-wide workers (once, however many bots are hosted)"""
+    global _services_started
+    if _services_started:
         return
+    _services_started = True
+    ad_analytics.start()
+    update_recorder.start()
     
-    # Create the Application
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    # Also runs jobs left over from the last run; jobs switch to the bot that
+    # queued them, `bot` is only the fallback
+    job_queue.start(bot)
+    
+    if MEMORY_TRACE:
+        memory_profiler.start_tracing()
+    if METRICS_PORT and metrics:
+        from main.memory import serve_metrics
+        serve_metrics(memory_profiler, int(METRICS_PORT))
+    
+    if PRELOAD_HEAVY_MODULES:
+        threading.Thread(target=preload_heavy_modules, name="preload", daemon=True).start()
+    
+    if SHARDED and usage_stats.path:
+        threading.Thread(target=save_usage_stats_periodically, name="stats-saver", daemon=True).start()
+
+
+async def stop_services():
+    """Finish queued work and stop the process-wide workers"""
+    _stats_saver_stop.set()
+    await job_queue.stop(timeout=DRAIN_TIMEOUT / 2)
+    await ad_analytics.stop()
+    await update_recorder.stop()
+    if _transcriber is not None:
+        _transcriber.shutdown()
+    if _profile_pool is not None:
+        _profile_pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def post_init(application: Application):
+    """Restore state and install the drain handlers"""
+    restore_bot_state(application.bot)
+    start_services(application.bot)
+    
+    import asyncio
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, begin_drain, application)
+        except NotImplementedError:
+            # Windows: fall back to KeyboardInterrupt handling
+            pass
+
+
+async def post_stop(application: Application):
+    """Persist state once all in-flight updates have been handled"""
+    await broadcast_engine.stop()
+    await stop_services()
+    save_state_snapshot()
+    save_usage_stats()
+
+
+# ============================================================================
+# MAIN FUNCTION
+# ============================================================================
+
+def build_application(token: str, updater: bool = True, request=None, get_updates_request=None,
+                      tenant=None) -> Application:
+    """Create the Application and register all bot handlers
+
+    Args:
+        token: The Telegram bot token
+        updater: Set to False for worker processes that receive updates
+            from a dispatcher instead of polling Telegram themselves
+        request: Optional telegram.request.BaseRequest for Bot API calls
+            (e.g. main.standins.TelegramStandIn)
+        get_updates_request: Optional BaseRequest for getUpdates long polls
+        tenant: The main.tenants.Tenant this bot serves (multi-bot mode)
+    """
+    builder = Application.builder().token(token).post_init(post_init).post_stop(post_stop)
+    if not updater:
+        builder = builder.updater(None)
+    if request is not None:
+        builder = builder.request(request)
+    if get_updates_request is not None:
+        builder = builder.get_updates_request(get_updates_request)
+    application = builder.build()
+    
+    # Runs before everything else: handlers of this Application serve its bot
+    if tenant is not None:
+        async def enter_tenant(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            activate_tenant(tenant)
+        application.add_handler(TypeHandler(Update, enter_tenant), group=-1000)
+    
+    # Runs first for every update: sets the logging correlation IDs
+    application.add_handler(TypeHandler(Update, track_update), group=-100)
     
     # Add command handlers
     application.add_handler(CommandHandler("start", start_command))
@@ -1104,6 +2036,17 @@ def main():
     application.add_handler(CommandHandler("offers", offers_command))
     application.add_handler(CommandHandler("promote", promote_command))
     
+    # Admin commands
+    application.add_handler(CommandHandler("broadcast", broadcast_command))
+    application.add_handler(CommandHandler("broadcast_status", broadcast_status_command))
+    application.add_handler(CommandHandler("broadcast_cancel", broadcast_cancel_command))
+    application.add_handler(CommandHandler("broadcast_resume", broadcast_resume_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("memory", memory_command))
+    
+    # Ad link clicks
+    application.add_handler(CallbackQueryHandler(ad_click_callback, pattern=r"^ad:"))
+    
     # Add message handlers
     # Text messages (except commands)
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, echo_message))
@@ -1120,12 +2063,46 @@ def main():
     # Error handler
     application.add_error_handler(error_handler)
     
+    return application
+
+
+def main():
+    """Run the Telegram bot"""
+    logger.info("=" * 50)
+    logger.info("RG Assistant Telegram Bot")
+    logger.info("=" * 50)
+    
+    # Several bots in this process, listed in a config file
+    if BOTS_CONFIG:
+        from main.tenants import run_tenants
+        run_tenants(BOTS_CONFIG)
+        return
+    
+    if TELEGRAM_BOT_TOKEN == "YOUR_BOT_TOKEN_HERE":
+        logger.error("❌ Please set your TELEGRAM_BOT_TOKEN!")
+        logger.error("Edit .env file or set environment variable")
+        return
+    
+    # Multi-process mode: a dispatcher routes updates to sharded workers
+    if BOT_WORKERS > 1:
+        from main.sharding import run_sharded
+        run_sharded(TELEGRAM_BOT_TOKEN, BOT_WORKERS)
+        return
+    
+    # Pick up the users of snapshots left by an earlier sharded run
+    if STATE_SNAPSHOT_PATH and shared_state is None:
+        from main.sharding import rebalance_snapshots
+        rebalance_snapshots(STATE_SNAPSHOT_PATH, 1)
+    
+    # Create the Application
+    application = build_application(TELEGRAM_BOT_TOKEN)
+    
     # Start polling
     logger.info("🤖 Bot is running...")
     logger.info("Send a message to your bot on Telegram!")
     
-    # Run the bot until Ctrl+C
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    # Run the bot until Ctrl+C / SIGINT (signals are handled in post_init)
+    application.run_polling(allowed_updates=Update.ALL_TYPES, stop_signals=None)
 
 
 if __name__ == "__main__":
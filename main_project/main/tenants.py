@@ -0,0 +1,341 @@
+"""
+RG Assistant - Multi-bot hosting
+
+Runs several branded bots, one Application each, in one process and one
+event loop. Each bot (tenant) keeps its own token, identity (name, company,
+creator, custom responses), admins and user state (settings, histories,
+usage stats, broadcasts, snapshot file). Everything else is shared: the
+Bot API and Cohere connection pools, model router, prompt and media caches,
+transcription/profiling workers, the job queue and analytics.
+
+Handlers find the bot they are serving through a context variable, set by a
+handler that runs before all others (and inherited by the tasks and threads
+they start). Per-bot state is declared with TenantLocal, which forwards to
+the current tenant's own instance. In single-bot mode there is only the
+default tenant and nothing changes.
+
+    BOTS_CONFIG=bots.json python -m main.telegram_server
+
+bots.json:
+    {"bots": [
+        {"name": "rg", "token_env": "RG_BOT_TOKEN"},
+        {"name": "acme", "token_env": "ACME_BOT_TOKEN", "bot_name": "Acme Helper",
+         "company_name": "Acme", "creator_name": "Jane Doe",
+         "creator_info": "...", "custom_responses": {"opening hours": "9 to 5"},
+         "contact": "acme_support", "payment_info": "...", "admin_user_ids": [12345]}
+    ]}
+
+Fields that are left out fall back to the single-bot settings. Files (state
+snapshot, stats, broadcast checkpoint) get a ".<name>" suffix per bot, and
+Redis keys a "<name>:" prefix.
+"""
+
+import asyncio
+import json
+import logging
+import re
+import signal
+import threading
+from contextvars import ContextVar
+
+from telegram.request import BaseRequest
+
+logger = logging.getLogger(__name__)
+
+# Connections shared by all bots for Bot API calls
+API_POOL_SIZE = 32
+
+# Seconds a getUpdates long poll waits for updates
+POLL_TIMEOUT = 10
+
+IDENTITY_FIELDS = ("bot_name", "company_name", "creator_name", "creator_info")
+# Shown by handlers but not part of the identity answers
+BRANDING_FIELDS = ("contact", "payment_info")
+
+_NAME = re.compile(r"^[a-z0-9_-]{1,32}$")
+
+_current = ContextVar("tenant", default=None)
+_default = None
+_tenants = {}  # name -> Tenant (multi-bot mode only)
+
+
+class Tenant:
+    """One hosted bot: its token, identity and per-bot state"""
+
+    def __init__(self, name: str, token: str, bot_name: str, company_name: str, creator_name: str,
+                 creator_info: str, custom_responses: dict, admin_user_ids, default: bool = False,
+                 contact: str = "", payment_info: str = ""):
+        self.name = name
+        self.token = token
+        self.bot_name = bot_name
+        self.company_name = company_name
+        self.creator_name = creator_name
+        self.creator_info = creator_info
+        self.contact = contact              # Telegram username, without the @
+        self.payment_info = payment_info    # how to pay for premium (/upgrade)
+        self.custom_responses = custom_responses
+        self.admin_user_ids = set(admin_user_ids)
+        self.default = default
+        self.bot = None        # set once the bot's Application is built
+        self.state = {}        # TenantLocal name -> this tenant's instance
+        self.snapshot = None   # startup snapshot (see telegram_server.restore_user)
+        self.snapshot_saved = False
+
+    def __repr__(self):
+        return f"Tenant({self.name!r})"
+
+    def path(self, base: str) -> str:
+        """Per-bot variant of a file path ("" stays disabled)"""
+        if not base or self.default:
+            return base
+        return f"{base}.{self.name}"
+
+    def key_prefix(self, base: str) -> str:
+        """Per-bot variant of a Redis key prefix"""
+        return base if self.default else f"{base}:{self.name}"
+
+
+def current_tenant() -> Tenant:
+    """The bot being served in this context (the default bot outside handlers)"""
+    return _current.get() or _default
+
+
+def activate_tenant(tenant: Tenant):
+    """Serve `tenant` for the rest of this task/thread context"""
+    _current.set(tenant)
+
+
+def set_default_tenant(tenant: Tenant):
+    global _default
+    _default = tenant
+
+
+def get_tenant(name: str = None):
+    """Tenant by name (None for the default bot); None if it is not hosted"""
+    if name is None or not _tenants and name == _default.name:
+        return _default
+    return _tenants.get(name)
+
+
+def all_tenants() -> list:
+    return list(_tenants.values()) or [_default]
+
+
+class TenantLocal:
+    """Per-bot instance of some state, created on first use by factory(tenant).
+
+    Attribute and item access are forwarded to the current tenant's instance,
+    so module code can keep using it like the plain object.
+    """
+
+    __slots__ = ("_name", "_factory")
+
+    def __init__(self, name: str, factory):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_factory", factory)
+
+    def _target(self, tenant: Tenant = None):
+        tenant = tenant or current_tenant()
+        value = tenant.state.get(self._name)
+        if value is None:
+            value = tenant.state[self._name] = self._factory(tenant)
+        return value
+
+    def instances(self, get=None):
+        """For reports: the single instance, or {tenant name: instance} when hosting
+        several bots (get(instance) instead of the instance if given)"""
+        found = {
+            tenant.name: get(tenant.state[self._name]) if get else tenant.state[self._name]
+            for tenant in all_tenants() if self._name in tenant.state
+        }
+        return next(iter(found.values())) if len(found) == 1 else found
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._target(), name, value)
+
+    def __getitem__(self, key):
+        return self._target()[key]
+
+    def __setitem__(self, key, value):
+        self._target()[key] = value
+
+    def __delitem__(self, key):
+        del self._target()[key]
+
+    def __contains__(self, key):
+        return key in self._target()
+
+    def __iter__(self):
+        return iter(self._target())
+
+    def __len__(self):
+        return len(self._target())
+
+    def __repr__(self):
+        return f"TenantLocal({self._name!r})"
+
+
+def load_tenants(path: str, defaults: Tenant, identity_responses) -> list:
+    """Read the bots config file; identity_responses(bot_name, company_name,
+    creator_name, creator_info) builds the built-in custom responses."""
+    import os
+
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+
+    tenants = []
+    for entry in config.get("bots", []):
+        name = entry.get("name", "")
+        if not _NAME.match(name) or any(t.name == name for t in tenants):
+            raise ValueError(f"{path}: bot names must be unique, lowercase letters/digits/_/- ({name!r})")
+        token = entry.get("token") or os.environ.get(entry.get("token_env", ""), "")
+        if not token:
+            raise ValueError(f"{path}: no token for bot {name!r} (set token or token_env)")
+
+        identity = {field: entry.get(field, getattr(defaults, field)) for field in IDENTITY_FIELDS}
+        responses = identity_responses(*(identity[field] for field in IDENTITY_FIELDS))
+        responses.update({key.lower(): value for key, value in entry.get("custom_responses", {}).items()})
+        branding = {field: entry.get(field, getattr(defaults, field)) for field in BRANDING_FIELDS}
+        tenants.append(Tenant(
+            name, token, custom_responses=responses,
+            admin_user_ids=entry.get("admin_user_ids", defaults.admin_user_ids), **identity, **branding,
+        ))
+    if not tenants:
+        raise ValueError(f"{path}: no bots configured")
+    return tenants
+
+
+# ============================================================================
+# SHARED BOT API CONNECTIONS
+# ============================================================================
+
+class SharedRequest(BaseRequest):
+    """One connection pool used by several Bots.
+
+    Bots initialize and shut down their requests with their Application;
+    this wrapper ignores that and the owner manages the pool instead.
+    """
+
+    def __init__(self, request: BaseRequest):
+        self.request = request
+
+    @property
+    def read_timeout(self):
+        return self.request.read_timeout
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, *args, **kwargs):
+        return await self.request.do_request(*args, **kwargs)
+
+
+# ============================================================================
+# RUNNER
+# ============================================================================
+
+def _save_snapshots(tenants: list):
+    """Drain watchdog: save every bot's snapshot before the platform kills us"""
+    from main import telegram_server as server
+
+    for tenant in tenants:
+        activate_tenant(tenant)
+        server.save_state_snapshot(final=False)
+
+
+async def _start_bot(server, tenant: Tenant, api, polls):
+    """Build and start one bot's Application (raises if Telegram rejects it)"""
+    from telegram import Update
+
+    application = server.build_application(
+        tenant.token, request=SharedRequest(api), get_updates_request=SharedRequest(polls), tenant=tenant,
+    )
+    await application.initialize()
+    try:
+        # Started from this tenant's context, so its update tasks inherit it
+        await application.updater.start_polling(allowed_updates=Update.ALL_TYPES, timeout=POLL_TIMEOUT)
+    except Exception:
+        await application.shutdown()
+        raise
+    tenant.bot = application.bot
+    server.restore_bot_state(application.bot)
+    server.start_services(application.bot)
+    await application.start()
+    return application
+
+
+async def _run(tenants: list):
+    from telegram.request import HTTPXRequest
+
+    from main import telegram_server as server
+
+    api = HTTPXRequest(connection_pool_size=API_POOL_SIZE)
+    # Each bot keeps one getUpdates long poll open
+    polls = HTTPXRequest(connection_pool_size=len(tenants) + 1, read_timeout=POLL_TIMEOUT + 5)
+    await api.initialize()
+    await polls.initialize()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    applications = []
+    try:
+        for tenant in tenants:
+            activate_tenant(tenant)
+            try:
+                application = await _start_bot(server, tenant, api, polls)
+            except Exception as e:
+                # e.g. a revoked token: the other bots keep running
+                logger.error("❌ %s: could not start, skipping it: %r", tenant.name, e)
+                # Its queued jobs fail rather than being answered by another bot
+                _tenants.pop(tenant.name, None)
+                continue
+            applications.append((tenant, application))
+            logger.info("🤖 %s: @%s is running", tenant.name, application.bot.username)
+
+        if not applications:
+            logger.error("No bot could be started")
+            return
+        logger.info("Hosting %d of %d bots", len(applications), len(tenants))
+        await stop.wait()
+        logger.info("🛑 Shutdown requested, draining (up to %.0fs)...", server.DRAIN_TIMEOUT)
+        watchdog = threading.Timer(server.DRAIN_TIMEOUT, _save_snapshots, ([t for t, _ in applications],))
+        watchdog.daemon = True
+        watchdog.start()
+    finally:
+        for tenant, application in applications:
+            activate_tenant(tenant)
+            if application.updater.running:
+                await application.updater.stop()
+            if application.running:
+                await application.stop()
+            await server.broadcast_engine.stop()
+        await server.stop_services()
+        for tenant, application in applications:
+            activate_tenant(tenant)
+            server.save_state_snapshot()
+            server.save_usage_stats()
+            await application.shutdown()
+        await api.shutdown()
+        await polls.shutdown()
+
+
+def run_tenants(config_path: str):
+    """Host every bot in the config file until SIGINT/SIGTERM"""
+    from main import telegram_server as server
+
+    tenants = load_tenants(config_path, current_tenant(), server.identity_responses)
+    for tenant in tenants:
+        _tenants[tenant.name] = tenant
+    asyncio.run(_run(tenants))
@@ -0,0 +1,157 @@
+"""
+RG Assistant - Voice transcription
+
+Long voice notes are cut at pauses into segments of at most SEGMENT_MAX_MS,
+and the segments are transcribed concurrently on a thread pool (the
+speech-to-text call is network bound). Results are stitched back in order and
+the in-order prefix is reported as soon as it grows, so the user sees the
+transcript build up while the rest is still being recognized.
+"""
+
+import asyncio
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for one speech-to-text request
+SEGMENT_MAX_MS = 30000
+# Don't cut into pieces shorter than this when looking for a pause
+SEGMENT_MIN_MS = 5000
+
+# A pause is at least this long and this far below the average loudness
+MIN_SILENCE_MS = 400
+SILENCE_BELOW_AVERAGE_DB = 16
+# Resolution of the silence scan
+SEEK_STEP_MS = 20
+
+# Marks a segment whose speech could not be recognized
+UNRECOGNIZED = "…"
+
+
+# ============================================================================
+# SEGMENTATION
+# ============================================================================
+
+def plan_segments(length_ms: int, silences: list, max_ms: int = SEGMENT_MAX_MS,
+                  min_ms: int = SEGMENT_MIN_MS) -> list:
+    """Choose (start, end) cut points, preferring the middle of silences"""
+    cuts = [(start + end) // 2 for start, end in silences]
+    segments = []
+    start = 0
+    while length_ms - start > max_ms:
+        limit = start + max_ms
+        candidates = [c for c in cuts if start + min_ms <= c <= limit]
+        end = candidates[-1] if candidates else limit
+        segments.append((start, end))
+        start = end
+    segments.append((start, length_ms))
+    return segments
+
+
+def split_voice(data: bytes, max_ms: int = SEGMENT_MAX_MS) -> list:
+    """Decode a voice note and return its segments as WAV bytes (blocking)"""
+    from pydub import AudioSegment
+    from pydub.silence import detect_silence
+
+    try:
+        sound = AudioSegment.from_file(io.BytesIO(data), format="ogg")
+    except Exception as e:
+        logger.error("Audio conversion error: %s", e)
+        # Try the original bytes as is
+        return [data]
+
+    silences = []
+    if len(sound) > max_ms:
+        silences = detect_silence(
+            sound,
+            min_silence_len=MIN_SILENCE_MS,
+            silence_thresh=sound.dBFS - SILENCE_BELOW_AVERAGE_DB,
+            seek_step=SEEK_STEP_MS,
+        )
+
+    segments = []
+    for start, end in plan_segments(len(sound), silences, max_ms):
+        wav = io.BytesIO()
+        sound[start:end].export(wav, format="wav")
+        segments.append(wav.getvalue())
+    return segments
+
+
+def recognize(wav: bytes) -> str:
+    """Transcribe one WAV segment with Google Speech Recognition (blocking)"""
+    import speech_recognition as sr
+
+    recognizer = sr.Recognizer()
+    with sr.AudioFile(io.BytesIO(wav)) as source:
+        audio_data = recognizer.record(source)
+    return recognizer.recognize_google(audio_data)
+
+
+# ============================================================================
+# TRANSCRIBER
+# ============================================================================
+
+class Transcriber:
+    """Splits voice notes and transcribes the segments in parallel"""
+
+    def __init__(self, workers: int = 4, max_ms: int = SEGMENT_MAX_MS, recognize_fn=recognize):
+        self.max_ms = max_ms
+        self.recognize_fn = recognize_fn
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="transcribe")
+
+    async def transcribe(self, data: bytes, on_partial=None) -> str:
+        """Transcribe a voice note.
+
+        on_partial(text, done, total) is awaited whenever the in-order prefix
+        of recognized segments grows. Raises speech_recognition's
+        RequestError if the service failed for any segment (a transcript with
+        gaps is never returned, so it is not cached) and UnknownValueError if
+        nothing was recognized.
+        """
+        import speech_recognition as sr
+
+        loop = asyncio.get_running_loop()
+        segments = await loop.run_in_executor(self._pool, split_voice, data, self.max_ms)
+        total = len(segments)
+
+        async def run_segment(index, wav):
+            try:
+                return index, await loop.run_in_executor(self._pool, self.recognize_fn, wav), None
+            except sr.UnknownValueError:
+                return index, UNRECOGNIZED, None
+            except sr.RequestError as e:
+                return index, UNRECOGNIZED, e
+
+        results = [None] * total
+        errors = []
+        shown = 0
+
+        for finished in asyncio.as_completed([run_segment(i, wav) for i, wav in enumerate(segments)]):
+            index, text, error = await finished
+            results[index] = text
+            if error is not None:
+                errors.append(error)
+
+            # Report the transcript up to the first segment still running
+            ready = shown
+            while ready < total and results[ready] is not None:
+                ready += 1
+            if ready > shown:
+                shown = ready
+                if on_partial is not None and shown < total:
+                    await on_partial(_join(results[:shown]), shown, total)
+
+        if errors:
+            raise errors[0]
+        if all(text == UNRECOGNIZED for text in results):
+            raise sr.UnknownValueError()
+        return _join(results)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _join(parts: list) -> str:
+    return " ".join(part for part in parts if part)
@@ -0,0 +1,296 @@
+"""
+RG Assistant - Compact per-user state
+
+Each user's settings, daily usage and message/ad counters are kept in a single
+__slots__ record of small integers: tones and languages are stored as enum
+indexes and dates as days since 1970-01-01. This takes a fraction of the
+memory of the nested dicts used before.
+
+To compare memory per user:
+    python -m main.user_state --users 100000
+"""
+
+from collections.abc import MutableMapping
+from datetime import date, datetime
+
+TONES = ["friendly", "professional", "casual", "formal"]
+LANGUAGES = ["en", "fr", "es", "de", "pt", "ar"]
+
+DEFAULT_TONE = 0
+DEFAULT_LANGUAGE = 0
+
+# Marker for "no date"
+NO_DAY = -1
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+# ============================================================================
+# ENUMS & DATES
+# ============================================================================
+
+def enum_index(table: list, value: str, default: int = None) -> int:
+    """Index of a value in an enum table.
+
+    Unknown values map to `default`, or raise ValueError if there is none
+    (the tables are shared by every user, so they never grow).
+    """
+    try:
+        return table.index(value)
+    except ValueError:
+        if default is None:
+            raise ValueError(f"Unknown value {value!r}, expected one of {table}")
+        return default
+
+
+def to_epoch_day(day: date) -> int:
+    """Convert a date to days since 1970-01-01"""
+    return day.toordinal() - _EPOCH_ORDINAL
+
+
+def today_epoch_day() -> int:
+    """Today's date (local time) as an epoch day"""
+    return to_epoch_day(datetime.now().date())
+
+
+def day_from_str(value) -> int:
+    """Parse a YYYY-MM-DD string (or None) into an epoch day"""
+    if not value:
+        return NO_DAY
+    return to_epoch_day(date.fromisoformat(value))
+
+
+def day_to_str(day: int):
+    """Format an epoch day as YYYY-MM-DD (None for NO_DAY)"""
+    if day == NO_DAY:
+        return None
+    return date.fromordinal(day + _EPOCH_ORDINAL).isoformat()
+
+
+# ============================================================================
+# USER RECORD
+# ============================================================================
+
+class UsageView(MutableMapping):
+    """The old settings["usage"] dict, backed by a UserState's fields"""
+
+    __slots__ = ("_state",)
+
+    # key -> (attribute, to dict value, from dict value)
+    _FIELDS = {
+        "date": ("usage_day", day_to_str, day_from_str),
+        "used": ("used", int, int),
+        "unlimited_until": ("premium_until", day_to_str, day_from_str),
+    }
+
+    def __init__(self, state):
+        self._state = state
+
+    def __getitem__(self, key):
+        attr, to_value, _ = self._FIELDS[key]
+        return to_value(getattr(self._state, attr))
+
+    def __setitem__(self, key, value):
+        attr, _, from_value = self._FIELDS[key]
+        setattr(self._state, attr, from_value(value))
+
+    def __delitem__(self, key):
+        raise TypeError("usage fields cannot be removed")
+
+    def __iter__(self):
+        return iter(self._FIELDS)
+
+    def __len__(self):
+        return len(self._FIELDS)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class UserState:
+    """Settings, usage and counters for one user"""
+
+    __slots__ = (
+        "tone_id",
+        "language_id",
+        "notifications",
+        "usage_day",
+        "used",
+        "premium_until",
+        "message_count",
+        "ads_shown",
+        "last_ad",
+    )
+
+    def __init__(self):
+        self.tone_id = DEFAULT_TONE
+        self.language_id = DEFAULT_LANGUAGE
+        self.notifications = True
+        self.usage_day = NO_DAY
+        self.used = 0
+        self.premium_until = NO_DAY
+        self.message_count = 0
+        self.ads_shown = 0
+        self.last_ad = -1
+
+    @property
+    def tone(self) -> str:
+        return TONES[self.tone_id]
+
+    @tone.setter
+    def tone(self, value: str):
+        self.tone_id = enum_index(TONES, value)
+
+    @property
+    def language(self) -> str:
+        return LANGUAGES[self.language_id]
+
+    @language.setter
+    def language(self, value: str):
+        self.language_id = enum_index(LANGUAGES, value)
+
+    def roll_day(self, today: int):
+        """Reset the daily usage and ad counters on a new day"""
+        if self.usage_day != today:
+            self.usage_day = today
+            self.used = 0
+            self.ads_shown = 0
+
+    def is_premium(self, today: int) -> bool:
+        return self.premium_until != NO_DAY and self.premium_until >= today
+
+    # ------------------------------------------------------------------------
+    # Dict-style access (settings used to be plain dicts)
+    # ------------------------------------------------------------------------
+
+    def to_dict(self) -> dict:
+        return {
+            "tone": self.tone,
+            "language": self.language,
+            "notifications": self.notifications,
+            "usage": dict(UsageView(self)),
+        }
+
+    def __getitem__(self, key):
+        if key in ("tone", "language", "notifications"):
+            return getattr(self, key)
+        if key == "usage":
+            # Writes to the returned mapping update this record
+            return UsageView(self)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in ("tone", "language", "notifications"):
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    # ------------------------------------------------------------------------
+    # Serialization (snapshots)
+    # ------------------------------------------------------------------------
+
+    def to_record(self) -> list:
+        """Compact list form; enums are stored by name to survive reordering"""
+        return [
+            self.tone,
+            self.language,
+            self.notifications,
+            self.usage_day,
+            self.used,
+            self.premium_until,
+            self.message_count,
+            self.ads_shown,
+        ]
+
+    @classmethod
+    def from_record(cls, record):
+        """Rebuild from to_record() output, or from the old settings dict"""
+        state = cls()
+        if isinstance(record, dict):
+            usage = record.get("usage") or {}
+            state.tone_id = enum_index(TONES, record.get("tone"), DEFAULT_TONE)
+            state.language_id = enum_index(LANGUAGES, record.get("language"), DEFAULT_LANGUAGE)
+            state.notifications = bool(record.get("notifications", True))
+            state.usage_day = day_from_str(usage.get("date"))
+            state.used = int(usage.get("used") or 0)
+            state.premium_until = day_from_str(usage.get("unlimited_until"))
+            return state
+
+        (tone, language, state.notifications, state.usage_day,
+         state.used, state.premium_until, state.message_count) = record[:7]
+        if len(record) > 7:
+            state.ads_shown = record[7]
+        # Values a later version added (or an old one dropped) fall back to the defaults
+        state.tone_id = enum_index(TONES, tone, DEFAULT_TONE)
+        state.language_id = enum_index(LANGUAGES, language, DEFAULT_LANGUAGE)
+        return state
+
+    def __repr__(self):
+        return f"UserState({self.to_dict()}, message_count={self.message_count})"
+
+
+# ============================================================================
+# BENCHMARK
+# ============================================================================
+
+def _legacy_settings(user_id: int) -> dict:
+    """The nested dict layout used before UserState"""
+    return {
+        "tone": "friendly",
+        "language": "en",
+        "notifications": True,
+        "usage": {"date": datetime.now().strftime("%Y-%m-%d"), "used": user_id % 10, "unlimited_until": None},
+    }
+
+
+def measure_bytes_per_user(users: int = 100000):
+    """Return (legacy_bytes, compact_bytes) per user, measured with tracemalloc"""
+    import tracemalloc
+
+    def measure(build):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        data = build()
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del data
+        return (after - before) / users
+
+    def build_legacy():
+        settings = {}
+        counts = {}
+        for user_id in range(10**9, 10**9 + users):
+            settings[user_id] = _legacy_settings(user_id)
+            counts[user_id] = user_id % 50
+        return settings, counts
+
+    def build_compact():
+        today = today_epoch_day()
+        states = {}
+        for user_id in range(10**9, 10**9 + users):
+            state = UserState()
+            state.usage_day = today
+            state.used = user_id % 10
+            state.message_count = user_id % 50
+            states[user_id] = state
+        return states
+
+    return measure(build_legacy), measure(build_compact)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Per-user state memory benchmark")
+    parser.add_argument("--users", type=int, default=100000)
+    args = parser.parse_args()
+
+    legacy, compact = measure_bytes_per_user(args.users)
+    print(f"Users:            {args.users}")
+    print(f"Nested dicts:     {legacy:.0f} bytes/user")
+    print(f"UserState slots:  {compact:.0f} bytes/user ({legacy / compact:.1f}x smaller)")
@@ -0,0 +1,16 @@
+import os
+import tempfile
+
+# Keep the server's stores out of the working tree: importing
+# main.telegram_server opens them at their default paths
+_data_dir = tempfile.mkdtemp(prefix="rg-tests-")
+for _name, _file in [
+    ("ANALYTICS_PATH", "analytics.db"),
+    ("STATE_SNAPSHOT_PATH", "state.snapshot"),
+    ("STATS_PATH", "stats.json"),
+    ("JOBS_PATH", "jobs.db"),
+    ("MEDIA_CACHE_DIR", "media_cache"),
+    ("BROADCAST_CHECKPOINT_PATH", "broadcast.json"),
+    ("COUPON_REDEEMED_PATH", "redeemed_coupons"),
+]:
+    os.environ.setdefault(_name, os.path.join(_data_dir, _file))
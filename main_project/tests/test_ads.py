@@ -0,0 +1,20 @@
+from main import telegram_server as ts
+from main.standins import RedisStandIn
+from main.state_backend import RedisStateBackend
+
+
+def test_daily_ad_cap_is_shared_through_the_backend(monkeypatch):
+    redis = RedisStandIn()
+    # Two instances on the same store
+    instances = [RedisStateBackend(redis), RedisStateBackend(redis)]
+    monkeypatch.setattr(ts, "ADS_DAILY_CAP", 3)
+
+    shown = []
+    for i in range(6):
+        monkeypatch.setattr(ts, "shared_state", instances[i % 2])
+        shown.append(ts.pick_ad(42))
+
+    assert all(ad is not None for ad in shown[:3])
+    assert shown[3:] == [None, None, None]
+    # Other users have their own count
+    assert ts.pick_ad(43) is not None
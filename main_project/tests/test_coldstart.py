@@ -0,0 +1,9 @@
+from main.coldstart import DEFAULT_BUDGET, measure_first_update
+
+
+def test_first_update_within_budget():
+    first_update = measure_first_update()
+    assert first_update <= DEFAULT_BUDGET, (
+        f"Time to first update {first_update * 1000:.0f}ms is over the {DEFAULT_BUDGET * 1000:.0f}ms budget "
+        f"(see python -m main.coldstart for the slowest imports)"
+    )
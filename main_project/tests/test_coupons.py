@@ -0,0 +1,28 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from main.coupons import NONCE_SIZE, RedeemedNonces
+
+
+def test_nonce_is_claimed_once_across_stores(tmp_path):
+    path = str(tmp_path / "coupons.redeemed")
+    # Two stores on one file stand for two processes or instances
+    stores = [RedeemedNonces(path), RedeemedNonces(path)]
+    nonce = b"\x01" * NONCE_SIZE
+
+    with ThreadPoolExecutor(8) as pool:
+        claims = list(pool.map(lambda i: stores[i % 2].claim(nonce), range(16)))
+
+    assert claims.count(True) == 1
+    assert stores[0].claim(b"\x02" * NONCE_SIZE)
+    assert not stores[1].claim(b"\x02" * NONCE_SIZE)
+
+
+def test_legacy_nonce_file_is_imported(tmp_path):
+    path = tmp_path / "coupons.redeemed"
+    path.write_bytes(b"\x01" * NONCE_SIZE + b"\x02" * NONCE_SIZE)
+
+    store = RedeemedNonces(str(path))
+    assert not store.claim(b"\x01" * NONCE_SIZE)
+    assert not store.claim(b"\x02" * NONCE_SIZE)
+    assert store.claim(b"\x03" * NONCE_SIZE)
+    assert len(store) == 3
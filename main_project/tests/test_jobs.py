@@ -0,0 +1,54 @@
+import asyncio
+
+from main.jobs import JobQueue
+
+
+async def run_queue(queue, seconds=0.3):
+    queue.start(bot=None)
+    await asyncio.sleep(seconds)
+    await queue.stop()
+
+
+def test_abandoned_job_on_last_attempt_fails():
+    queue = JobQueue("", max_attempts=3)
+    runs, failures = [], []
+
+    async def run(bot, job):
+        runs.append(job.id)
+
+    async def on_failed(bot, job, error):
+        failures.append(job.id)
+
+    queue.register("voice", run, on_failed)
+
+    async def main():
+        job_id = await queue.enqueue("voice", {})
+        # As left behind by a process that died during its third attempt
+        queue._connect().execute("UPDATE jobs SET status = 'running', attempts = 3, lease_until = 0")
+        await run_queue(queue)
+        return job_id
+
+    job_id = asyncio.run(main())
+    assert runs == []
+    assert failures == [job_id]
+    assert queue.counts() == {"failed": 1}
+
+
+def test_completed_job_is_not_retried():
+    queue = JobQueue("", max_attempts=3, backoff_base=0.01)
+    replies = []
+
+    async def run(bot, job):
+        await queue.complete(job)
+        replies.append(job.id)
+        raise ConnectionError("send failed")
+
+    queue.register("voice", run)
+
+    async def main():
+        await queue.enqueue("voice", {})
+        await run_queue(queue)
+
+    asyncio.run(main())
+    assert len(replies) == 1
+    assert queue.counts() == {"done": 1}
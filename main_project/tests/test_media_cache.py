@@ -0,0 +1,15 @@
+from main.media_cache import DiskBlobStore
+
+
+def test_disk_cap_covers_all_workers(tmp_path):
+    directory = str(tmp_path / "blobs")
+    workers = [DiskBlobStore(directory, max_bytes=1000, sweep_interval=0) for _ in range(3)]
+
+    for i in range(30):
+        workers[i % 3].put(f"file{i}", bytes(100))
+
+    usage = sum(path.stat().st_size for path in (tmp_path / "blobs").iterdir())
+    assert usage <= 1000
+    # The most recent files survive, whichever worker wrote them
+    assert workers[0].get("file29") == bytes(100)
+    assert workers[1].get("file0") is None
@@ -0,0 +1,27 @@
+import pytest
+
+from main.prompt_cache import SemanticCache
+
+
+@pytest.mark.parametrize("stored, asked", [
+    ("how to install X", "how to uninstall X"),
+    ("is it safe", "is it unsafe"),
+    ("is it safe", "is it not safe"),
+    ("explain recursion", "explain recursion in c"),
+    ("what is 2+2", "what is 2+3"),
+])
+def test_different_questions_do_not_collide(stored, asked):
+    cache = SemanticCache()
+    cache.store(stored, "answer")
+    assert cache.lookup(asked) is None
+    assert cache.lookup(stored) == "answer"
+
+
+@pytest.mark.parametrize("stored, asked", [
+    ("what's the capital of France?", "What is the capital of France"),
+    ("How do I reverse a list in Python?", "how can I reverse a list in python"),
+])
+def test_rewordings_hit(stored, asked):
+    cache = SemanticCache()
+    cache.store(stored, "answer")
+    assert cache.lookup(asked) == "answer"
@@ -0,0 +1,84 @@
+import pytest
+
+from main import telegram_server as ts
+from main.prompt_cache import SemanticCache
+from main.routing import HEAVY, LIGHT, MAX_TOKENS, ModelRouter, Route, classify
+from main.standins import CohereStandIn
+
+FAST, STRONG, STRONG2 = "fast-model", "strong-model", "strong-model-2"
+
+
+@pytest.fixture
+def cohere():
+    standin = CohereStandIn(latency={FAST: 0.01, STRONG: 0.1, STRONG2: 0.1}).start()
+    yield standin
+    standin.stop()
+
+
+@pytest.fixture
+def send(cohere, monkeypatch):
+    monkeypatch.setattr(ts, "COHERE_API_URL", cohere.url)
+    monkeypatch.setattr(ts, "prompt_cache", SemanticCache(max_entries=0))
+
+    def send(router, prompt, task="chat"):
+        """Answer a prompt with the real get_ai_response; returns the models tried"""
+        monkeypatch.setattr(ts, "model_router", router)
+        seen = len(cohere.requests)
+        ts.get_ai_response(prompt, user_id=1, task=task)
+        return [request["model"] for request in cohere.requests[seen:]]
+
+    return send
+
+
+def test_classify():
+    assert classify("hi") == LIGHT
+    assert classify("x" * 301) == HEAVY
+    assert classify("hi", history_turns=9) == HEAVY
+    assert classify("Please explain this") == HEAVY
+    assert classify("hi", task="document") == HEAVY
+
+
+def test_heavy_requests_use_strong_model():
+    router = ModelRouter([FAST], [STRONG], explore_rate=0)
+    route = router.route("Write an essay about rivers")
+    assert route.model == STRONG
+    assert route.max_tokens == MAX_TOKENS[HEAVY]
+
+
+def test_light_requests_follow_latency(cohere, send):
+    router = ModelRouter([FAST], [STRONG], explore_rate=0)
+    # Unmeasured models get tried once, then the fastest one keeps the traffic
+    models = [send(router, "hi")[0] for _ in range(10)]
+    assert set(models) == {FAST, STRONG}
+    assert models[-5:] == [FAST] * 5
+
+    # The fast model slows down: light traffic moves to the strong model
+    cohere.latency[FAST] = 0.5
+    models = [send(router, "hi")[0] for _ in range(5)]
+    assert STRONG in models
+
+
+def test_failures_are_penalized():
+    router = ModelRouter([FAST], [STRONG], explore_rate=0)
+    fast, strong = Route(FAST, MAX_TOKENS[LIGHT], LIGHT), Route(STRONG, MAX_TOKENS[LIGHT], LIGHT)
+    router.record(fast, 0.01)
+    router.record(strong, 0.2)
+    assert router.route("hi").model == FAST
+    router.record(fast, 0.01, ok=False)
+    assert router.route("hi").model == STRONG
+    # Successes work the penalty off again
+    router.record(fast, 0.01)
+    assert router.route("hi").model == FAST
+
+
+def test_fallback_retries_once(cohere, send):
+    router = ModelRouter([FAST], [STRONG, STRONG2], explore_rate=0)
+    cohere.status = 500
+    assert send(router, "hi") == [FAST, STRONG]
+    assert len(cohere.requests) == 2
+
+
+def test_fallback_recovers_on_strong_model(cohere, send):
+    router = ModelRouter([FAST], [STRONG], explore_rate=0)
+    cohere.status = {FAST: 500}
+    assert send(router, "hi") == [FAST, STRONG]
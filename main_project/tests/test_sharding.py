@@ -0,0 +1,78 @@
+import asyncio
+
+from telegram import Update
+
+from main import sharding
+from main import telegram_server as ts
+
+
+def test_worker_does_not_record_updates(tmp_path, monkeypatch):
+    log = tmp_path / "updates.jsonl.gz"
+    monkeypatch.setattr(ts.update_recorder, "path", str(log))
+    monkeypatch.setattr(ts.job_queue, "path", ts.job_queue.path)
+    monkeypatch.setattr(ts.usage_stats, "path", ts.usage_stats.path)
+    monkeypatch.setattr(ts.broadcast_engine, "checkpoint_path", ts.broadcast_engine.checkpoint_path)
+
+    sharding._configure_worker(0)
+
+    async def run():
+        ts.update_recorder.start()
+        ts.update_recorder.record(Update(update_id=1))
+        await ts.update_recorder.stop()
+
+    asyncio.run(run())
+    assert not log.exists()
+
+
+def test_snapshots_follow_users_when_workers_change(tmp_path):
+    from main.snapshot import open_snapshot, write_snapshot
+
+    base = str(tmp_path / "state.snapshot")
+    users = {user_id: {"settings": [], "history": [user_id]} for user_id in range(1, 201)}
+    write_snapshot(base, users.items())
+
+    def layout(workers):
+        found = {}
+        for slot, path in enumerate(sharding.snapshot_paths(base, workers)):
+            reader = open_snapshot(path)
+            for user_id, _ in reader.remaining():
+                found[user_id] = slot
+                assert reader.take(user_id) == users[user_id]
+            reader.close()
+        return found
+
+    for workers in (3, 2, 1):
+        assert sharding.rebalance_snapshots(base, workers) == len(users)
+        ring = sharding.HashRing(range(workers))
+        assert layout(workers) == {user_id: ring.get(user_id) if workers > 1 else 0 for user_id in users}
+        assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+            p.rsplit("/", 1)[1] for p in sharding.snapshot_paths(base, workers)
+        )
+        # Nothing to do once the layout matches
+        assert sharding.rebalance_snapshots(base, workers) == 0
+
+
+def test_stats_merge_other_workers(tmp_path, monkeypatch):
+    from main.stats import UsageStats
+
+    base = str(tmp_path / "stats.json")
+    monkeypatch.setattr(ts, "SHARDED", True)
+    monkeypatch.setattr(ts, "BOT_WORKERS", 2)
+    monkeypatch.setattr(ts, "STATS_PATH", base)
+
+    other = UsageStats(f"{base}.1")
+    for user_id in range(50, 150):
+        other.record_prompt(user_id, allowed=True)
+    other.save()
+
+    local = UsageStats(f"{base}.0")
+    for user_id in range(100):
+        local.record_prompt(user_id, allowed=True)
+    monkeypatch.setattr(ts, "usage_stats", local)
+
+    merged = ts.cluster_usage_stats()
+    assert merged.totals(1)["prompts"] == 200
+    # Users seen by both workers are counted once
+    assert 145 <= merged.distinct_users(1) <= 155
+    # The worker's own stats are not changed by the merge
+    assert local.totals(1)["prompts"] == 100
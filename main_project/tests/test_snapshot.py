@@ -0,0 +1,37 @@
+from main import telegram_server as ts
+from main.snapshot import open_snapshot, write_snapshot
+from main.user_state import UserState
+
+
+def read_tones(path):
+    reader = open_snapshot(path)
+    tones = {user_id: reader.take(user_id)["settings"][0] for user_id, _ in list(reader.remaining())}
+    reader.close()
+    return tones
+
+
+def test_final_save_keeps_changes_made_after_the_watchdog(tmp_path, monkeypatch):
+    path = str(tmp_path / "state.snapshot")
+    tenant = ts.current_tenant()
+    monkeypatch.setattr(tenant, "snapshot_saved", False)
+    monkeypatch.setattr(tenant, "snapshot", None)
+    monkeypatch.setattr(ts, "user_settings", {})
+    monkeypatch.setattr(ts, "user_conversations", {})
+
+    # A user from the last run who has not written yet
+    write_snapshot(path, [(3, {"settings": UserState().to_record(), "history": []})])
+    ts.load_state_snapshot(path)
+
+    ts.user_settings[1] = UserState()
+    ts.save_state_snapshot(path, final=False)  # drain watchdog
+
+    ts.user_settings[1].tone = "formal"
+    ts.user_settings[2] = UserState()
+    ts.save_state_snapshot(path)
+    assert read_tones(path) == {1: "formal", 2: "friendly", 3: "friendly"}
+
+    # The final save runs once
+    ts.user_settings[2].tone = "casual"
+    ts.save_state_snapshot(path, final=False)
+    ts.save_state_snapshot(path)
+    assert read_tones(path)[2] == "friendly"
@@ -0,0 +1,85 @@
+from datetime import date
+
+import pytest
+
+from main.standins import RedisStandIn
+from main.state_backend import RedisStateBackend
+from main.user_state import to_epoch_day
+
+
+@pytest.fixture
+def backend():
+    return RedisStateBackend(RedisStandIn(), history_limit=4)
+
+
+def test_settings_round_trip(backend):
+    assert backend.get_settings(1).tone == "friendly"
+    backend.set_setting(1, "tone", "formal")
+    backend.set_setting(1, "notifications", False)
+    backend.set_premium_until(1, "2030-01-01")
+
+    settings = backend.get_settings(1)
+    assert settings.tone == "formal"
+    assert settings.notifications is False
+    assert settings.premium_until == to_epoch_day(date(2030, 1, 1))
+    assert backend.get_settings(2).tone == "friendly"
+
+
+def test_settings_changes_write_through(backend):
+    settings = backend.get_settings(1)
+    settings.tone = "casual"
+    settings.language = "fr"
+    settings.notifications = False
+    settings["tone"] = "professional"
+
+    stored = backend.get_settings(1)
+    assert (stored.tone, stored.language, stored.notifications) == ("professional", "fr", False)
+
+
+def test_message_count_increments(backend):
+    assert [backend.incr_message_count(1) for _ in range(3)] == [1, 2, 3]
+    assert backend.get_settings(1).message_count == 3
+
+
+def test_quota_is_consumed_and_reset_daily(backend):
+    results = [backend.consume_prompt(1, "2026-01-01", 2) for _ in range(3)]
+    assert results == [(True, 1), (True, 0), (False, 0)]
+    assert backend.consume_prompt(1, "2026-01-02", 2) == (True, 1)
+
+    backend.set_premium_until(1, "2026-12-31")
+    assert backend.consume_prompt(1, "2026-01-02", 2) == (True, None)
+
+
+def test_history_is_capped_and_loaded_with_the_quota(backend):
+    for i in range(3):
+        backend.append_history(1, [{"role": "USER", "message": f"q{i}"}, {"role": "CHATBOT", "message": f"a{i}"}])
+    assert [turn["message"] for turn in backend.get_history(1)] == ["q1", "a1", "q2", "a2"]
+
+    allowed, remaining, history = backend.consume_and_load(1, "2026-01-01", 5)
+    assert (allowed, remaining, len(history)) == (True, 4, 4)
+
+    backend.clear_history(1)
+    assert backend.get_history(1) == []
+
+
+def test_users_are_listed_and_deleted(backend):
+    for user_id in (1, 2, 3):
+        backend.incr_message_count(user_id)
+    backend.append_history(2, [{"role": "USER", "message": "hi"}])
+    assert sorted(backend.iter_user_ids()) == [1, 2, 3]
+
+    backend.delete_user(2)
+    assert sorted(backend.iter_user_ids()) == [1, 3]
+    assert backend.get_history(2) == []
+
+
+def test_prefixes_keep_bots_apart(backend):
+    other = backend.with_prefix("rg:other")
+    backend.set_setting(1, "tone", "formal")
+    assert other.get_settings(1).tone == "friendly"
+    assert list(other.iter_user_ids()) == []
+
+
+def test_coupon_is_claimed_once(backend):
+    assert backend.claim_coupon("abcdef", 60)
+    assert not backend.with_prefix("rg:other").claim_coupon("abcdef", 60)
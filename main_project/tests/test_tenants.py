@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+from telegram import Bot, Update
+
+from main import telegram_server as ts
+from main.standins import TelegramStandIn
+from main.tenants import activate_tenant, current_tenant, load_tenants
+
+
+def acme_tenant(tmp_path):
+    config = tmp_path / "bots.json"
+    config.write_text(json.dumps({"bots": [{
+        "name": "acme", "token": "456:ACME", "bot_name": "Acme Helper", "company_name": "Acme",
+        "creator_name": "Jane Doe", "contact": "acme_support", "payment_info": "Pay at acme.example",
+    }]}))
+    return load_tenants(str(config), current_tenant(), ts.identity_responses)[0]
+
+
+def run_command(tenant, handler, text):
+    """Run a command handler as `tenant` and return the texts it sent"""
+    request = TelegramStandIn()
+
+    async def run():
+        bot = Bot(tenant.token, request=request)
+        await bot.initialize()
+        update = Update.de_json({
+            "update_id": 1,
+            "message": {
+                "message_id": 1, "date": 0, "text": text,
+                "chat": {"id": 5, "type": "private"},
+                "from": {"id": 5, "is_bot": False, "first_name": "User"},
+            },
+        }, bot)
+        activate_tenant(tenant)
+        await handler(update, None)
+
+    asyncio.run(run())
+    return [params["text"] for endpoint, params in request.calls if endpoint == "sendMessage"]
+
+
+def test_start_uses_the_bots_own_name(tmp_path):
+    tenant = acme_tenant(tmp_path)
+    [reply] = run_command(tenant, ts.start_command, "/start")
+    assert "Acme Helper" in reply
+    assert ts.BOT_NAME not in reply
+
+    [reply] = run_command(current_tenant(), ts.start_command, "/start")
+    assert ts.BOT_NAME in reply
+
+
+def test_about_and_upgrade_use_the_bots_branding(tmp_path):
+    tenant = acme_tenant(tmp_path)
+    [about] = run_command(tenant, ts.about_command, "/about")
+    [upgrade] = run_command(tenant, ts.upgrade_command, "/upgrade")
+
+    assert "Acme" in about and "Jane Doe" in about
+    assert ts.COMPANY_NAME not in about and ts.CREATOR_NAME not in about
+    assert "Pay at acme.example" in upgrade
+    assert "rosch_ebori" not in upgrade
+
+
+def test_ads_use_the_bots_contact(tmp_path):
+    tenant = acme_tenant(tmp_path)
+    activate_tenant(tenant)
+    try:
+        texts = [ts.brand_text(ad["text"]) for ad in ts.ADS] + [ts.brand_text(link) for ad in ts.ADS for link in ad.get("links", [])]
+    finally:
+        activate_tenant(None)
+    assert any("@acme_support" in text for text in texts)
+    assert not any(ts.BOT_NAME in text or ts.CREATOR_CONTACT in text for text in texts)
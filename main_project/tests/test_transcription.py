@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+import speech_recognition as sr
+
+from main import transcription
+from main.transcription import Transcriber
+
+
+def recognize(wav):
+    if wav == b"down":
+        raise sr.RequestError("service unavailable")
+    if wav == b"noise":
+        raise sr.UnknownValueError()
+    return wav.decode()
+
+
+def transcribe():
+    transcriber = Transcriber(workers=2, recognize_fn=recognize)
+    try:
+        return asyncio.run(transcriber.transcribe(b"voice"))
+    finally:
+        transcriber.shutdown()
+
+
+@pytest.fixture
+def segments(monkeypatch):
+    found = []
+    monkeypatch.setattr(transcription, "split_voice", lambda data, max_ms: list(found))
+    return found
+
+
+def test_unrecognized_segments_leave_a_gap(segments):
+    segments.extend([b"hello", b"noise", b"world"])
+    assert transcribe() == f"hello {transcription.UNRECOGNIZED} world"
+
+
+def test_service_error_in_any_segment_raises(segments):
+    segments.extend([b"hello", b"down", b"world"])
+    with pytest.raises(sr.RequestError):
+        transcribe()
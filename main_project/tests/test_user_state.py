@@ -0,0 +1,38 @@
+import pytest
+
+from main.user_state import LANGUAGES, TONES, UserState, day_from_str
+
+
+def test_usage_mapping_writes_through():
+    state = UserState()
+    usage = state["usage"]
+    usage["used"] = 4
+    usage["unlimited_until"] = "2030-01-01"
+
+    assert state.used == 4
+    assert state.premium_until == day_from_str("2030-01-01")
+    assert state["usage"] == {"date": None, "used": 4, "unlimited_until": "2030-01-01"}
+    with pytest.raises(KeyError):
+        usage["other"] = 1
+
+
+def test_unknown_enum_values_are_rejected():
+    tones, languages = list(TONES), list(LANGUAGES)
+    state = UserState()
+    with pytest.raises(ValueError):
+        state.tone = "sarcastic"
+    with pytest.raises(ValueError):
+        state["language"] = "xx"
+    assert state.tone == "friendly"
+    assert (TONES, LANGUAGES) == (tones, languages)
+
+
+def test_unknown_enum_values_in_records_fall_back_to_defaults():
+    record = UserState().to_record()
+    record[0], record[1] = "sarcastic", "xx"
+    state = UserState.from_record(record)
+    assert (state.tone, state.language) == ("friendly", "en")
+
+    state = UserState.from_record({"tone": "formal", "language": "xx"})
+    assert (state.tone, state.language) == ("formal", "en")
+    assert (TONES, LANGUAGES) == (["friendly", "professional", "casual", "formal"], ["en", "fr", "es", "de", "pt", "ar"])